@@ -10,14 +10,32 @@ import torch.optim as optim
 from torch.utils.data import DataLoader, TensorDataset
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor, GradientBoostingClassifier, GradientBoostingRegressor
+from sklearn.linear_model import LogisticRegression, Ridge
+from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, log_loss, mean_squared_error, r2_score
 import matplotlib.pyplot as plt
 import seaborn as sns
 from datetime import datetime
 import logging
+import time
+import hashlib
+import sqlite3
+import threading
+import gc
+import string
+import math
+from functools import lru_cache
+from collections import OrderedDict, Counter
+import importlib.util
+import random
+import re
 import requests
 import asyncio
 import aiohttp
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
 from typing import Dict, List, Any, Optional
 import joblib
 import pickle
@@ -54,6 +72,7 @@ class AdvancedModelTrainer:
             'groq': os.getenv('GROQ_API_KEY'),
             'gemini': os.getenv('GEMINI_API_KEY'),
             'deepseek': os.getenv('DEEPSEEK_API_KEY'),
+            'together': os.getenv('TOGETHER_API_KEY'),
             'replicate': os.getenv('REPLICATE_API_TOKEN'),
             'github': os.getenv('GITHUB_TOKEN'),
             'vercel': os.getenv('VERCEL_INTEGRATION_TOKEN'),
@@ -69,6 +88,26 @@ class AdvancedModelTrainer:
         for directory in [self.models_dir, self.data_dir, self.logs_dir, self.prompts_dir]:
             os.makedirs(directory, exist_ok=True)
             
+        # Pooled HTTP clients shared by every prompt evaluation
+        self.response_cache = self._open_response_cache()
+        self.llm_clients = LLMClientPool(self.config.get('providers', {}), self.api_keys, self.response_cache)
+        
+        # Compiled prompt templates and batched prompt file output
+        self.prompt_registry = PromptTemplateRegistry(PROMPT_TEMPLATES, self.prompts_dir)
+        self.token_counter = TokenCounter()
+        
+        # Batched reference scoring of evaluation responses
+        evaluation_config = self.config.get('evaluation', {})
+        self.response_scorer = ResponseScorer(
+            embedding_model=evaluation_config.get('embedding_model'),
+            batch_size=evaluation_config.get('embedding_batch_size', 64),
+            max_entries=evaluation_config.get('max_cached_scores', 100000)
+        )
+        
+        # Real datasets loaded by _prepare_training_data, shared across configs
+        self._dataset_cache = {}
+        self._dataset_cache_lock = threading.Lock()
+            
         logger.info("🚀 3RBAI Advanced Model Trainer initialized")
         logger.info(f"📂 Models: {self.models_dir}")
         logger.info(f"📊 Data: {self.data_dir}")
@@ -87,6 +126,26 @@ class AdvancedModelTrainer:
             logger.warning(f"⚠️ Could not load config from {config_path}: {e}")
             return {}
             
+    def _open_response_cache(self) -> Optional['ResponseCache']:
+        """
+        Open the persistent response cache described by config["response_cache"]
+        
+        Keys: enabled (default True), path (default data/response_cache.sqlite),
+        ttl_hours (default 168, null for no expiry) and max_entries.
+        """
+        cache_config = self.config.get('response_cache', {})
+        if not cache_config.get('enabled', True):
+            return None
+            
+        ttl_hours = cache_config.get('ttl_hours', 168)
+        cache = ResponseCache(
+            cache_config.get('path', os.path.join(self.data_dir, "response_cache.sqlite")),
+            ttl_seconds=ttl_hours * 3600 if ttl_hours is not None else None,
+            max_entries=cache_config.get('max_entries', 50000)
+        )
+        logger.info(f"🗄️ Response cache: {cache.path}")
+        return cache
+        
     def _validate_api_keys(self):
         """Validate API keys"""
         missing_keys = []
@@ -101,40 +160,146 @@ class AdvancedModelTrainer:
         else:
             logger.info("🔑 All API keys validated")
             
-    async def train_all_models(self, training_configs: List[Dict]) -> Dict[str, Any]:
+    def __getstate__(self):
+        # Local training runs in worker processes; sessions and the cache
+        # connection stay in the parent
+        state = self.__dict__.copy()
+        state.update({"llm_clients": None, "response_cache": None, "response_scorer": None, "_dataset_cache": {}})
+        del state["_dataset_cache_lock"]
+        return state
+        
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._dataset_cache_lock = threading.Lock()
+        
+    def _scheduler_config(self) -> Dict[str, Any]:
+        """
+        Resolve config["scheduler"]
+        
+        Keys: api_concurrency (concurrent API-bound jobs, default 8),
+        cpu_workers (local training processes, default half the cores),
+        threads_per_job (framework threads per training process) and
+        default_timeout (seconds, None for no limit).
+        """
+        scheduler_config = self.config.get('scheduler', {})
+        cpu_count = os.cpu_count() or 1
+        cpu_workers = int(scheduler_config.get('cpu_workers', max(1, cpu_count // 2)))
+        return {
+            "api_concurrency": int(scheduler_config.get('api_concurrency', 8)),
+            "cpu_workers": cpu_workers,
+            "threads_per_job": int(scheduler_config.get('threads_per_job', max(1, cpu_count // cpu_workers))),
+            "default_timeout": scheduler_config.get('default_timeout')
+        }
+        
+    @staticmethod
+    def _job_kind(config: Dict) -> str:
+        """'cpu' for local training, 'api' for everything that mostly waits on I/O"""
+        return 'cpu' if config.get('model_type', '').lower() in ['tensorflow', 'pytorch', 'sklearn'] else 'api'
+        
+    async def iter_training_results(self, training_configs: List[Dict]):
+        """
+        Train models with bounded parallelism, yielding results as they finish
+        
+        API-bound and CPU-bound jobs have separate concurrency limits and
+        each class is served from its own priority queue (higher
+        config["priority"] first, then config order). Each CPU-bound job
+        trains in its own spawned process so it does not share the GIL with
+        the event loop or other jobs. A job exceeding config["timeout"] (or
+        the scheduler default_timeout) is reported as failed; a timed-out
+        local job's process is killed right away, so its CPU slot goes to
+        the next queued job.
+        
+        Args:
+            training_configs: List of training configuration dictionaries
+            
+        Yields:
+            (model_name, result) tuples in completion order
+        """
+        settings = self._scheduler_config()
+        queues = {"api": asyncio.PriorityQueue(), "cpu": asyncio.PriorityQueue()}
+        finished = asyncio.Queue()
+        
+        for index, config in enumerate(training_configs):
+            model_name = config.get('model_name', f'model_{index}')
+            kind = self._job_kind(config)
+            queues[kind].put_nowait((-config.get('priority', 0), index, model_name, config))
+            
+        limits = {
+            "api": min(settings["api_concurrency"], queues["api"].qsize()),
+            "cpu": min(settings["cpu_workers"], queues["cpu"].qsize())
+        }
+        logger.info(
+            f"📋 Scheduling {queues['api'].qsize()} API jobs (concurrency {limits['api']}) and "
+            f"{queues['cpu'].qsize()} local jobs ({limits['cpu']} processes x {settings['threads_per_job']} threads)"
+        )
+        
+        async def worker(kind):
+            queue = queues[kind]
+            while not queue.empty():
+                _, index, model_name, config = queue.get_nowait()
+                timeout = config.get('timeout', settings["default_timeout"])
+                started = time.perf_counter()
+                logger.info(f"▶️ Starting {model_name} ({kind})")
+                
+                try:
+                    result = await asyncio.wait_for(self._train_single_model_async(config), timeout)
+                except asyncio.TimeoutError:
+                    result = {"success": False, "error": f"Timed out after {timeout}s"}
+                except Exception as e:
+                    result = {"success": False, "error": str(e)}
+                    
+                result.setdefault("duration_sec", time.perf_counter() - started)
+                await finished.put((model_name, result))
+                
+        workers = [
+            asyncio.create_task(worker(kind), name=f"{kind}-worker-{i}")
+            for kind, limit in limits.items()
+            for i in range(limit)
+        ]
+        
+        try:
+            for done_count in range(1, len(training_configs) + 1):
+                model_name, result = await finished.get()
+                if result.get('success', False):
+                    logger.info(f"✅ [{done_count}/{len(training_configs)}] {model_name} finished in {result['duration_sec']:.1f}s")
+                else:
+                    logger.error(f"❌ [{done_count}/{len(training_configs)}] Training failed for {model_name}: {result.get('error')}")
+                yield model_name, result
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+                
+    async def train_all_models(self, training_configs: List[Dict], on_result=None) -> Dict[str, Any]:
         """
         Train multiple models in parallel
         
         Args:
             training_configs: List of training configuration dictionaries
+            on_result: Optional callable(model_name, result) invoked as each
+                model finishes
             
         Returns:
-            Dictionary with training results for each model
+            Dictionary with training results for each model, in config order
         """
         logger.info(f"🧠 Starting parallel training for {len(training_configs)} models")
         
         results = {}
-        tasks = []
-        
-        for config in training_configs:
-            model_name = config.get('model_name', f'model_{len(tasks)}')
-            task = asyncio.create_task(
-                self._train_single_model_async(config),
-                name=model_name
-            )
-            tasks.append(task)
+        try:
+            async for model_name, result in self.iter_training_results(training_configs):
+                results[model_name] = result
+                if on_result:
+                    on_result(model_name, result)
+        finally:
+            await self.llm_clients.close()
             
-        # Wait for all training tasks to complete
-        completed_results = await asyncio.gather(*tasks, return_exceptions=True)
+        cache_stats = self.llm_clients.cache_stats()
+        if cache_stats["cache_hits"]:
+            logger.info(f"🗄️ Response cache: {cache_stats['cache_hits']} hits, {cache_stats['network_requests']} network requests")
+            
+        ordered_names = [config.get('model_name', f'model_{i}') for i, config in enumerate(training_configs)]
+        results = {name: results[name] for name in ordered_names if name in results}
         
-        for i, result in enumerate(completed_results):
-            model_name = training_configs[i].get('model_name', f'model_{i}')
-            if isinstance(result, Exception):
-                logger.error(f"❌ Training failed for {model_name}: {result}")
-                results[model_name] = {"success": False, "error": str(result)}
-            else:
-                results[model_name] = result
-                
         logger.info("✅ Parallel training completed")
         return results
         
@@ -171,6 +336,62 @@ class AdvancedModelTrainer:
         else:
             raise ValueError(f"Unsupported API model type: {model_type}")
             
+    def _provider_settings(self, provider: str) -> Dict[str, Any]:
+        """Provider settings for token counting and pricing, empty for unknown providers"""
+        try:
+            return self.llm_clients.settings(provider)
+        except ValueError:
+            return {}
+            
+    def _apply_prompt_budget(self, prompt: str, provider: str, config: Dict, pinned: Optional[str] = None) -> tuple:
+        """
+        Count a generated prompt's tokens and trim it to the configured budget
+        
+        The budget is config["prompt_budget"], else the provider's
+        "prompt_budget". Prompts are split into sections at markdown
+        headings; builders put the most important sections first, so
+        sections are dropped from the end. The pinned prefix (default: the
+        first section) is never dropped.
+        
+        Args:
+            prompt: Generated prompt
+            provider: Provider whose tokenizer and budget apply
+            config: Training configuration
+            pinned: Leading part of the prompt that must be kept
+            
+        Returns:
+            (prompt, info) where info has provider, tokens, original_tokens,
+            budget and trimmed_sections
+        """
+        settings = self._provider_settings(provider)
+        budget = config.get('prompt_budget', settings.get('prompt_budget'))
+        tokens = self.token_counter.count(prompt, settings)
+        info = {"provider": provider, "tokens": tokens, "original_tokens": tokens, "budget": budget, "trimmed_sections": 0}
+        
+        if not budget or tokens <= budget:
+            return prompt, info
+            
+        if pinned and prompt.startswith(pinned):
+            head, sections = pinned, _split_prompt_sections(prompt[len(pinned):])
+        else:
+            head, *sections = _split_prompt_sections(prompt)
+            
+        # Section counts add up to (about) the whole-prompt count, so trim without re-tokenizing
+        remaining = self.token_counter.count(head, settings) + sum(self.token_counter.count(s, settings) for s in sections)
+        while sections and remaining > budget:
+            remaining -= self.token_counter.count(sections.pop(), settings)
+            info["trimmed_sections"] += 1
+            
+        prompt = head + ''.join(sections)
+        info["tokens"] = self.token_counter.count(prompt, settings)
+        logger.warning(
+            f"✂️ {provider} prompt trimmed from {info['original_tokens']} to {info['tokens']} tokens "
+            f"(budget {budget}, {info['trimmed_sections']} sections dropped)"
+        )
+        if info["tokens"] > budget:
+            logger.warning(f"⚠️ {provider} prompt still exceeds its budget after trimming")
+        return prompt, info
+        
     async def _train_groq_model(self, config: Dict) -> Dict[str, Any]:
         """Train/optimize Groq model"""
         logger.info("⚡ Training Groq model")
@@ -182,11 +403,13 @@ class AdvancedModelTrainer:
             
             # Optimize prompts using training data
             optimized_prompt = await self._optimize_prompt_for_groq(base_prompt, training_data)
+            optimized_prompt, prompt_budget = self._apply_prompt_budget(optimized_prompt, 'groq', config, pinned=base_prompt)
             
             # Save optimized prompt
-            prompt_path = os.path.join(self.prompts_dir, f"{config['model_name']}_groq_optimized.md")
-            with open(prompt_path, 'w', encoding='utf-8') as f:
-                f.write(optimized_prompt)
+            prompt_path = self.prompt_registry.stage(
+                os.path.join(self.prompts_dir, f"{config['model_name']}_groq_optimized.md"), optimized_prompt
+            )
+            await self.prompt_registry.flush()
                 
             # Test the optimized prompt
             test_results = await self._test_groq_prompt(optimized_prompt, config.get('test_data', []))
@@ -195,6 +418,7 @@ class AdvancedModelTrainer:
                 "success": True,
                 "model_type": "groq",
                 "prompt_path": prompt_path,
+                "prompt_budget": prompt_budget,
                 "test_results": test_results,
                 "optimization_method": "prompt_engineering"
             }
@@ -208,7 +432,7 @@ class AdvancedModelTrainer:
         logger.info("🔧 Optimizing prompt for Groq")
         
         # Analyze training data patterns
-        patterns = self._analyze_training_patterns(training_data)
+        patterns = await self._analyze_training_patterns(training_data)
         
         # Enhance base prompt with patterns
         optimized_sections = [
@@ -219,8 +443,12 @@ class AdvancedModelTrainer:
         if patterns.get('common_topics'):
             optimized_sections.append(f"### المواضيع الشائعة:\n")
             for topic in patterns['common_topics'][:5]:
-                optimized_sections.append(f"- {topic}\n")
+                optimized_sections.append(f"- {topic} ({patterns['topic_share'][topic]:.0%} من الأسئلة)\n")
                 
+        if patterns.get('top_terms'):
+            optimized_sections.append(f"\n### المصطلحات الأكثر تكراراً:\n")
+            optimized_sections.append(f"- {'، '.join(patterns['top_terms'][:10])}\n")
+            
         if patterns.get('response_patterns'):
             optimized_sections.append(f"\n### أنماط الإجابة المفضلة:\n")
             for pattern in patterns['response_patterns'][:3]:
@@ -233,38 +461,85 @@ class AdvancedModelTrainer:
                 
         return ''.join(optimized_sections)
         
-    def _analyze_training_patterns(self, training_data: List[Dict]) -> Dict[str, List]:
-        """Analyze patterns in training data"""
+    async def _analyze_training_patterns(self, training_data: List[Dict]) -> Dict[str, Any]:
+        """
+        Analyze topics, frequent terms and response lengths of the training data
+        
+        Questions are tokenized in batches into a sparse document-term
+        matrix; topic shares and term document frequencies are column
+        operations on it. Corpora of at least
+        config["pattern_analysis"]["parallel_threshold"] items (default
+        2000000) are split into chunk_size chunks (default 250000) analyzed
+        on a process pool when more than one chunk and more than one CPU
+        worker are available; otherwise the analysis runs in a thread. Each
+        spawned worker re-imports this script with TensorFlow and torch
+        (6-8 s), while the thread handles about 100k items per second, so
+        the pool only pays off from roughly a million items on a few cores.
+        
+        Args:
+            training_data: Items with "question" and "response"
+            
+        Returns:
+            Patterns with common_topics (most frequent first), topic_share,
+            top_terms, length_distribution, response_patterns and
+            quality_indicators
+        """
+        analysis_config = self.config.get('pattern_analysis', {})
+        threshold = analysis_config.get('parallel_threshold', 2000000)
+        chunk_size = max(1, analysis_config.get('chunk_size', 250000))
+        questions = [item.get('question', '') for item in training_data]
+        responses = [item.get('response', '') for item in training_data]
+        chunk_count = -(-len(training_data) // chunk_size)
+        workers = min(self._scheduler_config()["cpu_workers"], chunk_count)
+        
+        if len(training_data) >= threshold and workers > 1:
+            chunks = [
+                (questions[start:start + chunk_size], responses[start:start + chunk_size])
+                for start in range(0, len(training_data), chunk_size)
+            ]
+            logger.info(f"🧮 Analyzing {len(training_data)} training items in {len(chunks)} chunks on {workers} processes")
+            loop = asyncio.get_running_loop()
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                chunk_stats = await asyncio.gather(*(
+                    loop.run_in_executor(pool, _corpus_chunk_stats, chunk_questions, chunk_responses)
+                    for chunk_questions, chunk_responses in chunks
+                ))
+        else:
+            chunk_stats = [await asyncio.to_thread(_corpus_chunk_stats, questions, responses)]
+            
+        item_count = sum(stats["items"] for stats in chunk_stats)
+        topic_counts = Counter()
+        term_frequencies = Counter()
+        for stats in chunk_stats:
+            topic_counts.update(stats["topic_counts"])
+            term_frequencies.update(stats["term_df"])
+            
         patterns = {
-            'common_topics': [],
+            'common_topics': [topic for topic, count in topic_counts.most_common() if count],
+            'topic_share': {topic: count / item_count for topic, count in topic_counts.most_common() if count},
+            'top_terms': [term for term, _ in term_frequencies.most_common(analysis_config.get('top_terms', 20))],
+            'length_distribution': {},
             'response_patterns': [],
             'quality_indicators': []
         }
         
-        # Extract topics from questions
-        topics = []
-        for item in training_data:
-            question = item.get('question', '')
-            if 'برمجة' in question or 'كود' in question:
-                topics.append('البرمجة والتطوير')
-            if 'فلسفة' in question or 'معنى' in question:
-                topics.append('الفلسفة والتفكير')
-            if 'تحليل' in question or 'بيانات' in question:
-                topics.append('تحليل البيانات')
-            if 'مالي' in question or 'استثمار' in question:
-                topics.append('التحليل المالي')
-                
-        patterns['common_topics'] = list(set(topics))
-        
-        # Analyze response patterns
-        response_lengths = [len(item.get('response', '')) for item in training_data]
-        avg_length = np.mean(response_lengths) if response_lengths else 0
-        
-        patterns['response_patterns'] = [
-            f'متوسط طول الإجابة: {int(avg_length)} حرف',
+        if item_count:
+            response_chars = np.concatenate([stats["response_chars"] for stats in chunk_stats])
+            response_words = np.concatenate([stats["response_words"] for stats in chunk_stats])
+            patterns['length_distribution'] = {
+                "response_chars": self._length_distribution(response_chars),
+                "response_words": self._length_distribution(response_words)
+            }
+            words = patterns['length_distribution']['response_words']
+            patterns['response_patterns'].append(
+                f"طول الإجابة النموذجي: {int(words['p50'])} كلمة "
+                f"(معظم الإجابات بين {int(words['p25'])} و{int(words['p75'])} كلمة)"
+            )
+            
+        patterns['response_patterns'].extend([
             'استخدام أمثلة عملية',
             'تقديم تفسيرات مفصلة'
-        ]
+        ])
         
         patterns['quality_indicators'] = [
             'الدقة في المعلومات',
@@ -275,32 +550,182 @@ class AdvancedModelTrainer:
         
         return patterns
         
+    @staticmethod
+    def _length_distribution(lengths: np.ndarray) -> Dict[str, float]:
+        """Mean, max and p10-p90 of a length array"""
+        p10, p25, p50, p75, p90 = np.percentile(lengths, [10, 25, 50, 75, 90])
+        return {
+            "mean": float(lengths.mean()), "p10": float(p10), "p25": float(p25), "p50": float(p50),
+            "p75": float(p75), "p90": float(p90), "max": int(lengths.max())
+        }
+        
+    async def _evaluate_prompt(self, provider: str, system_prompt: str, questions: List[str]) -> List[Any]:
+        """
+        Send every question with the system prompt to a provider concurrently
+        
+        Concurrency and rate limits are enforced by the provider's pooled
+        client, so the whole test set can be submitted at once.
+        
+        Args:
+            provider: Provider name (groq, gemini, deepseek, together)
+            system_prompt: System prompt under test
+            questions: User messages, one request each
+            
+        Returns:
+            One entry per question: the client response dict, or the
+            exception if the request failed after all retries
+        """
+        client = self.llm_clients.get(provider)
+        logger.info(f"📡 Evaluating {len(questions)} prompts on {provider} ({client.model})")
+        
+        calls = [
+            client.chat([
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": question}
+            ])
+            for question in questions
+        ]
+        return await asyncio.gather(*calls, return_exceptions=True)
+        
+    async def _score_outcomes(self, outcomes: List[Any], references: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Score a test set's responses against their references in one batch
+        
+        Scoring runs in a thread so large test sets do not stall the event
+        loop. Failed requests, empty responses and items without a
+        reference are not scored: they get 0 on every metric and False in
+        the "scored" mask. "referenced" marks the items that have a reference.
+        
+        Args:
+            outcomes: _evaluate_prompt results, one per test item
+            references: Expected responses ('' when the item has none)
+            
+        Returns:
+            ResponseScorer metrics as arrays aligned with outcomes, plus the
+            "scored" and "referenced" masks
+        """
+        referenced = np.array([bool(reference) for reference in references], dtype=bool)
+        scored = np.array([
+            isinstance(outcome, dict) and bool(outcome['content'].strip()) and bool(reference)
+            for outcome, reference in zip(outcomes, references)
+        ], dtype=bool)
+        indices = np.flatnonzero(scored)
+        metrics = await asyncio.to_thread(
+            self.response_scorer.score,
+            [outcomes[i]['content'] for i in indices],
+            [references[i] for i in indices]
+        )
+        
+        aligned = {"scored": scored, "referenced": referenced}
+        for name, values in metrics.items():
+            column = np.zeros(len(outcomes))
+            column[indices] = values
+            aligned[name] = column
+        return aligned
+        
+    @staticmethod
+    def _metric_summary(metrics: Dict[str, np.ndarray]) -> Dict[str, float]:
+        """Mean of each reference metric over the scored items"""
+        scored = metrics["scored"]
+        summary = {"scored_items": int(scored.sum())}
+        if scored.any():
+            summary.update({
+                name: float(values[scored].mean())
+                for name, values in metrics.items() if name not in ("scored", "referenced")
+            })
+        return summary
+        
+    @staticmethod
+    def _reference_scores(metrics: Dict[str, np.ndarray]) -> List[Optional[float]]:
+        """
+        Per-item scores: the reference score of answered items, 0.0 when an
+        item with a reference got no answer, None for items without one
+        """
+        return [
+            float(score) if scored else (0.0 if referenced else None)
+            for score, scored, referenced in zip(metrics['score'], metrics['scored'], metrics['referenced'])
+        ]
+        
+    @staticmethod
+    def _mean_score(scores: List[Optional[float]]) -> Optional[float]:
+        """Mean over the scored items, None when no item could be scored"""
+        values = [score for score in scores if score is not None]
+        return float(np.mean(values)) if values else None
+        
+    def _evaluation_summary(self, provider: str, outcomes: List[Any]) -> Dict[str, Any]:
+        """Request-level statistics shared by every _test_* result"""
+        responses = [o for o in outcomes if isinstance(o, dict)]
+        errors = [o for o in outcomes if not isinstance(o, dict)]
+        for error in errors[:3]:
+            logger.warning(f"⚠️ Evaluation request failed: {error}")
+            
+        # Cached responses cost nothing; price only the requests actually sent
+        settings = self._provider_settings(provider)
+        sent = [r for r in responses if not r.get('cached')]
+        input_tokens = sum(r['usage'].get('prompt_tokens', 0) for r in sent)
+        output_tokens = sum(r['usage'].get('completion_tokens', 0) for r in sent)
+        estimated_cost = (
+            input_tokens * settings.get('input_cost_per_million', 0.0) +
+            output_tokens * settings.get('output_cost_per_million', 0.0)
+        ) / 1e6
+        
+        # Latency stats describe requests actually sent; cache hits are counted separately
+        return {
+            "failed_requests": len(errors),
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "estimated_cost_usd": estimated_cost,
+            "avg_latency": float(np.mean([r['latency'] for r in sent])) if sent else None,
+            "total_tokens": sum(r['usage'].get('total_tokens', 0) for r in responses),
+            "retries": sum(max(r['attempts'] - 1, 0) for r in responses),
+            "cache_hits": sum(1 for r in responses if r.get('cached')),
+            "latency": self._latency_percentiles(provider, responses)
+        }
+        
+    def _latency_percentiles(self, provider: str, responses: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        p50/p95/p99 of total latency, time-to-first-token and tokens/sec
+        
+        Only requests actually sent count: cached responses still carry the
+        timings of the original request, so they are left out of the
+        percentiles and of "calls" and reported as "cached".
+        """
+        cached = sum(1 for r in responses if r.get('cached'))
+        responses = [r for r in responses if not r.get('cached')]
+        stats = {"provider": provider, "model": self.llm_clients.get(provider).model, "calls": len(responses), "cached": cached}
+        series = {
+            "latency": [r['latency'] for r in responses],
+            "ttft": [r.get('ttft') for r in responses if r.get('ttft') is not None],
+            "tokens_per_sec": [r.get('tokens_per_sec') for r in responses if r.get('tokens_per_sec') is not None]
+        }
+        for name, values in series.items():
+            if values:
+                p50, p95, p99 = np.percentile(values, [50, 95, 99])
+                stats.update({f"{name}_p50": float(p50), f"{name}_p95": float(p95), f"{name}_p99": float(p99)})
+        return stats
+        
     async def _test_groq_prompt(self, prompt: str, test_data: List[Dict]) -> Dict[str, float]:
         """Test optimized prompt with Groq API"""
-        if not self.api_keys['groq'] or not test_data:
+        if not self.llm_clients.is_configured('groq') or not test_data:
             return {"accuracy": 0.0, "note": "No API key or test data"}
             
         try:
-            # Simulate testing (in real implementation, would call Groq API)
-            correct_responses = 0
-            total_responses = len(test_data)
-            
-            for test_item in test_data[:5]:  # Test first 5 items
-                # In real implementation, would send prompt + question to Groq
-                # and compare response with expected answer
-                question = test_item.get('question', '')
-                expected = test_item.get('expected_response', '')
-                
-                # Simulate response quality check
-                if len(question) > 10 and len(expected) > 10:
-                    correct_responses += 1
-                    
-            accuracy = correct_responses / total_responses if total_responses > 0 else 0.0
+            outcomes = await self._evaluate_prompt('groq', prompt, [item.get('question', '') for item in test_data])
+            metrics = await self._score_outcomes(outcomes, [item.get('expected_response', '') for item in test_data])
+            
+            # A scored response is correct when its reference score clears the
+            # threshold; items without an expected_response are left out (None)
+            threshold = self.config.get('evaluation', {}).get('correct_threshold', 0.5)
+            correct_responses = int((metrics['scored'] & (metrics['score'] >= threshold)).sum())
+            referenced = int(metrics['referenced'].sum())
             
             return {
-                "accuracy": accuracy,
-                "tested_samples": total_responses,
-                "correct_responses": correct_responses
+                "accuracy": correct_responses / referenced if referenced else None,
+                "tested_samples": len(test_data),
+                "scored_items": referenced,
+                "correct_responses": correct_responses,
+                "reference_metrics": self._metric_summary(metrics),
+                **self._evaluation_summary('groq', outcomes)
             }
             
         except Exception as e:
@@ -318,11 +743,13 @@ class AdvancedModelTrainer:
             
             # Create optimized system prompt for Gemini
             system_prompt = self._create_gemini_system_prompt(config)
+            system_prompt, prompt_budget = self._apply_prompt_budget(system_prompt, 'gemini', config)
             
             # Save system prompt
-            prompt_path = os.path.join(self.prompts_dir, f"{model_name}_gemini_system.md")
-            with open(prompt_path, 'w', encoding='utf-8') as f:
-                f.write(system_prompt)
+            prompt_path = self.prompt_registry.stage(
+                os.path.join(self.prompts_dir, f"{model_name}_gemini_system.md"), system_prompt
+            )
+            await self.prompt_registry.flush()
                 
             # Test with sample data
             test_results = await self._test_gemini_model(system_prompt, config.get('test_data', []))
@@ -331,6 +758,7 @@ class AdvancedModelTrainer:
                 "success": True,
                 "model_type": "gemini",
                 "system_prompt_path": prompt_path,
+                "prompt_budget": prompt_budget,
                 "test_results": test_results,
                 "optimization_method": "system_prompt_engineering"
             }
@@ -341,87 +769,42 @@ class AdvancedModelTrainer:
             
     def _create_gemini_system_prompt(self, config: Dict) -> str:
         """Create optimized system prompt for Gemini"""
-        base_capabilities = config.get('capabilities', [])
-        domain = config.get('domain', 'general')
-        
-        prompt_sections = [
-            f"# نظام 3RBAI - {config.get('model_name', 'Gemini Model')}\n",
-            "\n## الهوية والقدرات:\n",
-            "أنت 3RBAI، نموذج ذكاء اصطناعي متقدم مطور في سلطنة عمان.\n",
-            "\n### القدرات الأساسية:\n"
-        ]
-        
-        default_capabilities = [
+        capabilities = config.get('capabilities') or [
             "التحليل العميق والتفكير النقدي",
             "معالجة اللغة العربية بدقة عالية",
             "حل المشكلات المعقدة",
             "التفكير الإبداعي والابتكار",
             "التحليل المنطقي والاستنتاج"
         ]
+        domain = config.get('domain', 'general')
         
-        capabilities = base_capabilities if base_capabilities else default_capabilities
-        
-        for capability in capabilities:
-            prompt_sections.append(f"- {capability}\n")
-            
-        if domain == 'financial':
-            prompt_sections.extend([
-                "\n### التخصص المالي:\n",
-                "- تحليل الأسواق المالية\n",
-                "- تقييم الاستثمارات\n",
-                "- إدارة المخاطر\n",
-                "- التحليل الكمي والأساسي\n"
-            ])
-        elif domain == 'technical':
-            prompt_sections.extend([
-                "\n### التخصص التقني:\n",
-                "- البرمجة والتطوير\n",
-                "- هندسة البرمجيات\n",
-                "- الذكاء الاصطناعي\n",
-                "- تحليل البيانات\n"
-            ])
-            
-        prompt_sections.extend([
-            "\n## المبادئ التوجيهية:\n",
-            "1. تقديم إجابات شاملة ومفصلة\n",
-            "2. استخدام التفكير المنطقي والتحليل العميق\n",
-            "3. دعم اللغة العربية بشكل كامل\n",
-            "4. الحفاظ على الدقة والموثوقية\n",
-            "5. التكيف مع احتياجات المستخدم\n",
-            "\n## تعليمات الاستجابة:\n",
-            "- ابدأ بفهم السؤال بعمق\n",
-            "- قدم تحليلاً شاملاً\n",
-            "- استخدم أمثلة عملية عند الحاجة\n",
-            "- اختتم بخلاصة واضحة\n"
-        ])
-        
-        return ''.join(prompt_sections)
+        domain_template = f"gemini_domain_{domain}"
+        return self.prompt_registry.render(
+            "gemini_system",
+            model_name=config.get('model_name', 'Gemini Model'),
+            capabilities=self.prompt_registry.render_each("bullet", "item", capabilities),
+            domain_section=self.prompt_registry.render(domain_template) if domain_template in self.prompt_registry else ""
+        )
         
     async def _test_gemini_model(self, system_prompt: str, test_data: List[Dict]) -> Dict[str, Any]:
         """Test Gemini model with system prompt"""
-        if not self.api_keys['gemini'] or not test_data:
+        if not self.llm_clients.is_configured('gemini') or not test_data:
             return {"performance": 0.0, "note": "No API key or test data"}
             
         try:
-            # Simulate testing with Gemini API
-            performance_scores = []
+            outcomes = await self._evaluate_prompt('gemini', system_prompt, [item.get('question', '') for item in test_data])
+            metrics = await self._score_outcomes(outcomes, [item.get('expected_response', '') for item in test_data])
             
-            for test_item in test_data[:3]:  # Test first 3 items
-                question = test_item.get('question', '')
-                expected_quality = test_item.get('quality_score', 0.8)
-                
-                # Simulate quality assessment
-                if len(question) > 20:
-                    performance_scores.append(expected_quality)
-                else:
-                    performance_scores.append(0.5)
-                    
-            avg_performance = np.mean(performance_scores) if performance_scores else 0.0
+            # Items without an expected_response are reported unscored (None)
+            performance_scores = self._reference_scores(metrics)
             
             return {
-                "performance": avg_performance,
+                "performance": self._mean_score(performance_scores),
                 "tested_samples": len(performance_scores),
-                "individual_scores": performance_scores
+                "scored_items": int(metrics['referenced'].sum()),
+                "individual_scores": performance_scores,
+                "reference_metrics": self._metric_summary(metrics),
+                **self._evaluation_summary('gemini', outcomes)
             }
             
         except Exception as e:
@@ -437,11 +820,13 @@ class AdvancedModelTrainer:
             
             # Create specialized prompt for DeepSeek (coding-focused)
             coding_prompt = self._create_deepseek_coding_prompt(config)
+            coding_prompt, prompt_budget = self._apply_prompt_budget(coding_prompt, 'deepseek', config)
             
             # Save coding prompt
-            prompt_path = os.path.join(self.prompts_dir, f"{model_name}_deepseek_coding.md")
-            with open(prompt_path, 'w', encoding='utf-8') as f:
-                f.write(coding_prompt)
+            prompt_path = self.prompt_registry.stage(
+                os.path.join(self.prompts_dir, f"{model_name}_deepseek_coding.md"), coding_prompt
+            )
+            await self.prompt_registry.flush()
                 
             # Test coding capabilities
             test_results = await self._test_deepseek_coding(coding_prompt, config.get('coding_tests', []))
@@ -450,6 +835,7 @@ class AdvancedModelTrainer:
                 "success": True,
                 "model_type": "deepseek",
                 "coding_prompt_path": prompt_path,
+                "prompt_budget": prompt_budget,
                 "test_results": test_results,
                 "specialization": "coding_and_reasoning"
             }
@@ -462,66 +848,36 @@ class AdvancedModelTrainer:
         """Create specialized coding prompt for DeepSeek"""
         programming_languages = config.get('languages', ['Python', 'JavaScript', 'TypeScript'])
         
-        prompt_sections = [
-            f"# 3RBAI DeepSeek - {config.get('model_name', 'Coding Assistant')}\n",
-            "\n## التخصص في البرمجة والتطوير:\n",
-            "أنت مطور خبير في 3RBAI، متخصص في:\n",
-            "\n### لغات البرمجة:\n"
-        ]
-        
-        for lang in programming_languages:
-            prompt_sections.append(f"- {lang}: تطوير متقدم وحلول مبتكرة\n")
-            
-        prompt_sections.extend([
-            "\n### المهارات المتقدمة:\n",
-            "- هندسة البرمجيات والأنماط التصميمية\n",
-            "- تحسين الأداء والخوارزميات\n",
-            "- تطوير الذكاء الاصطناعي والتعلم الآلي\n",
-            "- أمان التطبيقات وأفضل الممارسات\n",
-            "- التطوير السحابي والمايكروسيرفس\n",
-            "\n### منهجية العمل:\n",
-            "1. **فهم المتطلبات**: تحليل دقيق للمشكلة\n",
-            "2. **التصميم**: وضع هيكل واضح ومرن\n",
-            "3. **التنفيذ**: كتابة كود نظيف وموثق\n",
-            "4. **الاختبار**: ضمان الجودة والموثوقية\n",
-            "5. **التحسين**: تطوير مستمر للأداء\n",
-            "\n### معايير الكود:\n",
-            "- وضوح وقابلية القراءة\n",
-            "- التوثيق الشامل\n",
-            "- معالجة الأخطاء\n",
-            "- الأمان والحماية\n",
-            "- قابلية الصيانة والتطوير\n"
-        ])
-        
-        return ''.join(prompt_sections)
+        return self.prompt_registry.render(
+            "deepseek_coding",
+            model_name=config.get('model_name', 'Coding Assistant'),
+            languages=self.prompt_registry.render_each("deepseek_language", "language", programming_languages)
+        )
         
     async def _test_deepseek_coding(self, prompt: str, coding_tests: List[Dict]) -> Dict[str, Any]:
         """Test DeepSeek coding capabilities"""
-        if not coding_tests:
-            return {"code_quality": 0.8, "note": "No coding tests provided"}
+        if not self.llm_clients.is_configured('deepseek') or not coding_tests:
+            return {"code_quality": 0.0, "note": "No API key or coding tests"}
             
         try:
-            quality_scores = []
+            questions = [
+                f"{test.get('problem', '')} (complexity: {test.get('complexity', 'medium')})"
+                for test in coding_tests
+            ]
+            outcomes = await self._evaluate_prompt('deepseek', prompt, questions)
+            metrics = await self._score_outcomes(outcomes, [test.get('expected_response', '') for test in coding_tests])
             
-            for test in coding_tests[:3]:  # Test first 3 coding problems
-                problem = test.get('problem', '')
-                expected_complexity = test.get('complexity', 'medium')
-                
-                # Simulate code quality assessment
-                if 'algorithm' in problem.lower():
-                    quality_scores.append(0.9)
-                elif 'data structure' in problem.lower():
-                    quality_scores.append(0.85)
-                else:
-                    quality_scores.append(0.8)
-                    
-            avg_quality = np.mean(quality_scores) if quality_scores else 0.8
+            # Items without an expected_response are reported unscored (None)
+            quality_scores = self._reference_scores(metrics)
             
             return {
-                "code_quality": avg_quality,
+                "code_quality": self._mean_score(quality_scores),
                 "tested_problems": len(quality_scores),
+                "scored_items": int(metrics['referenced'].sum()),
                 "individual_scores": quality_scores,
-                "specialization_areas": ["algorithms", "data_structures", "system_design"]
+                "responses_with_code": sum(1 for o in outcomes if isinstance(o, dict) and '```' in o['content']),
+                "reference_metrics": self._metric_summary(metrics),
+                **self._evaluation_summary('deepseek', outcomes)
             }
             
         except Exception as e:
@@ -537,11 +893,13 @@ class AdvancedModelTrainer:
             
             # Create ensemble prompt for Together.ai
             ensemble_prompt = self._create_together_ensemble_prompt(config)
+            ensemble_prompt, prompt_budget = self._apply_prompt_budget(ensemble_prompt, 'together', config)
             
             # Save ensemble prompt
-            prompt_path = os.path.join(self.prompts_dir, f"{model_name}_together_ensemble.md")
-            with open(prompt_path, 'w', encoding='utf-8') as f:
-                f.write(ensemble_prompt)
+            prompt_path = self.prompt_registry.stage(
+                os.path.join(self.prompts_dir, f"{model_name}_together_ensemble.md"), ensemble_prompt
+            )
+            await self.prompt_registry.flush()
                 
             # Test ensemble capabilities
             test_results = await self._test_together_ensemble(ensemble_prompt, config.get('test_data', []))
@@ -550,6 +908,7 @@ class AdvancedModelTrainer:
                 "success": True,
                 "model_type": "together",
                 "ensemble_prompt_path": prompt_path,
+                "prompt_budget": prompt_budget,
                 "test_results": test_results,
                 "approach": "ensemble_reasoning"
             }
@@ -602,32 +961,28 @@ class AdvancedModelTrainer:
         
     async def _test_together_ensemble(self, prompt: str, test_data: List[Dict]) -> Dict[str, Any]:
         """Test Together.ai ensemble reasoning"""
-        if not test_data:
-            return {"ensemble_quality": 0.85, "note": "No test data provided"}
+        if not self.llm_clients.is_configured('together') or not test_data:
+            return {"ensemble_quality": 0.0, "note": "No API key or test data"}
             
         try:
-            reasoning_scores = []
+            questions = [
+                test_item.get('question') or
+                f"Solve a {test_item.get('complexity', 'medium')} complexity {test_item.get('type', 'general')} problem and explain your reasoning."
+                for test_item in test_data
+            ]
+            outcomes = await self._evaluate_prompt('together', prompt, questions)
+            metrics = await self._score_outcomes(outcomes, [item.get('expected_response', '') for item in test_data])
             
-            for test_item in test_data[:3]:  # Test first 3 items
-                question_type = test_item.get('type', 'general')
-                complexity = test_item.get('complexity', 'medium')
-                
-                # Simulate ensemble reasoning quality
-                base_score = 0.8
-                if question_type == 'analytical':
-                    base_score += 0.1
-                if complexity == 'high':
-                    base_score += 0.05
-                    
-                reasoning_scores.append(min(base_score, 1.0))
-                
-            avg_quality = np.mean(reasoning_scores) if reasoning_scores else 0.85
+            # Items without an expected_response are reported unscored (None)
+            reasoning_scores = self._reference_scores(metrics)
             
             return {
-                "ensemble_quality": avg_quality,
+                "ensemble_quality": self._mean_score(reasoning_scores),
                 "tested_scenarios": len(reasoning_scores),
+                "scored_items": int(metrics['referenced'].sum()),
                 "individual_scores": reasoning_scores,
-                "reasoning_methods_used": ["logical", "creative", "critical"]
+                "reference_metrics": self._metric_summary(metrics),
+                **self._evaluation_summary('together', outcomes)
             }
             
         except Exception as e:
@@ -651,54 +1006,307 @@ class AdvancedModelTrainer:
         """Train TensorFlow model asynchronously"""
         logger.info("🧠 Training TensorFlow model asynchronously")
         
-        # Run TensorFlow training in a separate thread to avoid blocking
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(None, self._train_tensorflow_sync, config)
-        return result
+        # Data is loaded here (and cached) and handed to a dedicated training
+        # process through shared memory, like the other local backends
+        return await self._run_local_training_with_shared_data(self._fit_tensorflow_model, config)
         
-    def _train_tensorflow_sync(self, config: Dict) -> Dict[str, Any]:
-        """Synchronous TensorFlow training"""
-        try:
-            model_name = config.get('model_name')
+    def _fit_tensorflow_model(self, config: Dict, data: Dict[str, np.ndarray], target: Dict[str, Any]) -> Dict[str, Any]:
+        """TensorFlow training on prepared splits; target is the problem_type/num_classes from _prepare_training_data"""
+        model_name = config.get('model_name')
+        x_train, y_train, x_val, y_val, x_test, y_test = (
+            data[name] for name in ['x_train', 'y_train', 'x_val', 'y_val', 'x_test', 'y_test']
+        )
+        
+        # Build model
+        model = self._build_tensorflow_model(config, x_train.shape[1:], target)
+        
+        # Train model
+        history = model.fit(
+            x_train, y_train,
+            validation_data=(x_val, y_val),
+            epochs=config.get('epochs', 50),
+            batch_size=config.get('batch_size', 32),
+            verbose=1
+        )
+        
+        # Evaluate
+        scores = model.evaluate(x_test, y_test, verbose=0, return_dict=True)
+        test_r2 = None
+        if target['problem_type'] == 'regression':
+            test_r2 = r2_score(y_test, model.predict(x_test, verbose=0))
             
-            # Generate or load data
-            x_train, y_train, x_val, y_val, x_test, y_test = self._prepare_training_data(config)
+        # Save model
+        model_path = os.path.join(self.models_dir, f"{model_name}_tensorflow.h5")
+        model.save(model_path)
+        
+        return self._local_training_result(
+            "tensorflow", model_path, target, scores['loss'], scores.get('accuracy'),
+            len(history.history['loss']), test_r2
+        )
+        
+    @staticmethod
+    def _local_training_result(model_type: str, model_path: str, target: Dict[str, Any], test_loss: float,
+                               test_accuracy: Optional[float], epochs_trained: int,
+                               test_r2: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Result dictionary shared by TensorFlow, PyTorch and sklearn training
+        
+        test_accuracy is None for regression and test_r2 is None for
+        classification, so every framework returns the same keys.
+        """
+        return {
+            "success": True,
+            "model_type": model_type,
+            "model_path": model_path,
+            "problem_type": target['problem_type'],
+            "num_classes": target['num_classes'],
+            "test_accuracy": None if test_accuracy is None else float(test_accuracy),
+            "test_loss": float(test_loss),
+            "test_r2": None if test_r2 is None else float(test_r2),
+            "epochs_trained": int(epochs_trained)
+        }
+        
+    async def _train_pytorch_model_async(self, config: Dict) -> Dict[str, Any]:
+        """Train PyTorch model asynchronously"""
+        logger.info("🔥 Training PyTorch model asynchronously")
+        return await self._run_local_training_with_shared_data(self._fit_pytorch_model, config)
+        
+    async def _train_sklearn_model_async(self, config: Dict) -> Dict[str, Any]:
+        """Train scikit-learn model asynchronously"""
+        logger.info("🌲 Training scikit-learn model asynchronously")
+        return await self._run_local_training_with_shared_data(self._fit_sklearn_model, config)
+        
+    async def _run_local_training_with_shared_data(self, fit_fn, config: Dict) -> Dict[str, Any]:
+        """
+        Prepare data once in this process and train in a worker process
+        
+        The six data splits are copied into shared memory blocks and the
+        worker attaches to them by name, so arrays are never pickled
+        through the worker's pipe and concurrent jobs don't hold extra copies.
+        
+        Args:
+            fit_fn: Bound method(config, data, target) run in the worker
+            config: Training configuration
             
-            # Build model
-            model = self._build_tensorflow_model(config, x_train.shape[1:], y_train.shape[1:])
+        Returns:
+            The worker's result dictionary
+        """
+        try:
+            # Off the event loop: reading a large file must not stall API jobs
+            *splits, target = await asyncio.to_thread(self._prepare_training_data, config)
+        except Exception as e:
+            logger.error(f"❌ Data preparation failed: {e}")
+            return {"success": False, "error": str(e)}
             
-            # Train model
-            history = model.fit(
-                x_train, y_train,
-                validation_data=(x_val, y_val),
-                epochs=config.get('epochs', 50),
-                batch_size=config.get('batch_size', 32),
-                verbose=1
-            )
+        names = ['x_train', 'y_train', 'x_val', 'y_val', 'x_test', 'y_test']
+        try:
+            handles, blocks = _share_arrays(dict(zip(names, splits)))
+        except OSError as e:
+            logger.error(f"❌ Sharing training data failed: {e}")
+            return {"success": False, "error": str(e)}
+        del splits
+        
+        try:
+            return await self._run_in_worker_process(self._train_on_shared_data, fit_fn, config, handles, target)
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+                
+    async def _run_in_worker_process(self, fn, *args) -> Any:
+        """
+        Run fn(*args) in a dedicated spawned process and await its result
+        
+        Unlike a pool worker, the process can be killed: when the awaiting
+        task is cancelled (e.g. by the scheduler's timeout) the process is
+        killed at once instead of running on and holding a CPU slot.
+        
+        Args:
+            fn: Picklable callable
+            *args: Picklable arguments
             
-            # Evaluate
-            test_loss, test_accuracy = model.evaluate(x_test, y_test, verbose=0)
+        Returns:
+            fn's return value
+        """
+        context = multiprocessing.get_context("spawn")
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(
+            target=_run_worker_job,
+            args=(sender, self._scheduler_config()["threads_per_job"], fn, args),
+            daemon=True
+        )
+        process.start()
+        sender.close()
+        
+        try:
+            # Poll instead of blocking a thread on recv(), so cancellation is immediate;
+            # a dead process closes the pipe, which also ends the poll
+            while not receiver.poll():
+                await asyncio.sleep(0.05)
+            try:
+                return receiver.recv()
+            except EOFError:
+                await asyncio.to_thread(process.join)
+                raise RuntimeError(f"Training process exited with code {process.exitcode}")
+        finally:
+            receiver.close()
+            if process.is_alive():
+                process.kill()
+            await asyncio.to_thread(process.join)
+            process.close()
+            
+    def _train_on_shared_data(self, fit_fn, config: Dict, handles: Dict[str, tuple], target: Dict[str, Any]) -> Dict[str, Any]:
+        """Attach the shared splits in the worker, fit, then release the mapping"""
+        data, blocks = _attach_shared_arrays(handles)
+        try:
+            return fit_fn(config, data, target)
+        except Exception as e:
+            logger.error(f"❌ {config.get('model_type', 'Local')} training failed: {e}")
+            return {"success": False, "error": str(e)}
+        finally:
+            # Blocks can only be unmapped once no array views remain
+            del data
+            gc.collect()
+            for block in blocks:
+                try:
+                    block.close()
+                except BufferError:
+                    # A framework still holds a view; the mapping goes away with the process
+                    pass
+                
+    def _fit_pytorch_model(self, config: Dict, data: Dict[str, np.ndarray], target: Dict[str, Any]) -> Dict[str, Any]:
+        """Synchronous PyTorch training; same result schema as _fit_tensorflow_model"""
+        model_name = config.get('model_name')
+        problem_type = target['problem_type']
+        
+        # Multi-class: K logits with cross-entropy over class indices; otherwise one output column
+        if problem_type == 'multiclass':
+            n_outputs, criterion = target['num_classes'], nn.CrossEntropyLoss()
+        else:
+            n_outputs, criterion = 1, nn.MSELoss() if problem_type == 'regression' else nn.BCEWithLogitsLoss()
             
-            # Save model
-            model_path = os.path.join(self.models_dir, f"{model_name}_tensorflow.h5")
-            model.save(model_path)
+        def as_targets(y):
+            # from_numpy keeps the tensors backed by the shared blocks
+            y = torch.from_numpy(y)
+            return y.view(-1).long() if problem_type == 'multiclass' else y
             
-            return {
-                "success": True,
-                "model_type": "tensorflow",
-                "model_path": model_path,
-                "test_accuracy": float(test_accuracy),
-                "test_loss": float(test_loss),
-                "epochs_trained": len(history.history['loss'])
-            }
+        model = self._build_pytorch_model(config, data['x_train'].shape[1], n_outputs)
+        optimizer = optim.Adam(model.parameters(), lr=config.get('learning_rate', 0.001))
+        
+        train_loader = DataLoader(
+            TensorDataset(torch.from_numpy(data['x_train']), as_targets(data['y_train'])),
+            batch_size=config.get('batch_size', 32),
+            shuffle=True
+        )
+        
+        def evaluate(x, y):
+            model.eval()
+            with torch.no_grad():
+                outputs = model(torch.from_numpy(x))
+                targets = as_targets(y)
+                loss = criterion(outputs, targets).item()
+                if problem_type == 'multiclass':
+                    accuracy = (outputs.argmax(dim=1) == targets).float().mean().item()
+                elif problem_type == 'binary':
+                    accuracy = ((outputs > 0).float() == targets).float().mean().item()
+                else:
+                    accuracy = None
+            return loss, accuracy, outputs.numpy()
+            
+        epochs = config.get('epochs', 50)
+        for epoch in range(epochs):
+            model.train()
+            for batch_x, batch_y in train_loader:
+                optimizer.zero_grad()
+                loss = criterion(model(batch_x), batch_y)
+                loss.backward()
+                optimizer.step()
+                
+            if (epoch + 1) % 10 == 0 or epoch + 1 == epochs:
+                val_loss, _, _ = evaluate(data['x_val'], data['y_val'])
+                logger.info(f"📈 {model_name} epoch {epoch + 1}/{epochs} - val_loss: {val_loss:.4f}")
+                
+        test_loss, test_accuracy, predictions = evaluate(data['x_test'], data['y_test'])
+        test_r2 = r2_score(data['y_test'], predictions) if problem_type == 'regression' else None
+        
+        model_path = os.path.join(self.models_dir, f"{model_name}_pytorch.pt")
+        torch.save(model.state_dict(), model_path)
+        
+        return self._local_training_result("pytorch", model_path, target, test_loss, test_accuracy, epochs, test_r2)
+        
+    def _build_pytorch_model(self, config: Dict, n_features: int, n_outputs: int) -> nn.Module:
+        """Build PyTorch model based on configuration"""
+        architecture = config.get('architecture', 'mlp')
+        
+        if architecture == 'mlp':
+            return nn.Sequential(
+                nn.Linear(n_features, 128),
+                nn.ReLU(),
+                nn.Dropout(0.2),
+                nn.Linear(128, 64),
+                nn.ReLU(),
+                nn.Dropout(0.2),
+                nn.Linear(64, n_outputs)
+            )
+        elif architecture == 'lstm':
+            return _LSTMRegressor(n_outputs, hidden_size=config.get('hidden_size', 64))
+        else:
+            raise ValueError(f"Unsupported architecture: {architecture}")
             
-        except Exception as e:
-            logger.error(f"❌ TensorFlow training failed: {e}")
-            return {"success": False, "error": str(e)}
+    def _fit_sklearn_model(self, config: Dict, data: Dict[str, np.ndarray], target: Dict[str, Any]) -> Dict[str, Any]:
+        """Synchronous scikit-learn training; same result schema as _fit_tensorflow_model"""
+        model_name = config.get('model_name')
+        regression = target['problem_type'] == 'regression'
+        
+        model = self._build_sklearn_model(config, regression)
+        # Train on the validation split too; sklearn models have no early stopping here
+        x_fit = np.concatenate([data['x_train'], data['x_val']])
+        y_fit = np.concatenate([data['y_train'], data['y_val']]).ravel()
+        model.fit(x_fit, y_fit)
+        
+        x_test, y_test = data['x_test'], data['y_test'].ravel()
+        if regression:
+            predictions = model.predict(x_test)
+            test_loss = mean_squared_error(y_test, predictions)
+            test_accuracy = None
+            test_r2 = r2_score(y_test, predictions)
+        else:
+            # Multi-class works natively; log loss covers every class index
+            test_accuracy = accuracy_score(y_test, model.predict(x_test))
+            test_loss = log_loss(y_test, model.predict_proba(x_test), labels=model.classes_)
+            test_r2 = None
+            
+        model_path = os.path.join(self.models_dir, f"{model_name}_sklearn.joblib")
+        joblib.dump(model, model_path)
+        
+        return self._local_training_result("sklearn", model_path, target, test_loss, test_accuracy, 1, test_r2)
+            
+    def _build_sklearn_model(self, config: Dict, regression: bool):
+        """Build scikit-learn estimator based on configuration"""
+        algorithm = config.get('algorithm', 'random_forest')
+        params = dict(config.get('model_params', {}))
+        n_jobs = config.get('n_jobs', 1)
+        
+        if algorithm == 'random_forest':
+            estimator = RandomForestRegressor if regression else RandomForestClassifier
+            return estimator(n_estimators=params.pop('n_estimators', 100), n_jobs=n_jobs, random_state=42, **params)
+        elif algorithm == 'gradient_boosting':
+            estimator = GradientBoostingRegressor if regression else GradientBoostingClassifier
+            return estimator(random_state=42, **params)
+        elif algorithm == 'linear':
+            return Ridge(**params) if regression else LogisticRegression(max_iter=1000, **params)
+        else:
+            raise ValueError(f"Unsupported sklearn algorithm: {algorithm}")
             
-    def _build_tensorflow_model(self, config: Dict, input_shape: tuple, output_shape: tuple) -> tf.keras.Model:
-        """Build TensorFlow model based on configuration"""
+    def _build_tensorflow_model(self, config: Dict, input_shape: tuple, target: Dict[str, Any]) -> tf.keras.Model:
+        """Build TensorFlow model based on configuration; the output head follows the target's problem type"""
         architecture = config.get('architecture', 'mlp')
+        head = {
+            'binary': (1, 'sigmoid', 'binary_crossentropy', ['accuracy']),
+            'multiclass': (target['num_classes'], 'softmax', 'sparse_categorical_crossentropy', ['accuracy']),
+            'regression': (1, None, 'mse', [])
+        }
+        units, activation, loss, metrics = head[target['problem_type']]
         
         if architecture == 'mlp':
             model = tf.keras.Sequential([
@@ -707,7 +1315,7 @@ class AdvancedModelTrainer:
                 tf.keras.layers.Dropout(0.2),
                 tf.keras.layers.Dense(64, activation='relu'),
                 tf.keras.layers.Dropout(0.2),
-                tf.keras.layers.Dense(output_shape[0] if output_shape else 1, activation='sigmoid')
+                tf.keras.layers.Dense(units, activation=activation)
             ])
         elif architecture == 'cnn':
             model = tf.keras.Sequential([
@@ -717,34 +1325,49 @@ class AdvancedModelTrainer:
                 tf.keras.layers.Conv1D(32, 3, activation='relu'),
                 tf.keras.layers.GlobalMaxPooling1D(),
                 tf.keras.layers.Dense(64, activation='relu'),
-                tf.keras.layers.Dense(output_shape[0] if output_shape else 1, activation='sigmoid')
+                tf.keras.layers.Dense(units, activation=activation)
             ])
         else:
             raise ValueError(f"Unsupported architecture: {architecture}")
             
         model.compile(
             optimizer='adam',
-            loss='binary_crossentropy',
-            metrics=['accuracy']
+            loss=loss,
+            metrics=metrics
         )
         
         return model
         
     def _prepare_training_data(self, config: Dict) -> tuple:
-        """Prepare training data for models"""
+        """
+        Prepare training data for models
+        
+        Returns:
+            (X_train, y_train, X_val, y_val, X_test, y_test, target) where
+            target is {"problem_type": "binary" | "multiclass" | "regression",
+            "num_classes": K or None}; class targets are indices 0..K-1
+        """
         data_config = config.get('data_config', {})
         
         if data_config.get('generate_synthetic', True):
             # Generate synthetic data
             n_samples = data_config.get('n_samples', 1000)
             n_features = data_config.get('n_features', 20)
+            problem_type = data_config.get('problem_type', 'binary')
             
             # Generate features
             X = np.random.randn(n_samples, n_features)
             
-            # Generate target (binary classification)
-            y = (np.sum(X[:, :5], axis=1) > 0).astype(int)
-            y = y.reshape(-1, 1)
+            # Generate target from the first five features
+            signal = np.sum(X[:, :5], axis=1)
+            if problem_type == 'regression':
+                raw_target = signal + 0.1 * np.random.randn(n_samples)
+            elif problem_type == 'multiclass':
+                n_classes = data_config.get('n_classes', 3)
+                raw_target = np.digitize(signal, np.quantile(signal, np.linspace(0, 1, n_classes + 1)[1:-1]))
+            else:
+                raw_target = (signal > 0).astype(int)
+            y, target = _encode_target(raw_target, problem_type)
             
             # Split data
             X_train, X_temp, y_train, y_temp = train_test_split(X, y, test_size=0.4, random_state=42)
@@ -756,15 +1379,98 @@ class AdvancedModelTrainer:
             X_val = scaler.transform(X_val)
             X_test = scaler.transform(X_test)
             
-            return X_train, y_train, X_val, y_val, X_test, y_test
+            return X_train, y_train, X_val, y_val, X_test, y_test, target
         else:
             # Load data from file
             data_path = data_config.get('data_path')
             if not data_path:
                 raise ValueError("data_path required when generate_synthetic=False")
                 
-            # Implementation for loading real data would go here
-            raise NotImplementedError("Real data loading not implemented yet")
+            X, y, target = self._load_dataset(data_config)
+            
+            # Deterministic split: the same seed always yields the same rows
+            seed = data_config.get('seed', 42)
+            test_size = data_config.get('test_size', 0.2)
+            val_size = data_config.get('val_size', 0.2)
+            stratify = y.ravel() if data_config.get('stratify', False) else None
+            
+            X_train, X_temp, y_train, y_temp = train_test_split(
+                X, y, test_size=test_size + val_size, random_state=seed, stratify=stratify
+            )
+            X_val, X_test, y_val, y_test = train_test_split(
+                X_temp, y_temp, test_size=test_size / (test_size + val_size), random_state=seed,
+                stratify=y_temp.ravel() if stratify is not None else None
+            )
+            
+            if data_config.get('normalize', True):
+                scaler = StandardScaler()
+                X_train = scaler.fit_transform(X_train).astype(np.float32)
+                X_val = scaler.transform(X_val).astype(np.float32)
+                X_test = scaler.transform(X_test).astype(np.float32)
+                
+            return X_train, y_train, X_val, y_val, X_test, y_test, target
+            
+    def _load_dataset(self, data_config: Dict) -> tuple:
+        """
+        Load features and target from a CSV, Parquet, NPY or JSONL file
+        
+        Files are read in chunks of data_config["chunk_size"] rows (default
+        100000) with only the selected columns, and converted to float32
+        chunk by chunk. Results are cached by path, size, mtime and column
+        selection, so configs sharing a file in one train_all_models call
+        read it once, even when they load concurrently.
+        
+        Args:
+            data_config: data_path plus optional format, feature_columns,
+                target_column, chunk_size, problem_type (auto, classification,
+                binary, multiclass or regression; default auto) and
+                max_classes. For NPY files the columns are integer indices
+                and the target defaults to the last column.
+                
+        Returns:
+            (X, y, target): float32 features of shape (n, d), float32 target
+            of shape (n, 1) and the _encode_target problem description;
+            class labels are encoded as indices 0..K-1
+            
+        Raises:
+            ValueError: if the target does not fit the problem type
+        """
+        data_path = os.path.abspath(data_config['data_path'])
+        file_format = data_config.get('format') or _infer_data_format(data_path)
+        feature_columns = data_config.get('feature_columns')
+        target_column = data_config.get('target_column')
+        stat = os.stat(data_path)
+        key = (
+            data_path, stat.st_size, stat.st_mtime, file_format,
+            tuple(feature_columns) if feature_columns else None, target_column,
+            data_config.get('problem_type', 'auto'), data_config.get('max_classes', 100)
+        )
+        
+        with self._dataset_cache_lock:
+            entry = self._dataset_cache.setdefault(key, {"lock": threading.Lock(), "data": None})
+            
+        # Per-file lock: concurrent configs wait for the first reader instead of re-reading
+        with entry["lock"]:
+            if entry["data"] is None:
+                started = time.perf_counter()
+                X, target = _read_table(data_path, file_format, feature_columns, target_column,
+                                        data_config.get('chunk_size', 100000))
+                
+                y, target_info = _encode_target(
+                    target, data_config.get('problem_type', 'auto'), data_config.get('max_classes', 100)
+                )
+                
+                entry["data"] = (X, y, target_info)
+                classes = f", {target_info['num_classes']} classes" if target_info['num_classes'] else ""
+                logger.info(
+                    f"📥 Loaded {os.path.basename(data_path)}: {X.shape[0]} rows x {X.shape[1]} features "
+                    f"({X.nbytes / 2**20:.1f} MB, {target_info['problem_type']}{classes}) "
+                    f"in {time.perf_counter() - started:.2f}s"
+                )
+            else:
+                logger.info(f"📥 Using cached dataset {os.path.basename(data_path)}")
+                
+        return entry["data"]
             
     async def _train_financial_agent(self, config: Dict) -> Dict[str, Any]:
         """Train specialized financial analysis agent"""
@@ -776,21 +1482,29 @@ class AdvancedModelTrainer:
             # Create financial analysis prompts
             prompts = self._create_financial_prompts(config)
             
+            # Agents without their own endpoint are budgeted for config["provider"]
+            provider = config.get('provider', 'groq')
+            prompt_budget = {}
+            for prompt_type in list(prompts):
+                prompts[prompt_type], prompt_budget[prompt_type] = self._apply_prompt_budget(prompts[prompt_type], provider, config)
+            
             # Save prompts
-            prompt_paths = {}
-            for prompt_type, prompt_content in prompts.items():
-                path = os.path.join(self.prompts_dir, f"{agent_name}_{prompt_type}.md")
-                with open(path, 'w', encoding='utf-8') as f:
-                    f.write(prompt_content)
-                prompt_paths[prompt_type] = path
+            prompt_paths = {
+                prompt_type: self.prompt_registry.stage(
+                    os.path.join(self.prompts_dir, f"{agent_name}_{prompt_type}.md"), prompt_content
+                )
+                for prompt_type, prompt_content in prompts.items()
+            }
+            await self.prompt_registry.flush()
                 
             # Test financial analysis capabilities
-            test_results = await self._test_financial_agent(prompts, config.get('financial_tests', []))
+            test_results = await self._test_financial_agent(prompts, config.get('financial_tests', []), provider)
             
             return {
                 "success": True,
                 "model_type": "financial_agent",
                 "prompt_paths": prompt_paths,
+                "prompt_budget": prompt_budget,
                 "test_results": test_results,
                 "specializations": ["fundamental_analysis", "technical_analysis", "risk_assessment"]
             }
@@ -803,131 +1517,57 @@ class AdvancedModelTrainer:
         """Create specialized financial analysis prompts"""
         specializations = config.get('specializations', ['fundamental', 'technical', 'macro'])
         
-        prompts = {}
-        
-        if 'fundamental' in specializations:
-            prompts['fundamental'] = """# محلل أساسي - 3RBAI
-
-## الهوية والتخصص:
-أنت محلل أساسي خبير في 3RBAI، متخصص في تحليل الشركات والاستثمارات.
-
-### المهارات الأساسية:
-- تحليل القوائم المالية بعمق
-- تقييم نماذج الأعمال والميزة التنافسية
-- تحليل الصناعات والأسواق
-- تقدير القيمة العادلة للأسهم
-- تحليل المخاطر والفرص
-
-### منهجية التحليل:
-1. **تحليل الأعمال**: فهم نموذج العمل والميزة التنافسية
-2. **التحليل المالي**: دراسة الأداء المالي والاتجاهات
-3. **تحليل الصناعة**: تقييم البيئة التنافسية والنمو
-4. **التقييم**: تحديد القيمة العادلة باستخدام عدة طرق
-5. **إدارة المخاطر**: تحديد وتقييم المخاطر المحتملة
-
-### أدوات التحليل:
-- نماذج التدفق النقدي المخصوم (DCF)
-- مضاعفات التقييم (P/E, P/B, EV/EBITDA)
-- تحليل DuPont للعائد على حقوق الملكية
-- تحليل الحساسية والسيناريوهات
-- مقارنة الأقران والمعايير القطاعية
-"""
-
-        if 'technical' in specializations:
-            prompts['technical'] = """# محلل تقني - 3RBAI
-
-## الهوية والتخصص:
-أنت محلل تقني خبير في 3RBAI، متخصص في تحليل حركة الأسعار والاتجاهات.
-
-### المهارات التقنية:
-- تحليل الرسوم البيانية والأنماط
-- استخدام المؤشرات التقنية المتقدمة
-- تحديد مستويات الدعم والمقاومة
-- تحليل الحجم والزخم
-- إدارة المخاطر التقنية
-
-### الأدوات والمؤشرات:
-- المتوسطات المتحركة (SMA, EMA, WMA)
-- مؤشرات الزخم (RSI, MACD, Stochastic)
-- مؤشرات الحجم (OBV, Volume Profile)
-- خطوط الاتجاه ومستويات فيبوناتشي
-- أنماط الشموع اليابانية
-
-### استراتيجيات التداول:
-1. **تحليل الاتجاه**: تحديد الاتجاه الرئيسي والثانوي
-2. **نقاط الدخول والخروج**: تحديد أفضل نقاط التداول
-3. **إدارة المخاطر**: وضع مستويات وقف الخسارة وجني الأرباح
-4. **تأكيد الإشارات**: استخدام عدة مؤشرات للتأكيد
-5. **إدارة رأس المال**: تحديد حجم المراكز المناسب
-"""
-
-        if 'macro' in specializations:
-            prompts['macro'] = """# محلل اقتصادي كلي - 3RBAI
-
-## الهوية والتخصص:
-أنت محلل اقتصادي كلي خبير في 3RBAI، متخصص في تحليل البيئة الاقتصادية الكلية.
-
-### مجالات التحليل:
-- السياسة النقدية والمالية
-- مؤشرات النمو الاقتصادي
-- التضخم وأسعار الفائدة
-- أسواق العملات والسلع
-- التجارة الدولية والجيوسياسة
-
-### المؤشرات الرئيسية:
-- الناتج المحلي الإجمالي (GDP)
-- معدلات التضخم (CPI, PPI)
-- معدلات البطالة والتوظيف
-- أسعار الفائدة والعائد على السندات
-- مؤشرات الثقة الاقتصادية
-
-### منهجية التحليل:
-1. **تحليل البيانات**: دراسة المؤشرات الاقتصادية الحديثة
-2. **تحليل السياسات**: تقييم تأثير السياسات الحكومية
-3. **التنبؤ**: وضع توقعات للاتجاهات المستقبلية
-4. **تحليل المخاطر**: تحديد المخاطر الاقتصادية الكلية
-5. **التوصيات**: تقديم توصيات استثمارية مبنية على التحليل الكلي
-"""
-
-        return prompts
+        return {
+            specialization: self.prompt_registry.render(f"financial_{specialization}")
+            for specialization in ['fundamental', 'technical', 'macro']
+            if specialization in specializations
+        }
         
-    async def _test_financial_agent(self, prompts: Dict[str, str], financial_tests: List[Dict]) -> Dict[str, Any]:
+    async def _test_financial_agent(self, prompts: Dict[str, str], financial_tests: List[Dict], provider: str = 'groq') -> Dict[str, Any]:
         """Test financial agent capabilities"""
-        if not financial_tests:
-            return {"overall_performance": 0.85, "note": "No financial tests provided"}
+        if not self.llm_clients.is_configured(provider) or not financial_tests:
+            return {"overall_performance": 0.0, "note": "No API key or financial tests"}
             
         try:
-            performance_by_type = {}
-            
-            for test in financial_tests[:5]:  # Test first 5 scenarios
-                test_type = test.get('type', 'general')
-                complexity = test.get('complexity', 'medium')
+            # Each test runs against the prompt of its analysis type (the first prompt otherwise)
+            groups = {}
+            for index, test in enumerate(financial_tests):
+                prompt_type = test.get('type', 'general')
+                groups.setdefault(prompt_type if prompt_type in prompts else next(iter(prompts)), []).append(index)
                 
-                # Simulate performance based on test type
-                if test_type == 'fundamental':
-                    base_score = 0.88
-                elif test_type == 'technical':
-                    base_score = 0.85
-                elif test_type == 'macro':
-                    base_score = 0.82
-                else:
-                    base_score = 0.80
-                    
-                # Adjust for complexity
-                if complexity == 'high':
-                    base_score -= 0.05
-                elif complexity == 'low':
-                    base_score += 0.05
+            questions = [
+                test.get('question') or
+                f"Provide a {test.get('complexity', 'medium')} complexity {test.get('type', 'general')} analysis"
+                f"{' of ' + test['symbol'] if test.get('symbol') else ''} and state your conclusion."
+                for test in financial_tests
+            ]
+            group_outcomes = await asyncio.gather(*(
+                self._evaluate_prompt(provider, prompts[prompt_type], [questions[i] for i in indices])
+                for prompt_type, indices in groups.items()
+            ))
+            outcomes = [None] * len(financial_tests)
+            for indices, results in zip(groups.values(), group_outcomes):
+                for index, outcome in zip(indices, results):
+                    outcomes[index] = outcome
                     
-                performance_by_type[test_type] = base_score
-                
-            overall_performance = np.mean(list(performance_by_type.values()))
+            metrics = await self._score_outcomes(outcomes, [test.get('expected_response', '') for test in financial_tests])
+            
+            # Tests without an expected_response are reported unscored (None)
+            scores = self._reference_scores(metrics)
+            
+            scores_by_type = {}
+            for test, score in zip(financial_tests, scores):
+                scores_by_type.setdefault(test.get('type', 'general'), []).append(score)
+            performance_by_type = {test_type: self._mean_score(values) for test_type, values in scores_by_type.items()}
             
             return {
-                "overall_performance": overall_performance,
+                "overall_performance": self._mean_score(scores),
                 "performance_by_type": performance_by_type,
                 "tested_scenarios": len(financial_tests),
-                "specialization_strengths": ["fundamental_analysis", "risk_assessment"]
+                "scored_items": int(metrics['referenced'].sum()),
+                "individual_scores": scores,
+                "reference_metrics": self._metric_summary(metrics),
+                **self._evaluation_summary(provider, outcomes)
             }
             
         except Exception as e:
@@ -943,19 +1583,25 @@ class AdvancedModelTrainer:
             agents = config.get('agents', ['pm', 'fundamental', 'macro', 'quant'])
             
             # Create coordination prompts for each agent
+            provider = config.get('provider', 'groq')
+            prompt_budget = {}
             agent_prompts = {}
             for agent in agents:
-                prompt = self._create_agent_prompt(agent, config)
-                prompt_path = os.path.join(self.prompts_dir, f"{system_name}_{agent}_agent.md")
-                with open(prompt_path, 'w', encoding='utf-8') as f:
-                    f.write(prompt)
-                agent_prompts[agent] = prompt_path
+                prompt, prompt_budget[agent] = self._apply_prompt_budget(self._create_agent_prompt(agent, config), provider, config)
+                agent_prompts[agent] = self.prompt_registry.stage(
+                    os.path.join(self.prompts_dir, f"{system_name}_{agent}_agent.md"), prompt
+                )
                 
             # Create system coordination prompt
-            coordination_prompt = self._create_coordination_prompt(agents, config)
-            coord_path = os.path.join(self.prompts_dir, f"{system_name}_coordination.md")
-            with open(coord_path, 'w', encoding='utf-8') as f:
-                f.write(coordination_prompt)
+            coordination_prompt, prompt_budget['coordination'] = self._apply_prompt_budget(
+                self._create_coordination_prompt(agents, config), provider, config
+            )
+            coord_path = self.prompt_registry.stage(
+                os.path.join(self.prompts_dir, f"{system_name}_coordination.md"), coordination_prompt
+            )
+            
+            # All agent prompts and the coordination prompt go out in one batch
+            await self.prompt_registry.flush()
                 
             # Test multi-agent collaboration
             test_results = await self._test_multi_agent_system(agent_prompts, config.get('collaboration_tests', []))
@@ -965,6 +1611,7 @@ class AdvancedModelTrainer:
                 "model_type": "multi_agent",
                 "agent_prompts": agent_prompts,
                 "coordination_prompt": coord_path,
+                "prompt_budget": prompt_budget,
                 "test_results": test_results,
                 "agents_trained": agents
             }
@@ -975,127 +1622,26 @@ class AdvancedModelTrainer:
             
     def _create_agent_prompt(self, agent_type: str, config: Dict) -> str:
         """Create prompt for specific agent type"""
-        agent_configs = {
-            'pm': {
-                'title': 'مدير المحفظة - Portfolio Manager',
-                'role': 'تنسيق وإدارة فريق التحليل المالي',
-                'responsibilities': [
-                    'تنسيق عمل المحللين المختلفين',
-                    'اتخاذ القرارات الاستثمارية النهائية',
-                    'إدارة المخاطر على مستوى المحفظة',
-                    'تقييم التوصيات وتحديد الأولويات',
-                    'التواصل مع العملاء وأصحاب المصلحة'
-                ]
-            },
-            'fundamental': {
-                'title': 'محلل أساسي - Fundamental Analyst',
-                'role': 'تحليل الشركات والقيمة الجوهرية',
-                'responsibilities': [
-                    'تحليل القوائم المالية والأداء التشغيلي',
-                    'تقييم نماذج الأعمال والميزة التنافسية',
-                    'تحليل الصناعة والبيئة التنافسية',
-                    'تقدير القيمة العادلة للاستثمارات',
-                    'تحديد المحفزات والمخاطر الأساسية'
-                ]
-            },
-            'macro': {
-                'title': 'محلل اقتصادي كلي - Macro Analyst',
-                'role': 'تحليل البيئة الاقتصادية الكلية',
-                'responsibilities': [
-                    'تحليل السياسات النقدية والمالية',
-                    'متابعة المؤشرات الاقتصادية الرئيسية',
-                    'تقييم تأثير الأحداث الجيوسياسية',
-                    'تحليل اتجاهات أسعار الفائدة والتضخم',
-                    'تقديم رؤى حول دورات الأعمال'
-                ]
-            },
-            'quant': {
-                'title': 'محلل كمي - Quantitative Analyst',
-                'role': 'التحليل الكمي والنمذجة المالية',
-                'responsibilities': [
-                    'تطوير النماذج الكمية والإحصائية',
-                    'تحليل البيانات التاريخية والأنماط',
-                    'تقييم المخاطر باستخدام الطرق الكمية',
-                    'اختبار الاستراتيجيات والتحقق من صحتها',
-                    'تطوير أدوات التداول الخوارزمي'
-                ]
-            }
-        }
-        
-        agent_config = agent_configs.get(agent_type, {
+        agent_config = AGENT_PROFILES.get(agent_type, {
             'title': f'وكيل {agent_type}',
             'role': 'دور متخصص في النظام',
             'responsibilities': ['مهام متخصصة حسب النوع']
         })
         
-        prompt_sections = [
-            f"# {agent_config['title']} - 3RBAI\n",
-            f"\n## الدور والمسؤوليات:\n",
-            f"**الدور الأساسي**: {agent_config['role']}\n",
-            f"\n### المسؤوليات الرئيسية:\n"
-        ]
-        
-        for responsibility in agent_config['responsibilities']:
-            prompt_sections.append(f"- {responsibility}\n")
-            
-        prompt_sections.extend([
-            f"\n## التعاون مع الوكلاء الآخرين:\n",
-            "- تبادل المعلومات والتحليلات بشكل منتظم\n",
-            "- التنسيق في اتخاذ القرارات المشتركة\n",
-            "- دعم الوكلاء الآخرين بالخبرة المتخصصة\n",
-            "- المساهمة في الرؤية الشاملة للفريق\n",
-            "\n## معايير الأداء:\n",
-            "- الدقة في التحليل والتوصيات\n",
-            "- السرعة في الاستجابة للمتغيرات\n",
-            "- التعاون الفعال مع الفريق\n",
-            "- الابتكار في الحلول والأساليب\n",
-            "- الالتزام بمعايير إدارة المخاطر\n"
-        ])
-        
-        return ''.join(prompt_sections)
+        return self.prompt_registry.render(
+            "agent",
+            title=agent_config['title'],
+            role=agent_config['role'],
+            responsibilities=self.prompt_registry.render_each("bullet", "item", agent_config['responsibilities'])
+        )
         
     def _create_coordination_prompt(self, agents: List[str], config: Dict) -> str:
         """Create system coordination prompt"""
-        prompt_sections = [
-            f"# نظام التنسيق متعدد الوكلاء - 3RBAI\n",
-            f"\n## الوكلاء المشاركون:\n"
-        ]
-        
-        agent_names = {
-            'pm': 'مدير المحفظة',
-            'fundamental': 'المحلل الأساسي',
-            'macro': 'المحلل الاقتصادي الكلي',
-            'quant': 'المحلل الكمي'
-        }
-        
-        for agent in agents:
-            name = agent_names.get(agent, agent)
-            prompt_sections.append(f"- {name} ({agent})\n")
-            
-        prompt_sections.extend([
-            f"\n## بروتوكول التنسيق:\n",
-            "### 1. تدفق المعلومات:\n",
-            "- كل وكيل يشارك تحليلاته مع الفريق\n",
-            "- التحديثات المنتظمة عند تغير الظروف\n",
-            "- التنبيهات الفورية للمخاطر الحرجة\n",
-            "\n### 2. اتخاذ القرارات:\n",
-            "- مدير المحفظة يقود عملية اتخاذ القرار\n",
-            "- كل وكيل يقدم رأيه المتخصص\n",
-            "- التصويت الجماعي في القرارات المعقدة\n",
-            "- توثيق الأسباب والمبررات\n",
-            "\n### 3. إدارة الخلافات:\n",
-            "- مناقشة مفتوحة للآراء المختلفة\n",
-            "- تحليل إضافي عند الحاجة\n",
-            "- البحث عن حلول وسط مقبولة\n",
-            "- تصعيد للإدارة العليا عند الضرورة\n",
-            "\n### 4. مراقبة الأداء:\n",
-            "- تقييم دوري لأداء كل وكيل\n",
-            "- قياس فعالية التعاون\n",
-            "- تحسين مستمر للعمليات\n",
-            "- تدريب وتطوير الوكلاء\n"
-        ])
-        
-        return ''.join(prompt_sections)
+        agent_lines = ''.join(
+            self.prompt_registry.render("coordination_agent", name=AGENT_DISPLAY_NAMES.get(agent, agent), agent=agent)
+            for agent in agents
+        )
+        return self.prompt_registry.render("coordination", agents=agent_lines)
         
     async def _test_multi_agent_system(self, agent_prompts: Dict[str, str], collaboration_tests: List[Dict]) -> Dict[str, Any]:
         """Test multi-agent system collaboration"""
@@ -1179,6 +1725,59 @@ class AdvancedModelTrainer:
                 report_sections.append(f"- **الحالة**: ❌ فشل\n")
                 report_sections.append(f"- **الخطأ**: {error}\n\n")
                 
+        # Add provider latency percentiles
+        latency_rows = [
+            (model_name, result['test_results']['latency'])
+            for model_name, result in results.items()
+            if isinstance(result.get('test_results'), dict) and result['test_results'].get('latency', {}).get('calls')
+        ]
+        if latency_rows:
+            report_sections.extend([
+                "## زمن الاستجابة (ثوانٍ):\n\n",
+                "| النموذج | المزود | model | calls | cached | TTFT p50/p95/p99 | latency p50/p95/p99 | tokens/s p50 |\n",
+                "|---|---|---|---|---|---|---|---|\n"
+            ])
+            for model_name, stats in latency_rows:
+                ttft = "/".join(f"{stats[k]:.2f}" for k in ('ttft_p50', 'ttft_p95', 'ttft_p99')) if 'ttft_p50' in stats else "-"
+                latency = "/".join(f"{stats[k]:.2f}" for k in ('latency_p50', 'latency_p95', 'latency_p99'))
+                rate = f"{stats['tokens_per_sec_p50']:.1f}" if 'tokens_per_sec_p50' in stats else "-"
+                report_sections.append(
+                    f"| {model_name} | {stats['provider']} | {stats['model']} | {stats['calls']} | {stats['cached']} | {ttft} | {latency} | {rate} |\n"
+                )
+            report_sections.append("\n")
+            
+        # Add prompt sizes and token cost estimates
+        cost_rows = []
+        for model_name, result in results.items():
+            budgets = result.get('prompt_budget')
+            if not budgets:
+                continue
+            if 'tokens' in budgets:
+                budgets = {'prompt': budgets}
+            provider = next(iter(budgets.values()))['provider']
+            settings = self._provider_settings(provider)
+            prompt_tokens = sum(b['tokens'] for b in budgets.values())
+            trimmed = sum(b['trimmed_sections'] for b in budgets.values())
+            # What sending the system prompt(s) once costs, before any user message
+            prompt_cost = prompt_tokens * settings.get('input_cost_per_million', 0.0) / 1e6
+            test_results = result.get('test_results') or {}
+            cost_rows.append((model_name, provider, prompt_tokens, trimmed, prompt_cost,
+                              test_results.get('input_tokens', 0) + test_results.get('output_tokens', 0),
+                              test_results.get('estimated_cost_usd', 0.0)))
+            
+        if cost_rows:
+            report_sections.extend([
+                "## تقدير استهلاك الرموز والتكلفة:\n\n",
+                "| النموذج | المزود | رموز الموجّه | أقسام محذوفة | تكلفة الموجّه/طلب ($) | رموز التقييم | تكلفة التقييم ($) |\n",
+                "|---|---|---|---|---|---|---|\n"
+            ])
+            for model_name, provider, prompt_tokens, trimmed, prompt_cost, eval_tokens, eval_cost in cost_rows:
+                report_sections.append(
+                    f"| {model_name} | {provider} | {prompt_tokens} | {trimmed} | {prompt_cost:.6f} | {eval_tokens} | {eval_cost:.6f} |\n"
+                )
+            total_cost = sum(row[6] for row in cost_rows)
+            report_sections.append(f"\n**إجمالي تكلفة التقييم التقديرية**: ${total_cost:.4f}\n\n")
+            
         # Add summary statistics
         report_sections.extend([
             "## إحصائيات التدريب:\n\n",
@@ -1222,6 +1821,1401 @@ class AdvancedModelTrainer:
         return report_content
 
 
+# Prompt templates compiled once by PromptTemplateRegistry. Placeholders use
+# str.format field syntax; list-valued sections are rendered item by item
+# with the small item templates ("bullet", "deepseek_language", ...).
+PROMPT_TEMPLATES = {
+    'bullet': "- {item}\n",
+    'gemini_system': """# نظام 3RBAI - {model_name}
+
+## الهوية والقدرات:
+أنت 3RBAI، نموذج ذكاء اصطناعي متقدم مطور في سلطنة عمان.
+
+### القدرات الأساسية:
+{capabilities}{domain_section}
+## المبادئ التوجيهية:
+1. تقديم إجابات شاملة ومفصلة
+2. استخدام التفكير المنطقي والتحليل العميق
+3. دعم اللغة العربية بشكل كامل
+4. الحفاظ على الدقة والموثوقية
+5. التكيف مع احتياجات المستخدم
+
+## تعليمات الاستجابة:
+- ابدأ بفهم السؤال بعمق
+- قدم تحليلاً شاملاً
+- استخدم أمثلة عملية عند الحاجة
+- اختتم بخلاصة واضحة
+""",
+    'gemini_domain_financial': """
+### التخصص المالي:
+- تحليل الأسواق المالية
+- تقييم الاستثمارات
+- إدارة المخاطر
+- التحليل الكمي والأساسي
+""",
+    'gemini_domain_technical': """
+### التخصص التقني:
+- البرمجة والتطوير
+- هندسة البرمجيات
+- الذكاء الاصطناعي
+- تحليل البيانات
+""",
+    'deepseek_language': "- {language}: تطوير متقدم وحلول مبتكرة\n",
+    'deepseek_coding': """# 3RBAI DeepSeek - {model_name}
+
+## التخصص في البرمجة والتطوير:
+أنت مطور خبير في 3RBAI، متخصص في:
+
+### لغات البرمجة:
+{languages}
+### المهارات المتقدمة:
+- هندسة البرمجيات والأنماط التصميمية
+- تحسين الأداء والخوارزميات
+- تطوير الذكاء الاصطناعي والتعلم الآلي
+- أمان التطبيقات وأفضل الممارسات
+- التطوير السحابي والمايكروسيرفس
+
+### منهجية العمل:
+1. **فهم المتطلبات**: تحليل دقيق للمشكلة
+2. **التصميم**: وضع هيكل واضح ومرن
+3. **التنفيذ**: كتابة كود نظيف وموثق
+4. **الاختبار**: ضمان الجودة والموثوقية
+5. **التحسين**: تطوير مستمر للأداء
+
+### معايير الكود:
+- وضوح وقابلية القراءة
+- التوثيق الشامل
+- معالجة الأخطاء
+- الأمان والحماية
+- قابلية الصيانة والتطوير
+""",
+    'financial_fundamental': """# محلل أساسي - 3RBAI
+
+## الهوية والتخصص:
+أنت محلل أساسي خبير في 3RBAI، متخصص في تحليل الشركات والاستثمارات.
+
+### المهارات الأساسية:
+- تحليل القوائم المالية بعمق
+- تقييم نماذج الأعمال والميزة التنافسية
+- تحليل الصناعات والأسواق
+- تقدير القيمة العادلة للأسهم
+- تحليل المخاطر والفرص
+
+### منهجية التحليل:
+1. **تحليل الأعمال**: فهم نموذج العمل والميزة التنافسية
+2. **التحليل المالي**: دراسة الأداء المالي والاتجاهات
+3. **تحليل الصناعة**: تقييم البيئة التنافسية والنمو
+4. **التقييم**: تحديد القيمة العادلة باستخدام عدة طرق
+5. **إدارة المخاطر**: تحديد وتقييم المخاطر المحتملة
+
+### أدوات التحليل:
+- نماذج التدفق النقدي المخصوم (DCF)
+- مضاعفات التقييم (P/E, P/B, EV/EBITDA)
+- تحليل DuPont للعائد على حقوق الملكية
+- تحليل الحساسية والسيناريوهات
+- مقارنة الأقران والمعايير القطاعية
+""",
+    'financial_technical': """# محلل تقني - 3RBAI
+
+## الهوية والتخصص:
+أنت محلل تقني خبير في 3RBAI، متخصص في تحليل حركة الأسعار والاتجاهات.
+
+### المهارات التقنية:
+- تحليل الرسوم البيانية والأنماط
+- استخدام المؤشرات التقنية المتقدمة
+- تحديد مستويات الدعم والمقاومة
+- تحليل الحجم والزخم
+- إدارة المخاطر التقنية
+
+### الأدوات والمؤشرات:
+- المتوسطات المتحركة (SMA, EMA, WMA)
+- مؤشرات الزخم (RSI, MACD, Stochastic)
+- مؤشرات الحجم (OBV, Volume Profile)
+- خطوط الاتجاه ومستويات فيبوناتشي
+- أنماط الشموع اليابانية
+
+### استراتيجيات التداول:
+1. **تحليل الاتجاه**: تحديد الاتجاه الرئيسي والثانوي
+2. **نقاط الدخول والخروج**: تحديد أفضل نقاط التداول
+3. **إدارة المخاطر**: وضع مستويات وقف الخسارة وجني الأرباح
+4. **تأكيد الإشارات**: استخدام عدة مؤشرات للتأكيد
+5. **إدارة رأس المال**: تحديد حجم المراكز المناسب
+""",
+    'financial_macro': """# محلل اقتصادي كلي - 3RBAI
+
+## الهوية والتخصص:
+أنت محلل اقتصادي كلي خبير في 3RBAI، متخصص في تحليل البيئة الاقتصادية الكلية.
+
+### مجالات التحليل:
+- السياسة النقدية والمالية
+- مؤشرات النمو الاقتصادي
+- التضخم وأسعار الفائدة
+- أسواق العملات والسلع
+- التجارة الدولية والجيوسياسة
+
+### المؤشرات الرئيسية:
+- الناتج المحلي الإجمالي (GDP)
+- معدلات التضخم (CPI, PPI)
+- معدلات البطالة والتوظيف
+- أسعار الفائدة والعائد على السندات
+- مؤشرات الثقة الاقتصادية
+
+### منهجية التحليل:
+1. **تحليل البيانات**: دراسة المؤشرات الاقتصادية الحديثة
+2. **تحليل السياسات**: تقييم تأثير السياسات الحكومية
+3. **التنبؤ**: وضع توقعات للاتجاهات المستقبلية
+4. **تحليل المخاطر**: تحديد المخاطر الاقتصادية الكلية
+5. **التوصيات**: تقديم توصيات استثمارية مبنية على التحليل الكلي
+""",
+    'agent': """# {title} - 3RBAI
+
+## الدور والمسؤوليات:
+**الدور الأساسي**: {role}
+
+### المسؤوليات الرئيسية:
+{responsibilities}
+## التعاون مع الوكلاء الآخرين:
+- تبادل المعلومات والتحليلات بشكل منتظم
+- التنسيق في اتخاذ القرارات المشتركة
+- دعم الوكلاء الآخرين بالخبرة المتخصصة
+- المساهمة في الرؤية الشاملة للفريق
+
+## معايير الأداء:
+- الدقة في التحليل والتوصيات
+- السرعة في الاستجابة للمتغيرات
+- التعاون الفعال مع الفريق
+- الابتكار في الحلول والأساليب
+- الالتزام بمعايير إدارة المخاطر
+""",
+    'coordination_agent': "- {name} ({agent})\n",
+    'coordination': """# نظام التنسيق متعدد الوكلاء - 3RBAI
+
+## الوكلاء المشاركون:
+{agents}
+## بروتوكول التنسيق:
+### 1. تدفق المعلومات:
+- كل وكيل يشارك تحليلاته مع الفريق
+- التحديثات المنتظمة عند تغير الظروف
+- التنبيهات الفورية للمخاطر الحرجة
+
+### 2. اتخاذ القرارات:
+- مدير المحفظة يقود عملية اتخاذ القرار
+- كل وكيل يقدم رأيه المتخصص
+- التصويت الجماعي في القرارات المعقدة
+- توثيق الأسباب والمبررات
+
+### 3. إدارة الخلافات:
+- مناقشة مفتوحة للآراء المختلفة
+- تحليل إضافي عند الحاجة
+- البحث عن حلول وسط مقبولة
+- تصعيد للإدارة العليا عند الضرورة
+
+### 4. مراقبة الأداء:
+- تقييم دوري لأداء كل وكيل
+- قياس فعالية التعاون
+- تحسين مستمر للعمليات
+- تدريب وتطوير الوكلاء
+"""
+}
+
+AGENT_PROFILES = {
+    'pm': {
+        'title': 'مدير المحفظة - Portfolio Manager',
+        'role': 'تنسيق وإدارة فريق التحليل المالي',
+        'responsibilities': [
+            'تنسيق عمل المحللين المختلفين',
+            'اتخاذ القرارات الاستثمارية النهائية',
+            'إدارة المخاطر على مستوى المحفظة',
+            'تقييم التوصيات وتحديد الأولويات',
+            'التواصل مع العملاء وأصحاب المصلحة'
+        ]
+    },
+    'fundamental': {
+        'title': 'محلل أساسي - Fundamental Analyst',
+        'role': 'تحليل الشركات والقيمة الجوهرية',
+        'responsibilities': [
+            'تحليل القوائم المالية والأداء التشغيلي',
+            'تقييم نماذج الأعمال والميزة التنافسية',
+            'تحليل الصناعة والبيئة التنافسية',
+            'تقدير القيمة العادلة للاستثمارات',
+            'تحديد المحفزات والمخاطر الأساسية'
+        ]
+    },
+    'macro': {
+        'title': 'محلل اقتصادي كلي - Macro Analyst',
+        'role': 'تحليل البيئة الاقتصادية الكلية',
+        'responsibilities': [
+            'تحليل السياسات النقدية والمالية',
+            'متابعة المؤشرات الاقتصادية الرئيسية',
+            'تقييم تأثير الأحداث الجيوسياسية',
+            'تحليل اتجاهات أسعار الفائدة والتضخم',
+            'تقديم رؤى حول دورات الأعمال'
+        ]
+    },
+    'quant': {
+        'title': 'محلل كمي - Quantitative Analyst',
+        'role': 'التحليل الكمي والنمذجة المالية',
+        'responsibilities': [
+            'تطوير النماذج الكمية والإحصائية',
+            'تحليل البيانات التاريخية والأنماط',
+            'تقييم المخاطر باستخدام الطرق الكمية',
+            'اختبار الاستراتيجيات والتحقق من صحتها',
+            'تطوير أدوات التداول الخوارزمي'
+        ]
+    }
+}
+
+AGENT_DISPLAY_NAMES = {
+    'pm': 'مدير المحفظة',
+    'fundamental': 'المحلل الأساسي',
+    'macro': 'المحلل الاقتصادي الكلي',
+    'quant': 'المحلل الكمي'
+}
+
+
+class PromptTemplateRegistry:
+    """
+    Compiled prompt templates with memoized rendering and batched file output
+    
+    Each template is parsed once into literal/field segments, so rendering
+    is a single join. Rendered prompts are memoized by template and values
+    and stored once per content hash; staged prompt files are written in one
+    background batch and skipped entirely when the file on disk already
+    holds the same content.
+    """
+    
+    def __init__(self, templates: Optional[Dict[str, str]] = None, output_dir: Optional[str] = None):
+        """
+        Args:
+            templates: Templates to compile, keyed by name
+            output_dir: Directory holding the manifest of written prompt hashes
+        """
+        self.compiled = {}
+        self.render_cache = {}
+        self.contents = {}
+        self.pending = {}
+        self.flush_lock = None
+        self.stats = {"renders": 0, "render_cache_hits": 0, "files_written": 0, "files_unchanged": 0}
+        
+        self.manifest_path = os.path.join(output_dir, ".prompt_manifest.json") if output_dir else None
+        self.written = {}
+        if self.manifest_path and os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    self.written = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self.written = {}
+                
+        for name, template in (templates or {}).items():
+            self.register(name, template)
+            
+    def __contains__(self, name: str) -> bool:
+        return name in self.compiled
+        
+    def __getstate__(self):
+        # The trainer is pickled into training workers; the flush lock is bound
+        # to the parent's event loop, and staged files and memos stay there too
+        state = self.__dict__.copy()
+        state.update({"render_cache": {}, "contents": {}, "pending": {}, "flush_lock": None})
+        return state
+        
+    def register(self, name: str, template: str):
+        """Compile a template into (literal, field) segments"""
+        segments = []
+        for literal, field, format_spec, conversion in string.Formatter().parse(template):
+            if format_spec or conversion:
+                raise ValueError(f"Template {name}: format specs are not supported ({field})")
+            segments.append((literal, field))
+        self.compiled[name] = tuple(segments)
+        
+    def render(self, name: str, /, **values) -> str:
+        """Render a compiled template; identical calls return the memoized string"""
+        key = (name, tuple(sorted(values.items())))
+        cached = self.render_cache.get(key)
+        if cached is not None:
+            self.stats["render_cache_hits"] += 1
+            return cached
+            
+        self.stats["renders"] += 1
+        rendered = ''.join(
+            literal + (str(values[field]) if field is not None else '')
+            for literal, field in self.compiled[name]
+        )
+        # One string object per distinct content
+        digest = hashlib.sha256(rendered.encode('utf-8')).hexdigest()
+        rendered = self.contents.setdefault(digest, rendered)
+        self.render_cache[key] = rendered
+        return rendered
+        
+    def render_each(self, name: str, field: str, items: List[Any]) -> str:
+        """Render a one-field item template for every item and concatenate"""
+        return ''.join(self.render(name, **{field: item}) for item in items)
+        
+    def stage(self, path: str, content: str) -> str:
+        """
+        Queue a prompt file for the next flush
+        
+        Returns:
+            The path, for the caller's result dictionary
+        """
+        digest = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        self.contents.setdefault(digest, content)
+        self.pending[path] = digest
+        return path
+        
+    async def flush(self):
+        """Write every staged prompt file in one background batch"""
+        if self.flush_lock is None:
+            self.flush_lock = asyncio.Lock()
+            
+        # Concurrent callers wait for an in-flight batch that may include their files
+        async with self.flush_lock:
+            pending, self.pending = self.pending, {}
+            batch = []
+            for path, digest in pending.items():
+                content = self.contents[digest]
+                # The manifest hash plus a size check stands in for re-reading the file
+                if (self.written.get(path) == digest and os.path.exists(path)
+                        and os.path.getsize(path) == len(content.encode('utf-8'))):
+                    self.stats["files_unchanged"] += 1
+                else:
+                    batch.append((path, content))
+                    
+            if batch:
+                await asyncio.to_thread(self._write_batch, batch)
+                self.stats["files_written"] += len(batch)
+            self.written.update(pending)
+            
+            if self.manifest_path and batch:
+                await asyncio.to_thread(self._write_manifest, dict(self.written))
+                
+    @staticmethod
+    def _write_batch(batch: List[tuple]):
+        for path, content in batch:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(content)
+                
+    def _write_manifest(self, written: Dict[str, str]):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(written, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+
+# OpenAI-compatible chat endpoints used for prompt evaluation. Every entry can
+# be overridden from the trainer config ("providers" section) or with
+# <PROVIDER>_BASE_URL / <PROVIDER>_MODEL environment variables, which is how
+# evaluations are pointed at a local mock server. Costs are USD list prices
+# per million tokens, used only for report estimates; "prompt_budget" (tokens)
+# caps generated system prompts for the provider.
+PROVIDER_DEFAULTS = {
+    'groq': {
+        'base_url': 'https://api.groq.com/openai/v1',
+        'model': 'llama-3.1-8b-instant',
+        'requests_per_minute': 30,
+        'tokens_per_minute': 6000,
+        'max_concurrency': 4,
+        'tokenizer': 'cl100k_base',
+        'context_window': 131072,
+        'input_cost_per_million': 0.05,
+        'output_cost_per_million': 0.08
+    },
+    'gemini': {
+        'base_url': 'https://generativelanguage.googleapis.com/v1beta/openai',
+        'model': 'gemini-1.5-flash',
+        'requests_per_minute': 15,
+        'tokens_per_minute': 250000,
+        'max_concurrency': 4,
+        'tokenizer': None,
+        'context_window': 1048576,
+        'input_cost_per_million': 0.075,
+        'output_cost_per_million': 0.30
+    },
+    'deepseek': {
+        'base_url': 'https://api.deepseek.com/v1',
+        'model': 'deepseek-chat',
+        'requests_per_minute': 60,
+        'tokens_per_minute': 100000,
+        'max_concurrency': 8,
+        'tokenizer': 'cl100k_base',
+        'context_window': 65536,
+        'input_cost_per_million': 0.27,
+        'output_cost_per_million': 1.10
+    },
+    'together': {
+        'base_url': 'https://api.together.xyz/v1',
+        'model': 'meta-llama/Llama-3-8b-chat-hf',
+        'requests_per_minute': 60,
+        'tokens_per_minute': 100000,
+        'max_concurrency': 8,
+        'tokenizer': 'cl100k_base',
+        'context_window': 8192,
+        'input_cost_per_million': 0.20,
+        'output_cost_per_million': 0.20
+    }
+}
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class LLMRequestError(Exception):
+    """Raised when a provider request fails after all retries"""
+    
+    def __init__(self, provider: str, message: str, status: Optional[int] = None):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.status = status
+
+
+def _estimate_tokens(text: str) -> int:
+    """Rough token estimate (about 4 characters per token) used for rate limiting"""
+    return max(1, len(text) // 4)
+
+
+_TOKEN_PIECES = re.compile(r"[A-Za-z0-9]+|[^\W\d_A-Za-z]+|[^\w\s]")
+
+
+class TokenCounter:
+    """
+    Fast per-provider token counts for generated prompts
+    
+    Uses the provider's tiktoken encoding when tiktoken is installed and
+    the encoding is available offline. Otherwise falls back to a script-
+    aware estimate: Latin/digit runs at about 4 characters per token,
+    other scripts (Arabic) at about 2.5, and one token per symbol. Counts
+    are memoized, since the same rendered prompts are counted repeatedly.
+    """
+    
+    def __init__(self):
+        self.encodings = {}
+        self._count = lru_cache(maxsize=4096)(self._count_uncached)
+        
+    def __getstate__(self):
+        # The trainer is pickled into training workers; memo and encodings are rebuilt there
+        return {}
+        
+    def __setstate__(self, state):
+        self.__init__()
+        
+    def _encoding(self, name: Optional[str]):
+        if not name:
+            return None
+        if name not in self.encodings:
+            encoding = None
+            if importlib.util.find_spec("tiktoken") is not None:
+                try:
+                    import tiktoken
+                    encoding = tiktoken.get_encoding(name)
+                except Exception as e:
+                    logger.warning(f"⚠️ tiktoken encoding {name} unavailable, estimating token counts: {e}")
+            self.encodings[name] = encoding
+        return self.encodings[name]
+        
+    def _count_uncached(self, text: str, encoding_name: Optional[str], chars_per_token: float) -> int:
+        encoding = self._encoding(encoding_name)
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+            
+        tokens = 0
+        for piece in _TOKEN_PIECES.findall(text):
+            if piece.isascii():
+                tokens += math.ceil(len(piece) / 4) if piece[0].isalnum() else 1
+            else:
+                tokens += math.ceil(len(piece) / chars_per_token)
+        return tokens
+        
+    def count(self, text: str, settings: Optional[Dict[str, Any]] = None) -> int:
+        """
+        Count the tokens of a text for a provider
+        
+        Args:
+            text: Prompt text
+            settings: Provider settings (tokenizer, non_latin_chars_per_token)
+        """
+        settings = settings or {}
+        return self._count(text, settings.get('tokenizer'), float(settings.get('non_latin_chars_per_token', 2.5)))
+
+
+def _split_prompt_sections(prompt: str) -> List[str]:
+    """Split a markdown prompt before every heading line; the parts join back to the prompt"""
+    sections = []
+    current = []
+    for line in prompt.splitlines(keepends=True):
+        if line.startswith('#') and current:
+            sections.append(''.join(current))
+            current = []
+        current.append(line)
+    if current:
+        sections.append(''.join(current))
+    return sections
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter for requests/minute and tokens/minute
+    
+    Both buckets start full and refill continuously. A request waits until
+    both buckets hold enough budget, so bursts are allowed up to the
+    per-minute limits and the long-run rate never exceeds them.
+    """
+    
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        """
+        Create the buckets
+        
+        Args:
+            requests_per_minute: Request budget, None or 0 for unlimited
+            tokens_per_minute: Token budget, None or 0 for unlimited
+        """
+        self.rpm = float(requests_per_minute or 0)
+        self.tpm = float(tokens_per_minute or 0)
+        self.request_tokens = self.rpm
+        self.token_tokens = self.tpm
+        self.updated = time.monotonic()
+        self.lock = None
+        
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        if self.rpm:
+            self.request_tokens = min(self.rpm, self.request_tokens + elapsed * self.rpm / 60.0)
+        if self.tpm:
+            self.token_tokens = min(self.tpm, self.token_tokens + elapsed * self.tpm / 60.0)
+            
+    async def acquire(self, tokens: int = 1):
+        """
+        Wait until one request and the given number of tokens are available
+        
+        Args:
+            tokens: Estimated prompt + completion tokens of the request
+        """
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        # A single request larger than the whole budget would wait forever
+        tokens = min(tokens, self.tpm) if self.tpm else tokens
+        
+        # Waiters queue on the lock so budget is handed out in arrival order
+        async with self.lock:
+            while True:
+                self._refill()
+                waits = []
+                if self.rpm and self.request_tokens < 1:
+                    waits.append((1 - self.request_tokens) * 60.0 / self.rpm)
+                if self.tpm and self.token_tokens < tokens:
+                    waits.append((tokens - self.token_tokens) * 60.0 / self.tpm)
+                if not waits:
+                    break
+                await asyncio.sleep(max(waits))
+                
+            if self.rpm:
+                self.request_tokens -= 1
+            if self.tpm:
+                self.token_tokens -= tokens
+                
+    def refund(self, tokens: int):
+        """Return over-reserved tokens once the real usage is known"""
+        if self.tpm and tokens > 0:
+            self.token_tokens = min(self.tpm, self.token_tokens + tokens)
+
+
+class ResponseCache:
+    """
+    Persistent SQLite cache of chat completion responses
+    
+    Entries are keyed by a SHA-256 of the provider and the full request
+    payload (model, messages and sampling params), so any change to the
+    prompt or the sampling settings misses the cache. Entries expire after
+    ttl_seconds, and the least recently used ones are evicted once the
+    cache holds more than max_entries.
+    """
+    
+    def __init__(self, path: str, ttl_seconds: Optional[float] = 7 * 24 * 3600, max_entries: int = 50000):
+        """
+        Open (or create) the cache database
+        
+        Args:
+            path: SQLite file
+            ttl_seconds: Entry lifetime, None to keep entries until evicted
+            max_entries: Number of entries kept after eviction
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.puts_since_evict = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                provider TEXT,
+                model TEXT,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)")
+        self.conn.commit()
+        self.evict()
+        
+    @staticmethod
+    def key(provider: str, payload: Dict[str, Any]) -> str:
+        """Hash of provider, model, messages and sampling params"""
+        canonical = json.dumps({"provider": provider, "payload": payload}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+        
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a fresh cached response, or None"""
+        row = self.conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if self.ttl_seconds is not None and time.time() - row[1] > self.ttl_seconds:
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.conn.commit()
+            return None
+            
+        self.conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        self.conn.commit()
+        return json.loads(row[0])
+        
+    def put(self, key: str, provider: str, model: str, response: Dict[str, Any]):
+        """Store a response"""
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses (key, provider, model, response, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, provider, model, json.dumps(response, ensure_ascii=False), now, now)
+        )
+        self.conn.commit()
+        
+        # Counting rows on every insert is wasteful; evict in batches
+        self.puts_since_evict += 1
+        if self.puts_since_evict >= 100:
+            self.evict()
+            
+    def evict(self):
+        """Drop expired entries, then the least recently used beyond max_entries"""
+        self.puts_since_evict = 0
+        if self.ttl_seconds is not None:
+            self.conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        self.conn.execute(
+            "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+        self.conn.commit()
+        
+    def close(self):
+        """Evict and close the database"""
+        self.evict()
+        self.conn.close()
+
+
+class LLMClient:
+    """
+    Pooled async client for one OpenAI-compatible provider
+    
+    Keeps a single aiohttp session (and so a warm keep-alive connection
+    pool) for the provider, bounds in-flight requests with a semaphore,
+    applies the provider's rate limits and retries 429/5xx responses and
+    connection errors with jittered exponential backoff.
+    """
+    
+    def __init__(self, provider: str, settings: Dict[str, Any], cache: Optional['ResponseCache'] = None):
+        """
+        Configure the client; the session is opened on first use
+        
+        Args:
+            provider: Provider name used in logs and errors
+            settings: base_url, model, api_key, requests_per_minute,
+                tokens_per_minute, max_concurrency, timeout, max_retries,
+                backoff_base, backoff_max, default sampling params, stream
+                (use SSE streaming, default True) and stream_usage (ask
+                for a final usage chunk, default True)
+            cache: Optional ResponseCache consulted before every request
+        """
+        self.provider = provider
+        self.base_url = settings['base_url'].rstrip('/')
+        self.model = settings['model']
+        self.api_key = settings.get('api_key')
+        self.max_concurrency = int(settings.get('max_concurrency', 4))
+        self.timeout = float(settings.get('timeout', 60))
+        self.max_retries = int(settings.get('max_retries', 5))
+        self.backoff_base = float(settings.get('backoff_base', 0.5))
+        self.backoff_max = float(settings.get('backoff_max', 30))
+        self.sampling = dict(settings.get('sampling', {'temperature': 0.2, 'max_tokens': 512}))
+        self.stream = bool(settings.get('stream', True))
+        self.stream_usage = bool(settings.get('stream_usage', True))
+        self.rate_limiter = RateLimiter(settings.get('requests_per_minute'), settings.get('tokens_per_minute'))
+        self.cache = cache
+        self.session = None
+        self.semaphore = None
+        self.stats = {"requests": 0, "retries": 0, "failures": 0, "cache_hits": 0}
+        
+    def _ensure_session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, ttl_dns_cache=300, keepalive_timeout=60)
+            headers = {"Content-Type": "application/json"}
+            if self.api_key:
+                headers["Authorization"] = f"Bearer {self.api_key}"
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self.session
+        
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Full-jitter exponential backoff, honouring a numeric Retry-After"""
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        
+    async def chat(self, messages: List[Dict[str, str]], use_cache: bool = True, **params) -> Dict[str, Any]:
+        """
+        Send one chat completion request, answering from the cache when possible
+        
+        Args:
+            messages: OpenAI-style message list
+            use_cache: Look up and store the response in the response cache
+            **params: Sampling overrides (temperature, max_tokens, ...)
+            
+        Returns:
+            Dictionary with content, usage, latency and ttft (seconds; ttft
+            is None for non-streamed calls), tokens_per_sec, attempts and
+            cached (True when no request was sent)
+        """
+        stream = params.pop('stream', self.stream)
+        payload = {"model": self.model, "messages": messages}
+        payload.update(self.sampling)
+        payload.update(params)
+        
+        cache_key = None
+        if use_cache and self.cache is not None:
+            # Streaming is a transport detail and does not change the answer
+            cache_key = self.cache.key(self.provider, payload)
+            
+        if stream:
+            payload["stream"] = True
+            if self.stream_usage:
+                payload["stream_options"] = {"include_usage": True}
+                
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self.stats["cache_hits"] += 1
+                cached.update({"attempts": 0, "cached": True})
+                return cached
+                
+        result = await self._post_with_retries(payload)
+        if cache_key is not None:
+            self.cache.put(cache_key, self.provider, self.model, result)
+        return result
+        
+    async def _read_stream(self, response: aiohttp.ClientResponse, started: float) -> Dict[str, Any]:
+        """
+        Consume a server-sent events completion stream
+        
+        Args:
+            response: Open 200 response with a text/event-stream body
+            started: perf_counter() value when the request was sent
+            
+        Returns:
+            Dictionary with content, usage, latency and ttft (seconds until
+            the first non-empty content delta)
+        """
+        parts = []
+        usage = {}
+        ttft = None
+        chunks = 0
+        
+        async for raw_line in response.content:
+            line = raw_line.decode('utf-8').strip()
+            if not line.startswith('data:'):
+                continue
+            data = line[5:].strip()
+            if data == '[DONE]':
+                break
+                
+            event = json.loads(data)
+            if event.get('usage'):
+                usage = event['usage']
+            for choice in event.get('choices') or []:
+                text = (choice.get('delta') or {}).get('content')
+                if text:
+                    if ttft is None:
+                        ttft = time.perf_counter() - started
+                    parts.append(text)
+                    chunks += 1
+                    
+        if not usage.get('completion_tokens'):
+            # Providers that omit usage in streams emit roughly one token per delta
+            usage = dict(usage, completion_tokens=chunks)
+            
+        return {
+            "content": ''.join(parts),
+            "usage": usage,
+            "latency": time.perf_counter() - started,
+            "ttft": ttft
+        }
+        
+    @staticmethod
+    def _generation_rate(result: Dict[str, Any]) -> Optional[float]:
+        """Completion tokens per second after the first token (whole call when not streamed)"""
+        tokens = result['usage'].get('completion_tokens')
+        duration = result['latency'] - (result['ttft'] or 0.0)
+        if not tokens or duration <= 0:
+            return None
+        return tokens / duration
+        
+    async def _post_with_retries(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """POST a chat completion payload, retrying 429/5xx and connection errors"""
+        session = self._ensure_session()
+        reserved = sum(_estimate_tokens(m.get('content', '')) for m in payload['messages']) + int(payload.get('max_tokens') or 0)
+        url = f"{self.base_url}/chat/completions"
+        
+        async with self.semaphore:
+            for attempt in range(self.max_retries + 1):
+                await self.rate_limiter.acquire(reserved)
+                self.stats["requests"] += 1
+                started = time.perf_counter()
+                retry_after = None
+                
+                try:
+                    async with session.post(url, json=payload) as response:
+                        if response.status == 200:
+                            if payload.get('stream'):
+                                result = await self._read_stream(response, started)
+                            else:
+                                body = await response.json()
+                                result = {
+                                    "content": body['choices'][0]['message'].get('content') or '',
+                                    "usage": body.get('usage') or {},
+                                    "latency": time.perf_counter() - started,
+                                    "ttft": None
+                                }
+                            result["tokens_per_sec"] = self._generation_rate(result)
+                            result.update({"attempts": attempt + 1, "cached": False})
+                            self.rate_limiter.refund(reserved - result['usage'].get('total_tokens', reserved))
+                            return result
+                            
+                        # Rejected requests produce no tokens
+                        self.rate_limiter.refund(reserved)
+                        error_text = (await response.text())[:200]
+                        if response.status not in RETRYABLE_STATUS:
+                            self.stats["failures"] += 1
+                            raise LLMRequestError(self.provider, f"HTTP {response.status}: {error_text}", response.status)
+                        retry_after = response.headers.get('Retry-After')
+                        last_error = LLMRequestError(self.provider, f"HTTP {response.status}: {error_text}", response.status)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    last_error = LLMRequestError(self.provider, f"{type(e).__name__}: {e}")
+                    
+                if attempt < self.max_retries:
+                    self.stats["retries"] += 1
+                    delay = self._backoff(attempt, retry_after)
+                    logger.warning(f"🔁 {self.provider} request failed ({last_error}), retrying in {delay:.2f}s")
+                    await asyncio.sleep(delay)
+                    
+        self.stats["failures"] += 1
+        raise last_error
+        
+    async def close(self):
+        """Close the pooled session"""
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+
+class LLMClientPool:
+    """
+    Lazily created LLMClient per provider, shared by all evaluations
+    
+    Settings are merged from PROVIDER_DEFAULTS, the trainer config's
+    "providers" section and <PROVIDER>_BASE_URL / <PROVIDER>_MODEL
+    environment variables, in increasing priority.
+    """
+    
+    def __init__(self, provider_config: Optional[Dict[str, Dict]] = None, api_keys: Optional[Dict[str, str]] = None,
+                 cache: Optional[ResponseCache] = None):
+        """
+        Args:
+            provider_config: Per-provider overrides keyed by provider name
+            api_keys: API keys keyed by provider name
+            cache: Response cache shared by every provider client
+        """
+        self.provider_config = provider_config or {}
+        self.api_keys = api_keys or {}
+        self.cache = cache
+        self.clients = {}
+        
+    def settings(self, provider: str) -> Dict[str, Any]:
+        """Resolve the effective settings of a provider"""
+        settings = dict(PROVIDER_DEFAULTS.get(provider, {}))
+        settings.update(self.provider_config.get(provider, {}))
+        
+        prefix = provider.upper()
+        if os.getenv(f"{prefix}_BASE_URL"):
+            settings['base_url'] = os.getenv(f"{prefix}_BASE_URL")
+        if os.getenv(f"{prefix}_MODEL"):
+            settings['model'] = os.getenv(f"{prefix}_MODEL")
+        if not settings.get('api_key'):
+            settings['api_key'] = self.api_keys.get(provider)
+            
+        if not settings.get('base_url') or not settings.get('model'):
+            raise ValueError(f"No base_url/model configured for provider: {provider}")
+        return settings
+        
+    def is_configured(self, provider: str) -> bool:
+        """Whether the provider has an API key"""
+        try:
+            return bool(self.settings(provider).get('api_key'))
+        except ValueError:
+            return False
+            
+    def get(self, provider: str) -> LLMClient:
+        """Return the shared client of a provider"""
+        if provider not in self.clients:
+            self.clients[provider] = LLMClient(provider, self.settings(provider), self.cache)
+        return self.clients[provider]
+        
+    async def close(self):
+        """Close every open session"""
+        for client in self.clients.values():
+            await client.close()
+            
+    def cache_stats(self) -> Dict[str, int]:
+        """Cache hits and network requests summed over providers"""
+        return {
+            "cache_hits": sum(c.stats["cache_hits"] for c in self.clients.values()),
+            "network_requests": sum(c.stats["requests"] for c in self.clients.values())
+        }
+
+
+class ResponseScorer:
+    """
+    Batched reference-based scoring of evaluation responses
+    
+    Exact match, coverage (share of reference words in the response),
+    word F1 (ROUGE-1) and bigram ROUGE-2 F1 are computed for a whole test
+    set at once from sparse n-gram count matrices. When an embedding model
+    is configured and sentence-transformers is installed, cosine
+    similarity of local embeddings is added. "score" is the word F1,
+    averaged with the similarity when it is available; coverage alone
+    rewards long answers that repeat the reference words, so it is only
+    reported.
+    
+    Results are cached by a hash of the response and its reference, so
+    re-scoring unchanged responses (such as cached completions across
+    prompt iterations) is a dictionary lookup.
+    """
+    
+    TOKEN_PATTERN = r"(?u)\b\w+\b"
+    METRICS = ("exact_match", "coverage", "f1", "rouge2", "score")
+    
+    def __init__(self, embedding_model: Optional[str] = None, batch_size: int = 64, max_entries: int = 100000):
+        """
+        Args:
+            embedding_model: sentence-transformers model name or local path, None to skip similarity
+            batch_size: Texts per embedding batch
+            max_entries: Cached scores kept (least recently used are dropped)
+        """
+        self.embedding_model = embedding_model
+        self.batch_size = batch_size
+        self.max_entries = max_entries
+        self.encoder = None
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"scored": 0, "cache_hits": 0}
+        self.unigrams = CountVectorizer(token_pattern=self.TOKEN_PATTERN)
+        self.bigrams = CountVectorizer(token_pattern=self.TOKEN_PATTERN, ngram_range=(2, 2))
+        
+    def _cache_key(self, response: str, reference: str) -> str:
+        return hashlib.sha256(f"{self.embedding_model}\0{reference}\0{response}".encode('utf-8')).hexdigest()
+        
+    def _load_encoder(self):
+        if self.encoder is None and self.embedding_model:
+            if importlib.util.find_spec("sentence_transformers") is None:
+                logger.warning("⚠️ sentence-transformers is not installed, skipping embedding similarity (pip install sentence-transformers)")
+                self.embedding_model = None
+                return None
+            from sentence_transformers import SentenceTransformer
+            logger.info(f"🧲 Loading embedding model: {self.embedding_model}")
+            self.encoder = SentenceTransformer(self.embedding_model)
+        return self.encoder
+        
+    @staticmethod
+    def _overlap(vectorizer: CountVectorizer, responses: List[str], references: List[str]) -> tuple:
+        """Clipped n-gram matches as (precision, recall, f1) arrays"""
+        n = len(responses)
+        zeros = np.zeros(n)
+        try:
+            counts = vectorizer.fit_transform(responses + references)
+        except ValueError:
+            # Empty vocabulary: no text has a single n-gram
+            return zeros, zeros, zeros
+            
+        response_counts, reference_counts = counts[:n], counts[n:]
+        matched = np.asarray(response_counts.minimum(reference_counts).sum(axis=1)).ravel()
+        response_totals = np.asarray(response_counts.sum(axis=1)).ravel()
+        reference_totals = np.asarray(reference_counts.sum(axis=1)).ravel()
+        
+        precision = np.divide(matched, response_totals, out=zeros.copy(), where=response_totals > 0)
+        recall = np.divide(matched, reference_totals, out=zeros.copy(), where=reference_totals > 0)
+        f1 = np.divide(2 * precision * recall, precision + recall, out=zeros.copy(), where=(precision + recall) > 0)
+        return precision, recall, f1
+        
+    def _similarity(self, responses: List[str], references: List[str]) -> Optional[np.ndarray]:
+        """Cosine similarity of response/reference embeddings, each distinct text encoded once"""
+        encoder = self._load_encoder()
+        if encoder is None:
+            return None
+        texts = list(dict.fromkeys(responses + references))
+        embeddings = encoder.encode(texts, batch_size=self.batch_size, normalize_embeddings=True, convert_to_numpy=True)
+        positions = {text: i for i, text in enumerate(texts)}
+        response_vectors = embeddings[[positions[text] for text in responses]]
+        reference_vectors = embeddings[[positions[text] for text in references]]
+        return np.einsum('ij,ij->i', response_vectors, reference_vectors)
+        
+    def _score_batch(self, responses: List[str], references: List[str]) -> Dict[str, np.ndarray]:
+        analyzer = self.unigrams.build_analyzer()
+        _, coverage, f1 = self._overlap(self.unigrams, responses, references)
+        _, _, rouge2 = self._overlap(self.bigrams, responses, references)
+        metrics = {
+            "exact_match": np.array([analyzer(r) == analyzer(e) for r, e in zip(responses, references)], dtype=float),
+            "coverage": coverage,
+            "f1": f1,
+            "rouge2": rouge2,
+            "score": f1
+        }
+        similarity = self._similarity(responses, references)
+        if similarity is not None:
+            metrics["similarity"] = similarity
+            metrics["score"] = (f1 + np.clip(similarity, 0.0, 1.0)) / 2
+        return metrics
+        
+    def score(self, responses: List[str], references: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Score responses against their references
+        
+        Args:
+            responses: Model responses
+            references: Expected responses, aligned with responses
+            
+        Returns:
+            Metric name -> array aligned with responses
+        """
+        if not responses:
+            return {name: np.zeros(0) for name in self.METRICS}
+            
+        keys = [self._cache_key(response, reference) for response, reference in zip(responses, references)]
+        with self.lock:
+            rows = [self.cache.get(key) for key in keys]
+            missing = {}
+            for index, (key, row) in enumerate(zip(keys, rows)):
+                if row is not None:
+                    self.cache.move_to_end(key)
+                elif key not in missing:
+                    missing[key] = index
+            self.stats["cache_hits"] += len(keys) - len(missing)
+            
+            if missing:
+                indices = list(missing.values())
+                computed = self._score_batch([responses[i] for i in indices], [references[i] for i in indices])
+                fresh = {
+                    key: {name: float(values[position]) for name, values in computed.items()}
+                    for position, key in enumerate(missing)
+                }
+                rows = [row if row is not None else fresh[key] for key, row in zip(keys, rows)]
+                self.cache.update(fresh)
+                self.stats["scored"] += len(fresh)
+                while len(self.cache) > self.max_entries:
+                    self.cache.popitem(last=False)
+                    
+        return {name: np.array([row[name] for row in rows]) for name in rows[0]}
+        
+        
+class _LSTMRegressor(nn.Module):
+    """LSTM over the feature vector read as a sequence of scalars"""
+    
+    def __init__(self, n_outputs: int, hidden_size: int = 64):
+        super().__init__()
+        self.lstm = nn.LSTM(input_size=1, hidden_size=hidden_size, batch_first=True)
+        self.head = nn.Linear(hidden_size, n_outputs)
+        
+    def forward(self, x):
+        _, (hidden, _) = self.lstm(x.unsqueeze(-1))
+        return self.head(hidden[-1])
+
+
+def _share_arrays(arrays: Dict[str, np.ndarray]) -> tuple:
+    """
+    Copy arrays into new shared memory blocks as float32
+    
+    Returns:
+        (handles, blocks): handles map each name to (block name, shape,
+        dtype) for _attach_shared_arrays; the caller owns the blocks and
+        must close and unlink them. If a block cannot be created (e.g.
+        /dev/shm is full), the ones already created are released first.
+    """
+    handles = {}
+    blocks = []
+    try:
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array, dtype=np.float32)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            blocks.append(block)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            handles[name] = (block.name, array.shape, array.dtype.str)
+    except BaseException:
+        for block in blocks:
+            block.close()
+            block.unlink()
+        raise
+    return handles, blocks
+
+
+def _attach_shared_arrays(handles: Dict[str, tuple]) -> tuple:
+    """
+    Map shared memory blocks created by _share_arrays without copying
+    
+    Returns:
+        (arrays, blocks): the caller closes the blocks when done with the arrays
+    """
+    arrays = {}
+    blocks = []
+    for name, (block_name, shape, dtype) in handles.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    return arrays, blocks
+
+
+def _infer_data_format(path: str) -> str:
+    """Data format from the file extension"""
+    extension = os.path.splitext(path)[1].lower()
+    formats = {'.csv': 'csv', '.parquet': 'parquet', '.pq': 'parquet', '.npy': 'npy', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+    if extension not in formats:
+        raise ValueError(f"Cannot infer data format from extension: {extension}")
+    return formats[extension]
+
+
+def _iter_frame_chunks(path: str, file_format: str, columns: Optional[List[str]], chunk_size: int):
+    """Yield DataFrame chunks of a CSV, JSONL or Parquet file"""
+    if file_format == 'csv':
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunk_size)
+    elif file_format == 'jsonl':
+        for chunk in pd.read_json(path, lines=True, chunksize=chunk_size):
+            yield chunk[columns] if columns else chunk
+    elif file_format == 'parquet':
+        if importlib.util.find_spec("pyarrow") is None:
+            raise ImportError("Reading Parquet requires pyarrow. Install it with: pip install pyarrow")
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+    else:
+        raise ValueError(f"Unsupported data format: {file_format}")
+
+
+def _table_columns(path: str, file_format: str) -> List[str]:
+    """Column names of a CSV, JSONL or Parquet file without reading its rows"""
+    if file_format == 'csv':
+        return list(pd.read_csv(path, nrows=0).columns)
+    if file_format == 'parquet':
+        if importlib.util.find_spec("pyarrow") is None:
+            raise ImportError("Reading Parquet requires pyarrow. Install it with: pip install pyarrow")
+        import pyarrow.parquet as pq
+        return list(pq.ParquetFile(path).schema_arrow.names)
+    return list(next(pd.read_json(path, lines=True, chunksize=1)).columns)
+
+
+def _read_table(path: str, file_format: str, feature_columns: Optional[List], target_column, chunk_size: int) -> tuple:
+    """
+    Read selected columns chunk by chunk
+    
+    Returns:
+        (X, target): float32 feature matrix and the raw target column
+    """
+    if file_format == 'npy':
+        # Memory-mapped, so only the selected columns of each chunk are materialized
+        array = np.load(path, mmap_mode='r')
+        if array.ndim != 2:
+            raise ValueError(f"Expected a 2-D array in {path}, got shape {array.shape}")
+        target_index = -1 if target_column is None else int(target_column)
+        target_index %= array.shape[1]
+        feature_index = (
+            [int(c) for c in feature_columns] if feature_columns
+            else [i for i in range(array.shape[1]) if i != target_index]
+        )
+        X = np.empty((array.shape[0], len(feature_index)), dtype=np.float32)
+        target = np.empty(array.shape[0], dtype=array.dtype)
+        for start in range(0, array.shape[0], chunk_size):
+            rows = array[start:start + chunk_size]
+            X[start:start + len(rows)] = rows[:, feature_index]
+            target[start:start + len(rows)] = rows[:, target_index]
+        return X, target
+        
+    if target_column is None:
+        raise ValueError("target_column is required for CSV, Parquet and JSONL data")
+    if not feature_columns:
+        feature_columns = [c for c in _table_columns(path, file_format) if c != target_column]
+    columns = list(feature_columns) + [target_column]
+    
+    feature_chunks = []
+    target_chunks = []
+    for chunk in _iter_frame_chunks(path, file_format, columns, chunk_size):
+        non_numeric = [c for c in feature_columns if not pd.api.types.is_numeric_dtype(chunk[c])]
+        if non_numeric:
+            raise ValueError(f"Non-numeric feature columns: {', '.join(map(str, non_numeric))}")
+        feature_chunks.append(chunk[feature_columns].to_numpy(dtype=np.float32))
+        target_chunks.append(chunk[target_column].to_numpy())
+        
+    if not feature_chunks:
+        raise ValueError(f"No rows in {path}")
+    return np.concatenate(feature_chunks), np.concatenate(target_chunks)
+
+
+def _encode_target(target: np.ndarray, problem_type: str = 'auto', max_classes: int = 100) -> tuple:
+    """
+    Encode a raw target column and resolve its problem type
+    
+    Class labels (strings, booleans or integer values) become indices
+    0..K-1; regression targets keep their values. "auto" treats string,
+    boolean and integer-valued targets with at most max_classes distinct
+    values as classes and other numeric targets as regression;
+    "classification" picks binary or multiclass from the class count.
+    
+    Args:
+        target: Raw target column
+        problem_type: auto, classification, binary, multiclass or regression
+        max_classes: Most distinct values "auto" accepts as classes
+        
+    Returns:
+        (y, info): float32 target of shape (n, 1) and {"problem_type",
+        "num_classes"} with problem_type binary, multiclass or regression
+        
+    Raises:
+        ValueError: if the target cannot be used for the problem type
+    """
+    if problem_type not in ('auto', 'classification', 'binary', 'multiclass', 'regression'):
+        raise ValueError(f"Unsupported problem_type: {problem_type}")
+        
+    categorical = target.dtype.kind in 'OUSb'
+    if categorical:
+        labels = target.astype(str)
+    else:
+        labels = target.astype(np.float64)
+        if not np.isfinite(labels).all():
+            raise ValueError("Target column contains missing or infinite values")
+    integral = categorical or bool(np.all(labels == np.round(labels)))
+    
+    if problem_type == 'regression' or (problem_type == 'auto' and not integral):
+        if categorical:
+            raise ValueError("problem_type is regression but the target column is not numeric")
+        return labels.astype(np.float32).reshape(-1, 1), {"problem_type": "regression", "num_classes": None}
+        
+    if not integral:
+        raise ValueError(f"problem_type is {problem_type} but the target has non-integer values")
+    classes, indices = np.unique(labels, return_inverse=True)
+    if problem_type == 'auto' and len(classes) > max_classes:
+        raise ValueError(
+            f"Target has {len(classes)} distinct values; set data_config problem_type to "
+            f"'regression' or 'multiclass' (or raise max_classes)"
+        )
+    if len(classes) < 2:
+        raise ValueError("Classification target has a single class")
+    if problem_type == 'binary' and len(classes) > 2:
+        raise ValueError(f"problem_type is binary but the target has {len(classes)} classes")
+        
+    info = {"problem_type": "binary" if len(classes) == 2 else "multiclass", "num_classes": int(len(classes))}
+    return indices.astype(np.float32).reshape(-1, 1), info
+
+
+# Keyword topics of training questions. A question belongs to a topic when
+# one of its words contains a keyword, so prefixed forms (المالي) match too.
+TOPIC_KEYWORDS = {
+    'البرمجة والتطوير': ['برمجة', 'كود'],
+    'الفلسفة والتفكير': ['فلسفة', 'معنى'],
+    'تحليل البيانات': ['تحليل', 'بيانات'],
+    'التحليل المالي': ['مالي', 'استثمار']
+}
+
+# Function words left out of the frequent-term statistics
+PATTERN_STOPWORDS = [
+    'ما', 'ماذا', 'كيف', 'لماذا', 'متى', 'أين', 'هل', 'التي', 'الذي', 'الذين', 'هذا', 'هذه', 'ذلك', 'تلك',
+    'على', 'إلى', 'الى', 'عن', 'مع', 'بين', 'حول', 'كان', 'كانت', 'يكون', 'تكون', 'أن', 'إن', 'أو', 'لكن',
+    'the', 'and', 'for', 'with', 'what', 'how', 'why', 'when', 'which', 'this', 'that', 'are', 'you', 'can'
+]
+
+
+def _corpus_chunk_stats(questions: List[str], responses: List[str]) -> Dict[str, Any]:
+    """
+    Term and topic statistics of one chunk of training data
+    
+    Runs in pattern-analysis worker processes, so it only returns plain
+    dicts and arrays that are cheap to merge.
+    
+    Args:
+        questions: Training questions
+        responses: Training responses, aligned with questions
+        
+    Returns:
+        items, term_df (term -> questions containing it), topic_counts,
+        response_chars and response_words
+    """
+    stats = {"items": len(questions), "term_df": {}, "topic_counts": {topic: 0 for topic in TOPIC_KEYWORDS}}
+    
+    terms = CountVectorizer(token_pattern=r"(?u)\b\w\w\w+\b", stop_words=PATTERN_STOPWORDS, binary=True)
+    try:
+        matrix = terms.fit_transform(questions)
+    except ValueError:
+        # Empty vocabulary: no question has a word of three or more letters
+        matrix = None
+        
+    if matrix is not None:
+        document_frequency = np.asarray(matrix.sum(axis=0)).ravel()
+        stats["term_df"] = dict(zip(terms.get_feature_names_out().tolist(), document_frequency.tolist()))
+        
+        # Keywords are matched against the vocabulary, not every question
+        for topic, keywords in TOPIC_KEYWORDS.items():
+            columns = [column for term, column in terms.vocabulary_.items() if any(k in term for k in keywords)]
+            if columns:
+                stats["topic_counts"][topic] = int((matrix[:, columns].getnnz(axis=1) > 0).sum())
+                
+    # Whitespace word counts: several times faster than tokenizing every response
+    stats["response_words"] = np.fromiter((len(response.split()) for response in responses), dtype=np.int32, count=len(responses))
+    stats["response_chars"] = np.fromiter((len(response) for response in responses), dtype=np.int32, count=len(responses))
+    return stats
+
+
+def _init_training_worker(num_threads: int):
+    """Cap framework threads in a training process so jobs don't oversubscribe cores"""
+    os.environ["OMP_NUM_THREADS"] = str(num_threads)
+    torch.set_num_threads(num_threads)
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(num_threads)
+    except RuntimeError:
+        # TensorFlow was already initialized in this process
+        pass
+
+
+def _run_worker_job(conn, num_threads: int, fn, args: tuple):
+    """Entry point of a training process: run fn(*args) and send the result back"""
+    _init_training_worker(num_threads)
+    try:
+        result = fn(*args)
+    except Exception as e:
+        result = {"success": False, "error": str(e)}
+    conn.send(result)
+    conn.close()
+
+
 # Example usage and configuration
 async def main():
     """Main training function"""
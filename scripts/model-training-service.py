@@ -1,19 +1,24 @@
 import os
 import sys
 import json
+import importlib
 import numpy as np
-import tensorflow as tf
-import torch
-import torch.nn as nn
-import torch.optim as optim
-from torch.utils.data import DataLoader, TensorDataset
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
-import matplotlib.pyplot as plt
 import logging
 from datetime import datetime
 import subprocess
 import argparse
+import time
+import hashlib
+import shutil
+import sqlite3
+import math
+import random
+import copy
+import contextlib
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 # Configure logging
 logging.basicConfig(
@@ -24,6 +29,65 @@ logging.basicConfig(
 
 logger = logging.getLogger("3RBAI-ModelTrainingService")
 
+# Thread limit pinned by the job runner, applied when a framework is first imported
+_THREAD_LIMIT = None
+
+
+def _configure_torch(torch_module):
+    """Apply the pinned thread limit to a freshly imported PyTorch"""
+    if _THREAD_LIMIT:
+        torch_module.set_num_threads(_THREAD_LIMIT)
+        try:
+            torch_module.set_num_interop_threads(_THREAD_LIMIT)
+        except RuntimeError:
+            logger.warning("⚠️ PyTorch inter-op threads already initialized")
+
+
+def _configure_tensorflow(tf_module):
+    """Apply the pinned thread limit to a freshly imported TensorFlow"""
+    if _THREAD_LIMIT:
+        try:
+            tf_module.config.threading.set_intra_op_parallelism_threads(_THREAD_LIMIT)
+            tf_module.config.threading.set_inter_op_parallelism_threads(_THREAD_LIMIT)
+        except RuntimeError:
+            logger.warning("⚠️ TensorFlow runtime already initialized")
+
+
+_IMPORT_HOOKS = {
+    "torch": _configure_torch,
+    "tensorflow": _configure_tensorflow
+}
+_HOOKED_PACKAGES = set()
+
+
+class _LazyModule:
+    """
+    Module proxy that imports on first attribute access
+    
+    TensorFlow and PyTorch take seconds and hundreds of MB to import, so
+    they are only loaded once a code path actually uses them.
+    """
+    
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+            package = self._name.split(".")[0]
+            if package in _IMPORT_HOOKS and package not in _HOOKED_PACKAGES:
+                _HOOKED_PACKAGES.add(package)
+                _IMPORT_HOOKS[package](sys.modules[package])
+        return getattr(self._module, attr)
+
+
+tf = _LazyModule("tensorflow")
+torch = _LazyModule("torch")
+nn = _LazyModule("torch.nn")
+optim = _LazyModule("torch.optim")
+dist = _LazyModule("torch.distributed")
+
 class ModelTrainingService:
     """
     3RBAI Model Training Service
@@ -43,6 +107,9 @@ class ModelTrainingService:
         self.logs_dir = os.path.join(os.getcwd(), "logs")
         os.makedirs(self.logs_dir, exist_ok=True)
         
+        # Preprocessing fitted by the last _prepare_data call, saved with the model
+        self.preprocessing = None
+        
         logger.info("🚀 3RBAI Model Training Service initialized")
         logger.info(f"📂 Models directory: {self.models_dir}")
         logger.info(f"📊 Logs directory: {self.logs_dir}")
@@ -71,16 +138,23 @@ class ModelTrainingService:
             model_type = config.get("model_type", "").lower()
             
             if model_type in ["tensorflow", "keras", "tf"]:
-                return self._train_tensorflow_model(config)
+                result = self._train_tensorflow_model(config)
             elif model_type in ["pytorch", "torch", "pt"]:
-                return self._train_pytorch_model(config)
+                result = self._train_pytorch_model(config)
             elif model_type in ["transformers", "huggingface", "hf"]:
-                return self._train_transformers_model(config)
+                result = self._train_transformers_model(config)
             elif model_type in ["sklearn", "scikit-learn"]:
-                return self._train_sklearn_model(config)
+                result = self._train_sklearn_model(config)
             else:
                 raise ValueError(f"Unsupported model type: {model_type}")
                 
+            # Optional export stage for optimized inference
+            export_config = config.get("export_config", {})
+            if result.get("success") and export_config.get("enabled", False):
+                result["export"] = self._export_trained_model(config, quantize=export_config.get("quantize", False))
+                
+            return result
+                
         except Exception as e:
             logger.error(f"❌ Error training model: {str(e)}")
             return {
@@ -106,7 +180,7 @@ class ModelTrainingService:
                 
         # Validate data configuration
         data_config = config.get("data_config", {})
-        if not data_config.get("data_path") and not data_config.get("generate_data"):
+        if not data_config.get("data_path") and not data_config.get("generate_data") and not data_config.get("cv_data"):
             raise ValueError("Either data_path or generate_data must be specified in data_config")
             
         logger.info("✅ Configuration validated successfully")
@@ -164,16 +238,47 @@ class ModelTrainingService:
         # Setup callbacks
         callbacks = []
         
-        # Model checkpoint
+        # Resume from the last checkpoint of an interrupted run
         model_path = os.path.join(self.models_dir, f"{model_name}.h5")
-        callbacks.append(tf.keras.callbacks.ModelCheckpoint(
-            filepath=model_path,
-            monitor='val_loss',
-            save_best_only=True,
-            mode='min',
-            verbose=1
-        ))
+        checkpoint_dir = os.path.join(self.models_dir, "checkpoints", model_name)
+        config_hash = self._checkpoint_config_hash(config)
+        resume_state = None
+        if training_config.get("resume", True):
+            resume_state = self._load_resume_checkpoint(checkpoint_dir, config_hash, _load_pickle)
+            
+        initial_epoch = 0
+        if resume_state:
+            model.set_weights(resume_state["weights"])
+            try:
+                model.optimizer.build(model.trainable_variables)
+                for variable, value in zip(model.optimizer.variables, resume_state["optimizer"]):
+                    variable.assign(value)
+            except Exception as e:
+                logger.warning(f"⚠️ Optimizer state not restored: {e}")
+            initial_epoch = resume_state["epoch"] + 1
+            logger.info(f"♻️ Resuming {model_name} from epoch {initial_epoch + 1}")
+            
+        # Model checkpoint: snapshots are written on a background thread
+        writer = AsyncCheckpointWriter(
+            _save_pickle,
+            keep_last=training_config.get("keep_checkpoints", 3),
+            retained=self._existing_checkpoints(checkpoint_dir)
+        )
+        checkpoint_callback = self._build_keras_checkpoint_callback(
+            writer, checkpoint_dir, config_hash,
+            checkpoint_every=training_config.get("checkpoint_every", 1),
+            resume_state=resume_state
+        )
+        callbacks.append(checkpoint_callback)
         
+        # Streaming metrics
+        batch_size = training_config.get("batch_size", 32)
+        sink = self._open_metrics_sink(model_name, training_config)
+        if sink:
+            callbacks.append(self._build_keras_metrics_callback(
+                sink, batch_size, training_config.get("log_every_steps", 50)
+            ))
+            
         # Early stopping
         if training_config.get("early_stopping", True):
             callbacks.append(tf.keras.callbacks.EarlyStopping(
@@ -183,22 +288,43 @@ class ModelTrainingService:
                 verbose=1
             ))
             
+        # Optional profiling: phase timers plus a TF profiler trace window
+        profile_config = self._profile_config(training_config)
+        timer = PhaseTimer(enabled=profile_config is not None)
+        if profile_config:
+            callbacks.append(self._build_keras_profiling_callback(timer))
+            
         # TensorBoard
         log_dir = os.path.join(self.logs_dir, f"{model_name}_{datetime.now().strftime('%Y%m%d-%H%M%S')}")
-        callbacks.append(tf.keras.callbacks.TensorBoard(log_dir=log_dir))
+        profile_batch = 0
+        if profile_config and profile_config["trace"]:
+            first = profile_config["wait"] + profile_config["warmup"] + 1
+            profile_batch = (first, first + profile_config["active"] - 1)
+        callbacks.append(tf.keras.callbacks.TensorBoard(log_dir=log_dir, profile_batch=profile_batch))
         
         # Train model
         epochs = training_config.get("epochs", 100)
-        batch_size = training_config.get("batch_size", 32)
         
-        history = model.fit(
-            x_train, y_train,
-            validation_data=(x_val, y_val),
-            epochs=epochs,
-            batch_size=batch_size,
-            callbacks=callbacks,
-            verbose=1
-        )
+        try:
+            model.fit(
+                x_train, y_train,
+                validation_data=(x_val, y_val),
+                epochs=epochs,
+                initial_epoch=initial_epoch,
+                batch_size=batch_size,
+                callbacks=callbacks,
+                verbose=1
+            )
+        finally:
+            writer.close()
+            if sink:
+                sink.close()
+                
+        # Write the best model once, instead of on every improvement
+        if checkpoint_callback.best_weights is not None:
+            model.set_weights(checkpoint_callback.best_weights)
+        model.save(model_path)
+        self._mark_checkpoints_completed(checkpoint_dir)
         
         # Evaluate model
         test_results = model.evaluate(x_test, y_test, verbose=1)
@@ -206,31 +332,43 @@ class ModelTrainingService:
         for i, metric_name in enumerate(model.metrics_names):
             metrics_dict[metric_name] = float(test_results[i])
             
-        # Save training history
+        # Save training history (including epochs from before a resume)
         history_path = os.path.join(self.models_dir, f"{model_name}_history.json")
+        history_dict = checkpoint_callback.history
         with open(history_path, 'w') as f:
-            history_dict = {}
-            for key, value in history.history.items():
-                history_dict[key] = [float(v) for v in value]
             json.dump(history_dict, f)
             
-        # Plot training history
-        self._plot_training_history(history.history, model_name)
+        # Plotting is an offline step (--plot-metrics) unless requested
+        if training_config.get("plot", False):
+            self._plot_training_history(history_dict, model_name)
+        
+        self._save_model_metadata(model_name, "tensorflow", model_architecture, input_shape, output_shape)
         
         logger.info(f"✅ TensorFlow model training completed: {model_name}")
         
-        return {
+        result = {
             "success": True,
             "model_path": model_path,
             "history_path": history_path,
+            "metrics_path": sink.path if sink else None,
             "metrics": metrics_dict,
             "model_type": "tensorflow"
         }
+        if profile_config:
+            result["profile"] = {
+                "phases": timer.summary(),
+                "trace_dir": log_dir if profile_config["trace"] else None
+            }
+            timer.log_table(model_name)
+        return result
     
     def _train_pytorch_model(self, config):
         """
         Train a PyTorch model
         
+        Setting training_config.distributed switches to multi-process
+        DistributedDataParallel training (see _train_pytorch_distributed).
+        
         Args:
             config: Configuration dictionary
             
@@ -239,6 +377,33 @@ class ModelTrainingService:
         """
         logger.info("🔥 Training PyTorch model")
         
+        dist_config = config.get("training_config", {}).get("distributed")
+        if dist_config:
+            return self._train_pytorch_distributed(config, dist_config)
+            
+        return self._pytorch_training_loop(config)
+    
+    def _pytorch_training_loop(self, config, rank=0, world_size=1):
+        """
+        PyTorch training loop shared by single-process and DDP training
+        
+        With world_size > 1 the process group must already be initialized;
+        every rank trains on its own shard of the prepared arrays and only
+        rank 0 writes checkpoints, history and plots.
+        
+        Args:
+            config: Configuration dictionary
+            rank: Global rank of this process
+            world_size: Number of processes taking part in training
+            
+        Returns:
+            dict: Training results
+        """
+        from torch.utils.data import DataLoader, TensorDataset, DistributedSampler
+        from torch.nn.parallel import DistributedDataParallel
+        
+        distributed = world_size > 1
+        
         # Extract configuration
         model_name = config.get("model_name")
         model_config = config.get("model_config", {})
@@ -248,13 +413,13 @@ class ModelTrainingService:
         # Prepare data
         x_train, y_train, x_val, y_val, x_test, y_test = self._prepare_data(data_config)
         
-        # Convert to PyTorch tensors
-        x_train_tensor = torch.FloatTensor(x_train)
-        y_train_tensor = torch.FloatTensor(y_train)
-        x_val_tensor = torch.FloatTensor(x_val)
-        y_val_tensor = torch.FloatTensor(y_val)
-        x_test_tensor = torch.FloatTensor(x_test)
-        y_test_tensor = torch.FloatTensor(y_test)
+        # Convert to PyTorch tensors (copies, so read-only memmaps are fine)
+        x_train_tensor = torch.tensor(x_train, dtype=torch.float32)
+        y_train_tensor = torch.tensor(y_train, dtype=torch.float32)
+        x_val_tensor = torch.tensor(x_val, dtype=torch.float32)
+        y_val_tensor = torch.tensor(y_val, dtype=torch.float32)
+        x_test_tensor = torch.tensor(x_test, dtype=torch.float32)
+        y_test_tensor = torch.tensor(y_test, dtype=torch.float32)
         
         # Create data loaders
         batch_size = training_config.get("batch_size", 32)
@@ -262,23 +427,41 @@ class ModelTrainingService:
         val_dataset = TensorDataset(x_val_tensor, y_val_tensor)
         test_dataset = TensorDataset(x_test_tensor, y_test_tensor)
         
-        train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True)
-        val_loader = DataLoader(val_dataset, batch_size=batch_size)
-        test_loader = DataLoader(test_dataset, batch_size=batch_size)
+        if distributed:
+            # Each rank sees a disjoint shard of every split
+            train_sampler = DistributedSampler(train_dataset, num_replicas=world_size, rank=rank, shuffle=True, seed=42)
+            val_sampler = DistributedSampler(val_dataset, num_replicas=world_size, rank=rank, shuffle=False)
+            test_sampler = DistributedSampler(test_dataset, num_replicas=world_size, rank=rank, shuffle=False)
+            train_loader = DataLoader(train_dataset, batch_size=batch_size, sampler=train_sampler)
+            val_loader = DataLoader(val_dataset, batch_size=batch_size, sampler=val_sampler)
+            test_loader = DataLoader(test_dataset, batch_size=batch_size, sampler=test_sampler)
+        else:
+            train_sampler = None
+            train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True)
+            val_loader = DataLoader(val_dataset, batch_size=batch_size)
+            test_loader = DataLoader(test_dataset, batch_size=batch_size)
         
         # Build model
         model_architecture = model_config.get("architecture", "mlp")
-        input_shape = x_train.shape[1]
+        input_shape = x_train.shape[-1]
         output_shape = y_train.shape[1] if len(y_train.shape) > 1 else 1
         
-        if model_architecture == "mlp":
-            model = self._build_pt_mlp(input_shape, output_shape, model_config)
-        elif model_architecture == "cnn":
-            model = self._build_pt_cnn(input_shape, output_shape, model_config)
-        elif model_architecture == "lstm":
-            model = self._build_pt_lstm(input_shape, output_shape, model_config)
-        else:
-            raise ValueError(f"Unsupported PyTorch architecture: {model_architecture}")
+        model = self._build_pt_architecture(model_architecture, input_shape, output_shape, model_config)
+        
+        # Resume from the last checkpoint of an interrupted run; every rank
+        # loads the same file so DDP starts from identical weights
+        checkpoint_dir = os.path.join(self.models_dir, "checkpoints", model_name)
+        config_hash = self._checkpoint_config_hash(config)
+        resume_state = None
+        if training_config.get("resume", True):
+            resume_state = self._load_resume_checkpoint(checkpoint_dir, config_hash, _load_torch)
+        if resume_state:
+            model.load_state_dict(resume_state["model"])
+            
+        # Unwrapped module, used for checkpoints
+        base_model = model
+        if distributed:
+            model = DistributedDataParallel(model)
             
         # Setup loss and optimizer
         loss_name = model_config.get("loss", "mse")
@@ -301,9 +484,23 @@ class ModelTrainingService:
         else:
             raise ValueError(f"Unsupported optimizer: {optimizer_name}")
             
+        if resume_state:
+            optimizer.load_state_dict(resume_state["optimizer"])
+            
+        def mean_over_ranks(loss_sum, num_batches):
+            """Average per-batch losses over every rank's shard"""
+            if distributed:
+                totals = torch.tensor([loss_sum, float(num_batches)], dtype=torch.float64)
+                dist.all_reduce(totals, op=dist.ReduceOp.SUM)
+                loss_sum, num_batches = totals[0].item(), totals[1].item()
+            return loss_sum / num_batches
+            
         # Training loop
         epochs = training_config.get("epochs", 100)
         patience = training_config.get("patience", 10)
+        model_path = os.path.join(self.models_dir, f"{model_name}.pt")
+        
+        checkpoint_every = training_config.get("checkpoint_every", 1)
         
         best_val_loss = float('inf')
         patience_counter = 0
@@ -311,51 +508,141 @@ class ModelTrainingService:
             "train_loss": [],
             "val_loss": []
         }
-        
-        for epoch in range(epochs):
-            # Training
-            model.train()
-            train_loss = 0.0
-            for inputs, targets in train_loader:
-                optimizer.zero_grad()
-                outputs = model(inputs)
-                loss = criterion(outputs, targets)
-                loss.backward()
-                optimizer.step()
-                train_loss += loss.item()
+        start_epoch = 0
+        if resume_state:
+            start_epoch = resume_state["epoch"] + 1
+            best_val_loss = resume_state["best_val_loss"]
+            patience_counter = resume_state["patience_counter"]
+            history = resume_state["history"]
+            if rank == 0:
+                logger.info(f"♻️ Resuming {model_name} from epoch {start_epoch + 1}")
                 
-            train_loss /= len(train_loader)
-            history["train_loss"].append(train_loss)
+        # Checkpoints are snapshotted in memory and written on a background thread
+        writer = None
+        sink = None
+        if rank == 0:
+            writer = AsyncCheckpointWriter(
+                _save_torch,
+                keep_last=training_config.get("keep_checkpoints", 3),
+                retained=self._existing_checkpoints(checkpoint_dir)
+            )
+            sink = self._open_metrics_sink(model_name, training_config)
+        log_every_steps = training_config.get("log_every_steps", 50)
+        global_step = start_epoch * len(train_loader)
+        
+        # Optional profiling: phase timers plus a torch.profiler trace window
+        profile_config = self._profile_config(training_config)
+        timer = PhaseTimer(enabled=profile_config is not None)
+        profiler = None
+        if profile_config and profile_config["trace"] and rank == 0:
+            profiler = self._start_torch_profiler(model_name, profile_config)
             
-            # Validation
-            model.eval()
-            val_loss = 0.0
-            with torch.no_grad():
-                for inputs, targets in val_loader:
-                    outputs = model(inputs)
-                    loss = criterion(outputs, targets)
-                    val_loss += loss.item()
+        try:
+            for epoch in range(start_epoch, epochs):
+                # Training
+                model.train()
+                if train_sampler is not None:
+                    train_sampler.set_epoch(epoch)
+                train_loss = 0.0
+                epoch_start = time.perf_counter()
+                window_start = epoch_start
+                window_samples = 0
+                window_steps = 0
+                fetch_start = time.perf_counter()
+                for inputs, targets in train_loader:
+                    timer.add("data", time.perf_counter() - fetch_start)
+                    with timer.phase("forward"):
+                        optimizer.zero_grad()
+                        outputs = model(inputs)
+                        loss = criterion(outputs, targets)
+                    with timer.phase("backward"):
+                        loss.backward()
+                    with timer.phase("optimizer"):
+                        optimizer.step()
+                    loss_value = loss.item()
+                    train_loss += loss_value
+                    if profiler is not None:
+                        profiler.step()
                     
-            val_loss /= len(val_loader)
-            history["val_loss"].append(val_loss)
-            
-            logger.info(f"Epoch {epoch+1}/{epochs} - Train Loss: {train_loss:.4f} - Val Loss: {val_loss:.4f}")
-            
-            # Check for early stopping
-            if val_loss < best_val_loss:
-                best_val_loss = val_loss
-                patience_counter = 0
+                    global_step += 1
+                    window_steps += 1
+                    window_samples += len(inputs)
+                    if sink and global_step % log_every_steps == 0:
+                        now = time.perf_counter()
+                        sink.write("step", epoch=epoch + 1, step=global_step, loss=loss_value,
+                                   step_time=(now - window_start) / window_steps,
+                                   samples_per_sec=window_samples / (now - window_start))
+                        window_start, window_samples, window_steps = now, 0, 0
+                    fetch_start = time.perf_counter()
+                    
+                train_loss = mean_over_ranks(train_loss, len(train_loader))
+                history["train_loss"].append(train_loss)
+                train_time = time.perf_counter() - epoch_start
                 
-                # Save best model
-                model_path = os.path.join(self.models_dir, f"{model_name}.pt")
-                torch.save(model.state_dict(), model_path)
-            else:
-                patience_counter += 1
+                # Validation
+                model.eval()
+                val_loss = 0.0
+                with torch.no_grad(), timer.phase("validation"):
+                    for inputs, targets in val_loader:
+                        outputs = model(inputs)
+                        loss = criterion(outputs, targets)
+                        val_loss += loss.item()
+                        
+                val_loss = mean_over_ranks(val_loss, len(val_loader))
+                history["val_loss"].append(val_loss)
+                
+                if rank == 0:
+                    logger.info(f"Epoch {epoch+1}/{epochs} - Train Loss: {train_loss:.4f} - Val Loss: {val_loss:.4f}")
+                if sink:
+                    sink.write("epoch", epoch=epoch + 1, step=global_step, train_loss=train_loss, val_loss=val_loss,
+                               epoch_time=time.perf_counter() - epoch_start,
+                               samples_per_sec=len(train_loader.sampler) / train_time)
                 
-            if patience_counter >= patience:
-                logger.info(f"Early stopping at epoch {epoch+1}")
-                break
+                # Check for early stopping; val_loss is identical on every rank,
+                # so all ranks take the same decision
+                if val_loss < best_val_loss:
+                    best_val_loss = val_loss
+                    patience_counter = 0
+                    
+                    # Save best model
+                    if rank == 0:
+                        writer.submit(copy.deepcopy(base_model.state_dict()), model_path)
+                else:
+                    patience_counter += 1
+                    
+                if rank == 0 and (epoch + 1) % checkpoint_every == 0:
+                    timer.start("checkpoint")
+                    state = {
+                        "epoch": epoch,
+                        "model": copy.deepcopy(base_model.state_dict()),
+                        "optimizer": copy.deepcopy(optimizer.state_dict()),
+                        "best_val_loss": best_val_loss,
+                        "patience_counter": patience_counter,
+                        "history": copy.deepcopy(history)
+                    }
+                    writer.submit(
+                        state,
+                        os.path.join(checkpoint_dir, f"epoch_{epoch + 1:05d}.pt"),
+                        rolling=True,
+                        on_written=self._checkpoint_written_callback(checkpoint_dir, config_hash, epoch)
+                    )
+                    timer.stop("checkpoint")
+                    
+                if patience_counter >= patience:
+                    if rank == 0:
+                        logger.info(f"Early stopping at epoch {epoch+1}")
+                    break
+        finally:
+            if profiler is not None:
+                profiler.stop()
+            if writer is not None:
+                writer.close()
+            if sink:
+                sink.close()
                 
+        if rank == 0:
+            self._mark_checkpoints_completed(checkpoint_dir)
+            
         # Evaluate model
         model.eval()
         test_loss = 0.0
@@ -365,25 +652,103 @@ class ModelTrainingService:
                 loss = criterion(outputs, targets)
                 test_loss += loss.item()
                 
-        test_loss /= len(test_loader)
+        test_loss = mean_over_ranks(test_loss, len(test_loader))
         
         # Save training history
         history_path = os.path.join(self.models_dir, f"{model_name}_history.json")
-        with open(history_path, 'w') as f:
-            json.dump(history, f)
+        if rank == 0:
+            with open(history_path, 'w') as f:
+                json.dump(history, f)
+                
+            # Plotting is an offline step (--plot-metrics) unless requested
+            if training_config.get("plot", False):
+                self._plot_training_history(history, model_name)
+                
+            self._save_model_metadata(model_name, "pytorch", model_architecture, x_train.shape[1:], output_shape)
             
-        # Plot training history
-        self._plot_training_history(history, model_name)
-        
-        logger.info(f"✅ PyTorch model training completed: {model_name}")
+            logger.info(f"✅ PyTorch model training completed: {model_name}")
         
-        return {
+        result = {
             "success": True,
             "model_path": model_path,
             "history_path": history_path,
+            "metrics_path": sink.path if sink else None,
             "metrics": {"test_loss": test_loss},
-            "model_type": "pytorch"
+            "model_type": "pytorch",
+            "world_size": world_size
         }
+        if profile_config:
+            result["profile"] = {
+                "phases": timer.summary(),
+                "top_ops": self._torch_profiler_summary(profiler, profile_config["top_ops"]) if profiler else [],
+                "trace_dir": profiler.trace_dir if profiler else None
+            }
+            if rank == 0:
+                timer.log_table(model_name)
+        return result
+    
+    def _train_pytorch_distributed(self, config, dist_config):
+        """
+        Train a PyTorch model with DistributedDataParallel on CPU (gloo)
+        
+        training_config.distributed keys:
+            nproc_per_node: Processes started on this host (default 2)
+            nnodes: Number of hosts (default 1)
+            node_rank: Rank of this host (default: $NODE_RANK or 0)
+            master_addr / master_port: Rendezvous address of node 0
+            threads_per_process: torch threads per process
+            seed: Seed shared by all ranks (synthetic data and init)
+        
+        On several hosts, run train_model with the same config on every
+        host (only node_rank differs). Processes started by torchrun
+        (RANK/WORLD_SIZE set) join the existing process group directly.
+        
+        Args:
+            config: Configuration dictionary
+            dist_config: The training_config.distributed section
+            
+        Returns:
+            dict: Training results (from rank 0 on the master host)
+        """
+        if "RANK" in os.environ and "WORLD_SIZE" in os.environ:
+            rank = int(os.environ["RANK"])
+            world_size = int(os.environ["WORLD_SIZE"])
+            logger.info(f"🌐 Joining torchrun process group as rank {rank}/{world_size}")
+            _seed_everything(dist_config.get("seed", 42))
+            dist.init_process_group(backend=dist_config.get("backend", "gloo"))
+            try:
+                return self._pytorch_training_loop(config, rank, world_size)
+            finally:
+                dist.destroy_process_group()
+                
+        nproc_per_node = dist_config.get("nproc_per_node", 2)
+        nnodes = dist_config.get("nnodes", 1)
+        node_rank = int(dist_config.get("node_rank", os.environ.get("NODE_RANK", 0)))
+        world_size = nproc_per_node * nnodes
+        
+        logger.info(f"🌐 Starting DDP (gloo): {nnodes} node(s) x {nproc_per_node} processes, node rank {node_rank}")
+        
+        result_path = os.path.join(self.logs_dir, f"{config.get('model_name')}_ddp_result.json")
+        if os.path.exists(result_path):
+            os.remove(result_path)
+            
+        torch.multiprocessing.spawn(
+            _pytorch_ddp_worker,
+            args=(config, dist_config, node_rank, world_size, result_path),
+            nprocs=nproc_per_node,
+            join=True
+        )
+        
+        if node_rank != 0:
+            return {
+                "success": True,
+                "model_type": "pytorch",
+                "world_size": world_size,
+                "note": f"Node {node_rank} finished; results are written by node 0"
+            }
+            
+        with open(result_path, 'r') as f:
+            return json.load(f)
     
     def _train_transformers_model(self, config):
         """
@@ -408,8 +773,7 @@ class ModelTrainingService:
                 }
                 
             # Import required libraries
-            from transformers import AutoModelForSequenceClassification, AutoTokenizer, Trainer, TrainingArguments
-            from datasets import Dataset
+            from transformers import AutoModelForSequenceClassification, AutoTokenizer, Trainer, TrainingArguments, DataCollatorWithPadding
             
             # Extract configuration
             model_name = config.get("model_name")
@@ -432,32 +796,11 @@ class ModelTrainingService:
             if not data_path:
                 raise ValueError("data_path is required for transformers models")
                 
-            with open(data_path, 'r') as f:
-                data = json.load(f)
-                
-            # Prepare datasets
-            train_dataset = Dataset.from_dict({
-                "text": data["train"]["texts"],
-                "label": data["train"]["labels"]
-            })
-            
-            val_dataset = Dataset.from_dict({
-                "text": data["validation"]["texts"],
-                "label": data["validation"]["labels"]
-            })
-            
-            # Tokenize function
-            def tokenize_function(examples):
-                return tokenizer(
-                    examples["text"], 
-                    padding="max_length", 
-                    truncation=True, 
-                    max_length=model_config.get("max_length", 128)
-                )
-                
-            # Tokenize datasets
-            train_dataset = train_dataset.map(tokenize_function, batched=True)
-            val_dataset = val_dataset.map(tokenize_function, batched=True)
+            datasets, tokenize_stats = self._load_tokenized_datasets(
+                data_path, tokenizer, pretrained_model, model_config, data_config
+            )
+            train_dataset = datasets["train"]
+            val_dataset = datasets["validation"]
             
             # Setup training arguments
             output_dir = os.path.join(self.models_dir, model_name)
@@ -474,18 +817,37 @@ class ModelTrainingService:
                 evaluation_strategy="epoch",
                 save_strategy="epoch",
                 load_best_model_at_end=True,
+                # Batch sentences of similar length so dynamic padding stays short
+                group_by_length=training_config.get("group_by_length", True),
+                length_column_name="length",
             )
             
-            # Initialize trainer
+            # Initialize trainer; the collator pads each batch to its longest sentence
             trainer = Trainer(
                 model=model,
                 args=training_args,
                 train_dataset=train_dataset,
                 eval_dataset=val_dataset,
+                data_collator=DataCollatorWithPadding(
+                    tokenizer,
+                    pad_to_multiple_of=model_config.get("pad_to_multiple_of")
+                ),
             )
             
             # Train model
-            trainer.train()
+            train_result = trainer.train()
+            
+            # Throughput in real (unpadded) tokens
+            train_runtime = train_result.metrics.get("train_runtime", 0.0)
+            epochs_run = train_result.metrics.get("epoch", training_args.num_train_epochs)
+            train_tokens = tokenize_stats["train_tokens"] * epochs_run
+            throughput = {
+                "tokenize_tokens_per_second": tokenize_stats["tokens_per_second"],
+                "tokenized_from_cache": tokenize_stats["from_cache"],
+                "train_tokens": int(train_tokens),
+                "train_tokens_per_second": train_tokens / train_runtime if train_runtime else 0.0
+            }
+            logger.info(f"⚡ Training throughput: {throughput['train_tokens_per_second']:.0f} tokens/sec")
             
             # Evaluate model
             eval_results = trainer.evaluate()
@@ -500,6 +862,7 @@ class ModelTrainingService:
                 "success": True,
                 "model_path": output_dir,
                 "metrics": eval_results,
+                "throughput": throughput,
                 "model_type": "transformers"
             }
             
@@ -510,6 +873,124 @@ class ModelTrainingService:
                 "error": str(e)
             }
     
+    def _load_tokenized_datasets(self, data_path, tokenizer, pretrained_model, model_config, data_config):
+        """
+        Tokenize the train/validation splits, reusing an on-disk cache
+        
+        Sentences are truncated but not padded (padding happens per batch in
+        the data collator) and carry a "length" column for length-grouped
+        batching. The tokenized DatasetDict is saved under
+        cache/tokenized/<hash>, where the hash covers the tokenizer settings
+        and the data file bytes, so later runs memory-map it from disk
+        instead of reading and tokenizing the JSON again.
+        
+        Args:
+            data_path: Path to the JSON dataset
+            tokenizer: Hugging Face tokenizer
+            pretrained_model: Name of the pretrained model/tokenizer
+            model_config: Model configuration dictionary
+            data_config: Data configuration dictionary
+            
+        Returns:
+            tuple: (DatasetDict with train/validation, tokenization stats dict)
+        """
+        from datasets import Dataset, DatasetDict, load_from_disk
+        
+        max_length = model_config.get("max_length", 128)
+        
+        # Key the cache on the tokenizer and the exact data bytes
+        digest = hashlib.sha256()
+        digest.update(json.dumps({
+            "pretrained_model": pretrained_model,
+            "tokenizer_class": type(tokenizer).__name__,
+            "vocab_size": tokenizer.vocab_size,
+            "max_length": max_length
+        }, sort_keys=True).encode("utf-8"))
+        with open(data_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+                
+        cache_root = data_config.get("cache_dir", os.path.join(os.getcwd(), "cache", "tokenized"))
+        cache_path = os.path.join(cache_root, digest.hexdigest()[:32])
+        
+        if os.path.isdir(cache_path):
+            logger.info(f"♻️ Loading tokenized dataset from cache: {cache_path}")
+            try:
+                datasets = load_from_disk(cache_path)
+                return datasets, {
+                    "from_cache": True,
+                    "train_tokens": int(sum(datasets["train"]["length"])),
+                    "tokens_per_second": 0.0
+                }
+            except Exception as e:
+                # An unreadable cache entry is a miss; it is rebuilt below
+                logger.warning(f"⚠️ Tokenized dataset cache unreadable, re-tokenizing: {e}")
+                shutil.rmtree(cache_path, ignore_errors=True)
+                
+        with open(data_path, 'r') as f:
+            data = json.load(f)
+            
+        datasets = DatasetDict({
+            "train": Dataset.from_dict({
+                "text": data["train"]["texts"],
+                "label": data["train"]["labels"]
+            }),
+            "validation": Dataset.from_dict({
+                "text": data["validation"]["texts"],
+                "label": data["validation"]["labels"]
+            })
+        })
+        del data
+        
+        # Tokenize function
+        def tokenize_function(examples):
+            encoded = tokenizer(
+                examples["text"], 
+                truncation=True, 
+                max_length=max_length
+            )
+            encoded["length"] = [len(ids) for ids in encoded["input_ids"]]
+            return encoded
+            
+        # Worker processes only pay off on larger datasets
+        num_rows = len(datasets["train"])
+        num_proc = data_config.get("tokenize_num_proc", min(os.cpu_count() or 1, max(1, num_rows // 10000)))
+        
+        tokenize_start = time.perf_counter()
+        datasets = datasets.map(
+            tokenize_function,
+            batched=True,
+            num_proc=num_proc if num_proc > 1 else None,
+            remove_columns=["text"]
+        )
+        tokenize_time = time.perf_counter() - tokenize_start
+        
+        train_tokens = int(sum(datasets["train"]["length"]))
+        total_tokens = train_tokens + int(sum(datasets["validation"]["length"]))
+        tokens_per_second = total_tokens / tokenize_time if tokenize_time else 0.0
+        logger.info(f"🔤 Tokenized {total_tokens} tokens with {num_proc} process(es): {tokens_per_second:.0f} tokens/sec")
+        
+        # Save next to the cache entry and move it into place, so an
+        # interrupted save never leaves a partial entry behind
+        os.makedirs(cache_root, exist_ok=True)
+        tmp_path = f"{cache_path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        try:
+            datasets.save_to_disk(tmp_path)
+            os.replace(tmp_path, cache_path)
+            logger.info(f"💾 Tokenized dataset cached at {cache_path}")
+        except OSError as e:
+            # Another run cached the same data first, or the disk is full
+            logger.warning(f"⚠️ Tokenized dataset not cached: {e}")
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        
+        return datasets, {
+            "from_cache": False,
+            "train_tokens": train_tokens,
+            "tokens_per_second": tokens_per_second
+        }
+    
     def _train_sklearn_model(self, config):
         """
         Train a scikit-learn model
@@ -533,15 +1014,13 @@ class ModelTrainingService:
                 }
                 
             # Import required libraries
-            from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
-            from sklearn.linear_model import LogisticRegression
-            from sklearn.svm import SVC
             from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
             import joblib
             
             # Extract configuration
             model_name = config.get("model_name")
             model_config = config.get("model_config", {})
+            training_config = config.get("training_config", {})
             data_config = config.get("data_config", {})
             
             # Prepare data
@@ -553,45 +1032,27 @@ class ModelTrainingService:
                 y_val = y_val.ravel()
                 y_test = y_test.ravel()
                 
+            # Train on a subset of rows (the resource budget for search trials);
+            # the rows are already shuffled by the train/test split
+            train_fraction = training_config.get("train_fraction", 1.0)
+            if train_fraction < 1.0:
+                num_rows = max(1, int(len(x_train) * train_fraction))
+                x_train = x_train[:num_rows]
+                y_train = y_train[:num_rows]
+                
             # Build model
-            algorithm = model_config.get("algorithm", "random_forest")
-            
-            if algorithm == "random_forest":
-                model = RandomForestClassifier(
-                    n_estimators=model_config.get("n_estimators", 100),
-                    max_depth=model_config.get("max_depth", None),
-                    random_state=42
-                )
-            elif algorithm == "gradient_boosting":
-                model = GradientBoostingClassifier(
-                    n_estimators=model_config.get("n_estimators", 100),
-                    learning_rate=model_config.get("learning_rate", 0.1),
-                    max_depth=model_config.get("max_depth", 3),
-                    random_state=42
-                )
-            elif algorithm == "logistic_regression":
-                model = LogisticRegression(
-                    C=model_config.get("C", 1.0),
-                    max_iter=model_config.get("max_iter", 100),
-                    random_state=42
-                )
-            elif algorithm == "svm":
-                model = SVC(
-                    C=model_config.get("C", 1.0),
-                    kernel=model_config.get("kernel", "rbf"),
-                    probability=True,
-                    random_state=42
-                )
-            else:
-                raise ValueError(f"Unsupported scikit-learn algorithm: {algorithm}")
+            model = self._build_sklearn_model(model_config, len(x_train))
                 
             # Train model
+            fit_start = time.perf_counter()
             model.fit(x_train, y_train)
+            fit_time = time.perf_counter() - fit_start
             
             # Evaluate model
             y_pred = model.predict(x_test)
             
             metrics = {
+                "val_accuracy": float(accuracy_score(y_val, model.predict(x_val))),
                 "accuracy": float(accuracy_score(y_test, y_pred)),
                 "precision": float(precision_score(y_test, y_pred, average="weighted")),
                 "recall": float(recall_score(y_test, y_pred, average="weighted")),
@@ -602,12 +1063,15 @@ class ModelTrainingService:
             model_path = os.path.join(self.models_dir, f"{model_name}.joblib")
             joblib.dump(model, model_path)
             
+            self._save_model_metadata(model_name, "sklearn", model_config.get("algorithm", "random_forest"), x_train.shape[1:], 1)
+            
             logger.info(f"✅ scikit-learn model training completed: {model_name}")
             
             return {
                 "success": True,
                 "model_path": model_path,
                 "metrics": metrics,
+                "fit_time_seconds": fit_time,
                 "model_type": "sklearn"
             }
             
@@ -618,162 +1082,716 @@ class ModelTrainingService:
                 "error": str(e)
             }
     
-    def _prepare_data(self, data_config):
+    def _sklearn_n_jobs(self, model_config):
         """
-        Prepare data for training
+        Number of parallel jobs for scikit-learn estimators
+        
+        Defaults to the thread limit pinned by the job runner (OMP_NUM_THREADS)
+        so parallel jobs do not oversubscribe the machine, otherwise all cores.
+        """
+        if "n_jobs" in model_config:
+            return model_config["n_jobs"]
+        return int(os.environ.get("OMP_NUM_THREADS", -1))
+    
+    def _build_sklearn_model(self, model_config, num_rows):
+        """
+        Build a scikit-learn estimator
         
         Args:
-            data_config: Data configuration dictionary
+            model_config: Model configuration dictionary
+            num_rows: Number of training rows (selects the gradient boosting backend)
             
         Returns:
-            tuple: (x_train, y_train, x_val, y_val, x_test, y_test)
+            Unfitted estimator
         """
-        # Check if we should generate synthetic data
-        if data_config.get("generate_data", False):
-            return self._generate_synthetic_data(data_config)
-            
-        # Load data from file
-        data_path = data_config.get("data_path")
-        if not data_path:
-            raise ValueError("data_path is required when generate_data is False")
-            
-        # Load data based on file type
-        file_ext = os.path.splitext(data_path)[1].lower()
-        
-        if file_ext == ".csv":
-            import pandas as pd
-            df = pd.read_csv(data_path)
-        elif file_ext == ".json":
-            import pandas as pd
-            df = pd.read_json(data_path)
-        elif file_ext in [".npy", ".npz"]:
-            data = np.load(data_path)
-            if file_ext == ".npz":
-                x = data["x"]
-                y = data["y"]
-            else:
-                # Assume the first 80% of the data is x and the rest is y
-                split_idx = int(data.shape[0] * 0.8)
-                x = data[:split_idx]
-                y = data[split_idx:]
-        else:
-            raise ValueError(f"Unsupported data file format: {file_ext}")
-            
-        # If we loaded a DataFrame, extract features and target
-        if "df" in locals():
-            target_column = data_config.get("target_column")
-            if not target_column:
-                raise ValueError("target_column is required for CSV/JSON data")
-                
-            feature_columns = data_config.get("feature_columns")
-            if not feature_columns:
-                # Use all columns except target as features
-                feature_columns = [col for col in df.columns if col != target_column]
-                
-            x = df[feature_columns].values
-            y = df[target_column].values
-            
-        # Split data
-        test_size = data_config.get("test_size", 0.2)
-        val_size = data_config.get("val_size", 0.2)
-        
-        # First split: training + validation vs test
-        x_train_val, x_test, y_train_val, y_test = train_test_split(
-            x, y, test_size=test_size, random_state=42
-        )
+        from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier, HistGradientBoostingClassifier
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.svm import SVC
         
-        # Second split: training vs validation
-        # Adjust validation size to account for the test split
-        adjusted_val_size = val_size / (1 - test_size)
-        x_train, x_val, y_train, y_val = train_test_split(
-            x_train_val, y_train_val, test_size=adjusted_val_size, random_state=42
-        )
+        algorithm = model_config.get("algorithm", "random_forest")
         
-        # Normalize data if specified
-        if data_config.get("normalize", True):
-            scaler = StandardScaler()
-            x_train = scaler.fit_transform(x_train)
-            x_val = scaler.transform(x_val)
-            x_test = scaler.transform(x_test)
-            
-        # Reshape data if needed for specific model types
-        if data_config.get("reshape_for_lstm", False):
-            # Reshape for LSTM: (samples, timesteps, features)
-            timesteps = data_config.get("timesteps", 10)
-            x_train = x_train.reshape(x_train.shape[0], timesteps, -1)
-            x_val = x_val.reshape(x_val.shape[0], timesteps, -1)
-            x_test = x_test.reshape(x_test.shape[0], timesteps, -1)
+        # The histogram implementation is much faster from ~10k rows up
+        if algorithm == "gradient_boosting" and model_config.get("histogram", num_rows >= 10000):
+            algorithm = "hist_gradient_boosting"
             
-        # Reshape y if needed
-        if data_config.get("one_hot_encode_target", False):
-            from tensorflow.keras.utils import to_categorical
-            num_classes = data_config.get("num_classes")
-            if not num_classes:
-                num_classes = len(np.unique(y))
-                
-            y_train = to_categorical(y_train, num_classes=num_classes)
-            y_val = to_categorical(y_val, num_classes=num_classes)
-            y_test = to_categorical(y_test, num_classes=num_classes)
+        if algorithm == "random_forest":
+            model = RandomForestClassifier(
+                n_estimators=model_config.get("n_estimators", 100),
+                max_depth=model_config.get("max_depth", None),
+                n_jobs=self._sklearn_n_jobs(model_config),
+                random_state=42
+            )
+        elif algorithm == "gradient_boosting":
+            model = GradientBoostingClassifier(
+                n_estimators=model_config.get("n_estimators", 100),
+                learning_rate=model_config.get("learning_rate", 0.1),
+                max_depth=model_config.get("max_depth", 3),
+                random_state=42
+            )
+        elif algorithm == "hist_gradient_boosting":
+            model = HistGradientBoostingClassifier(
+                max_iter=model_config.get("n_estimators", 100),
+                learning_rate=model_config.get("learning_rate", 0.1),
+                max_depth=model_config.get("max_depth", None),
+                max_bins=model_config.get("max_bins", 255),
+                early_stopping=model_config.get("early_stopping", "auto"),
+                random_state=42
+            )
+        elif algorithm == "logistic_regression":
+            model = LogisticRegression(
+                C=model_config.get("C", 1.0),
+                max_iter=model_config.get("max_iter", 100),
+                random_state=42
+            )
+        elif algorithm == "svm":
+            # probability=True runs an internal 5-fold calibration, so only on request
+            model = SVC(
+                C=model_config.get("C", 1.0),
+                kernel=model_config.get("kernel", "rbf"),
+                probability=model_config.get("probability", False),
+                random_state=42
+            )
+        else:
+            raise ValueError(f"Unsupported scikit-learn algorithm: {algorithm}")
             
-        return x_train, y_train, x_val, y_val, x_test, y_test
+        return model
     
-    def _generate_synthetic_data(self, data_config):
+    def benchmark_sklearn(self, num_samples=50000, num_features=20):
         """
-        Generate synthetic data for training
+        Compare fit time and accuracy of the scikit-learn backends
+        
+        All variants train on the same synthetic dataset.
         
         Args:
-            data_config: Data configuration dictionary
+            num_samples: Number of synthetic rows
+            num_features: Number of synthetic features
             
         Returns:
-            tuple: (x_train, y_train, x_val, y_val, x_test, y_test)
+            list: One dict per variant with fit time and test accuracy
         """
-        logger.info("🧪 Generating synthetic data")
+        from sklearn.metrics import accuracy_score
         
-        # Get data dimensions
-        num_samples = data_config.get("num_samples", 1000)
-        num_features = data_config.get("num_features", 10)
-        num_classes = data_config.get("num_classes", 2)
+        logger.info(f"⏱️ Benchmarking scikit-learn backends on {num_samples} x {num_features}")
         
-        # Generate features
-        x = np.random.randn(num_samples, num_features)
+        x_train, y_train, _, _, x_test, y_test = self._generate_synthetic_data({
+            "num_samples": num_samples,
+            "num_features": num_features
+        })
+        y_train = y_train.ravel()
+        y_test = y_test.ravel()
         
-        # Generate target
-        if data_config.get("problem_type") == "regression":
-            # Simple linear relationship with noise
-            weights = np.random.randn(num_features)
-            y = np.dot(x, weights) + np.random.randn(num_samples) * 0.1
-            y = y.reshape(-1, 1)  # Reshape for consistency
-        else:
-            # Classification
-            if num_classes == 2:
-                # Binary classification
-                weights = np.random.randn(num_features)
-                logits = np.dot(x, weights)
-                y = (logits > 0).astype(int)
-            else:
-                # Multi-class classification
-                y = np.random.randint(0, num_classes, size=num_samples)
-                
-                # One-hot encode if specified
-                if data_config.get("one_hot_encode_target", False):
-                    from tensorflow.keras.utils import to_categorical
-                    y = to_categorical(y, num_classes=num_classes)
-                    
-        # Split data
-        test_size = data_config.get("test_size", 0.2)
-        val_size = data_config.get("val_size", 0.2)
+        # Kernel SVMs scale quadratically, keep them on a bounded subset
+        svm_rows = min(len(x_train), 10000)
+        
+        variants = [
+            ("random_forest n_jobs=1", {"algorithm": "random_forest", "n_jobs": 1}, None),
+            ("random_forest n_jobs=-1", {"algorithm": "random_forest", "n_jobs": -1}, None),
+            ("gradient_boosting", {"algorithm": "gradient_boosting", "histogram": False}, None),
+            ("hist_gradient_boosting", {"algorithm": "hist_gradient_boosting"}, None),
+            ("svm probability=True", {"algorithm": "svm", "probability": True}, svm_rows),
+            ("svm probability=False", {"algorithm": "svm", "probability": False}, svm_rows)
+        ]
+        
+        results = []
+        for name, model_config, max_rows in variants:
+            rows = max_rows or len(x_train)
+            model = self._build_sklearn_model(model_config, rows)
+            
+            fit_start = time.perf_counter()
+            model.fit(x_train[:rows], y_train[:rows])
+            fit_time = time.perf_counter() - fit_start
+            
+            accuracy = float(accuracy_score(y_test, model.predict(x_test)))
+            results.append({
+                "variant": name,
+                "train_rows": rows,
+                "fit_time_seconds": round(fit_time, 3),
+                "accuracy": round(accuracy, 4)
+            })
+            logger.info(f"   {name:<26} rows={rows:<7} fit={fit_time:8.3f}s accuracy={accuracy:.4f}")
+            
+        return results
+    
+    def _save_model_metadata(self, model_name, model_type, architecture, input_shape, output_shape):
+        """
+        Write {model_name}_meta.json next to the model artifact
+        
+        Records what is needed to rebuild and export the model without
+        the training data, and saves the fitted preprocessing next to it.
+        """
+        preprocessing_path = None
+        if self.preprocessing is not None:
+            preprocessing_path = self.preprocessing.save(os.path.join(self.models_dir, f"{model_name}_preprocessing.npz"))
+            
+        meta_path = os.path.join(self.models_dir, f"{model_name}_meta.json")
+        with open(meta_path, 'w') as f:
+            json.dump({
+                "model_name": model_name,
+                "model_type": model_type,
+                "architecture": architecture,
+                "input_shape": [int(dim) for dim in (input_shape if isinstance(input_shape, (tuple, list)) else [input_shape])],
+                "output_shape": int(output_shape),
+                "preprocessing_path": preprocessing_path
+            }, f, indent=2)
+        return meta_path
+    
+    def _load_preprocessing(self, model_name):
+        """Load {model_name}_preprocessing.npz, or None for models trained without it"""
+        preprocessing_path = os.path.join(self.models_dir, f"{model_name}_preprocessing.npz")
+        if not os.path.exists(preprocessing_path):
+            logger.warning(f"⚠️ No preprocessing saved for {model_name}, inputs are used as-is")
+            return None
+        return PreprocessingPipeline.load(preprocessing_path)
+    
+    def _load_model_metadata(self, model_name):
+        """Read the metadata written by _save_model_metadata"""
+        meta_path = os.path.join(self.models_dir, f"{model_name}_meta.json")
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"Model metadata not found: {meta_path}. Retrain the model to create it.")
+        with open(meta_path, 'r') as f:
+            return json.load(f)
+    
+    def export_model(self, config_path, quantize=False):
+        """
+        Export a trained model to an optimized inference format
+        
+        Args:
+            config_path: Path to the JSON configuration the model was trained with
+            quantize: Apply dynamic int8 quantization
+            
+        Returns:
+            dict: Export results
+        """
+        try:
+            with open(config_path, 'r') as f:
+                config = json.load(f)
+            return self._export_trained_model(config, quantize)
+        except Exception as e:
+            logger.error(f"❌ Error exporting model: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
+    def _export_trained_model(self, config, quantize=False):
+        """
+        Export a trained model
+        
+        - PyTorch: frozen TorchScript (optimize_for_inference), dynamic int8 for Linear/LSTM
+        - TensorFlow: TFLite flatbuffer, dynamic-range int8 via Optimize.DEFAULT
+        - scikit-learn: ONNX via skl2onnx, run by onnxruntime
+        
+        Args:
+            config: Configuration dictionary
+            quantize: Apply dynamic int8 quantization
+            
+        Returns:
+            dict: Export results
+        """
+        model_name = config.get("model_name")
+        meta = self._load_model_metadata(model_name)
+        model_type = meta["model_type"]
+        suffix = "_int8" if quantize else ""
+        
+        logger.info(f"📦 Exporting {model_type} model {model_name}{' (int8)' if quantize else ''}")
+        
+        if model_type == "pytorch":
+            model = self._load_original_model(config, meta)
+            if quantize:
+                model = torch.ao.quantization.quantize_dynamic(model, {nn.Linear, nn.LSTM}, dtype=torch.qint8)
+                
+            example = torch.zeros(1, *meta["input_shape"])
+            with torch.no_grad():
+                scripted = torch.jit.trace(model, example)
+            scripted = torch.jit.freeze(scripted)
+            try:
+                scripted = torch.jit.optimize_for_inference(scripted)
+            except Exception as e:
+                logger.warning(f"⚠️ optimize_for_inference skipped: {e}")
+                
+            export_path = os.path.join(self.models_dir, f"{model_name}{suffix}.torchscript.pt")
+            scripted.save(export_path)
+            export_format = "torchscript"
+            
+        elif model_type == "tensorflow":
+            model = self._load_original_model(config, meta)
+            converter = tf.lite.TFLiteConverter.from_keras_model(model)
+            converter.target_spec.supported_ops = [
+                tf.lite.OpsSet.TFLITE_BUILTINS,
+                tf.lite.OpsSet.SELECT_TF_OPS
+            ]
+            if quantize:
+                converter.optimizations = [tf.lite.Optimize.DEFAULT]
+                
+            export_path = os.path.join(self.models_dir, f"{model_name}{suffix}.tflite")
+            with open(export_path, 'wb') as f:
+                f.write(converter.convert())
+            export_format = "tflite"
+            
+        elif model_type == "sklearn":
+            import importlib
+            if importlib.util.find_spec("skl2onnx") is None:
+                logger.error("❌ skl2onnx library not found. Please install it with: pip install skl2onnx onnxruntime")
+                return {
+                    "success": False,
+                    "error": "skl2onnx library not installed"
+                }
+                
+            from skl2onnx import to_onnx
+            
+            model = self._load_original_model(config, meta)
+            if quantize:
+                logger.warning("⚠️ int8 quantization is not applied to scikit-learn models")
+                
+            onnx_model = to_onnx(
+                model,
+                np.zeros((1, *meta["input_shape"]), dtype=np.float32),
+                options={id(model): {"zipmap": False}} if hasattr(model, "predict_proba") else None
+            )
+            export_path = os.path.join(self.models_dir, f"{model_name}.onnx")
+            with open(export_path, 'wb') as f:
+                f.write(onnx_model.SerializeToString())
+            export_format = "onnx"
+            
+        else:
+            raise ValueError(f"Export is not supported for model type: {model_type}")
+            
+        logger.info(f"✅ Exported {model_name} to {export_path}")
+        
+        return {
+            "success": True,
+            "export_path": export_path,
+            "preprocessing_path": meta.get("preprocessing_path"),
+            "format": export_format,
+            "quantized": bool(quantize and model_type != "sklearn"),
+            "size_bytes": os.path.getsize(export_path)
+        }
+    
+    def _load_original_model(self, config, meta):
+        """Load the model exactly as saved by the training run"""
+        model_name = config.get("model_name")
+        model_type = meta["model_type"]
+        
+        if model_type == "pytorch":
+            model = self._build_pt_architecture(
+                meta["architecture"], meta["input_shape"][-1], meta["output_shape"], config.get("model_config", {})
+            )
+            state_dict = torch.load(os.path.join(self.models_dir, f"{model_name}.pt"), map_location="cpu")
+            model.load_state_dict(state_dict)
+            model.eval()
+            return model
+        elif model_type == "tensorflow":
+            return tf.keras.models.load_model(os.path.join(self.models_dir, f"{model_name}.h5"), compile=False)
+        elif model_type == "sklearn":
+            import joblib
+            return joblib.load(os.path.join(self.models_dir, f"{model_name}.joblib"))
+        else:
+            raise ValueError(f"Unsupported model type: {model_type}")
+    
+    def benchmark_inference(self, config_path, num_requests=200, quantize=False):
+        """
+        Compare single-request latency of the original and exported model
+        
+        Args:
+            config_path: Path to the JSON configuration the model was trained with
+            num_requests: Number of single-row predictions to time
+            quantize: Benchmark the int8 export
+            
+        Returns:
+            dict: Load time and latency percentiles for both runtimes
+        """
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+        meta = self._load_model_metadata(config.get("model_name"))
+        
+        export = self._export_trained_model(config, quantize)
+        if not export.get("success"):
+            return export
+            
+        rows = np.random.randn(num_requests, 1, *meta["input_shape"]).astype(np.float32)
+        
+        def time_requests(predict_fn):
+            latencies = []
+            for row in rows:
+                start = time.perf_counter()
+                predict_fn(row)
+                latencies.append((time.perf_counter() - start) * 1000)
+            return {
+                "p50_ms": float(np.percentile(latencies, 50)),
+                "p95_ms": float(np.percentile(latencies, 95)),
+                "p99_ms": float(np.percentile(latencies, 99))
+            }
+            
+        load_start = time.perf_counter()
+        original = self._load_original_model(config, meta)
+        original_load_ms = (time.perf_counter() - load_start) * 1000
+        
+        if meta["model_type"] == "pytorch":
+            def original_predict(x):
+                with torch.no_grad():
+                    return original(torch.from_numpy(x)).numpy()
+        elif meta["model_type"] == "tensorflow":
+            def original_predict(x):
+                return original.predict(x, verbose=0)
+        else:
+            original_predict = original.predict
+            
+        predictor = InferencePredictor(export["export_path"])
+        
+        # One warm-up call each so lazy initialization is not timed
+        original_predict(rows[0])
+        predictor.predict(rows[0])
+        
+        original_stats = time_requests(original_predict)
+        exported_stats = time_requests(predictor.predict)
+        original_stats["load_ms"] = original_load_ms
+        exported_stats["load_ms"] = predictor.load_time_ms
+        
+        speedup = original_stats["p50_ms"] / exported_stats["p50_ms"] if exported_stats["p50_ms"] else 0.0
+        logger.info(f"⏱️ p50 latency: original {original_stats['p50_ms']:.3f} ms, "
+                    f"exported {exported_stats['p50_ms']:.3f} ms ({speedup:.1f}x)")
+        
+        return {
+            "model_name": config.get("model_name"),
+            "export": export,
+            "original": original_stats,
+            "exported": exported_stats,
+            "p50_speedup": speedup
+        }
+    
+    def predict(self, config_path, input_path, output_path=None, batch_size=1024, workers=None):
+        """
+        Score an input file with a trained model in streamed batches
+        
+        The model saved by the training run (.pt/.h5/.joblib) is loaded with
+        its preprocessing ({model_name}_preprocessing.npz) and the input
+        is read batch by batch, so files larger than memory can be scored.
+        scikit-learn batches run on a process pool; PyTorch and TensorFlow
+        batches run on threads, as both release the GIL inside their kernels.
+        Predictions are written in input order as batches complete.
+        
+        Args:
+            config_path: Path to the JSON configuration the model was trained with
+            input_path: .npy, .csv or .jsonl file with the feature rows
+            output_path: .csv or .npy predictions file (default: <input>_predictions.csv)
+            batch_size: Rows per inference batch
+            workers: Parallel inference workers (default: CPU count)
+            
+        Returns:
+            dict: Row count, timings and rows/sec, or success False with the error
+        """
+        try:
+            with open(config_path, 'r') as f:
+                config = json.load(f)
+            return self._predict_file(config, input_path, output_path, batch_size, workers)
+        except Exception as e:
+            logger.error(f"❌ Error scoring {input_path}: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
+    def _predict_file(self, config, input_path, output_path, batch_size, workers):
+        """Batch inference behind predict(); raises on failure"""
+        model_name = config.get("model_name")
+        meta = self._load_model_metadata(model_name)
+        model_type = meta["model_type"]
+        if model_type not in ["pytorch", "tensorflow", "sklearn"]:
+            raise ValueError(f"Unsupported model type for batch inference: {model_type}")
+            
+        output_path = output_path or f"{os.path.splitext(input_path)[0]}_predictions.csv"
+        workers = workers or os.cpu_count() or 1
+        preprocessing = self._load_preprocessing(model_name)
+        if preprocessing is None:
+            preprocessing = PreprocessingPipeline(input_shape=meta["input_shape"])
+            
+        # Tabular inputs are read with the training column order
+        data_config = config.get("data_config", {})
+        batches = _iter_input_batches(
+            input_path, batch_size,
+            feature_columns=preprocessing.feature_columns or data_config.get("feature_columns"),
+            target_column=preprocessing.target_column or data_config.get("target_column")
+        )
+        
+        logger.info(f"🔮 Scoring {input_path} with {model_name} ({model_type}, {workers} workers, batch {batch_size})")
+        
+        load_start = time.perf_counter()
+        thread_cap = contextlib.nullcontext()
+        if model_type == "sklearn":
+            model_path = os.path.join(self.models_dir, f"{model_name}.joblib")
+            executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_predict_worker,
+                initargs=(model_path, preprocessing)
+            )
+            # Start the workers (and load the model in each) before timing
+            list(executor.map(_predict_worker_ready, range(workers)))
+            predict_batch = _predict_worker_batch
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+            # Threads share one model. PyTorch gives every calling thread its
+            # own OpenMP team, so ops run single-threaded for the duration of
+            # the run; TensorFlow ops already share one intra-op pool
+            if model_type == "pytorch":
+                thread_cap = _torch_thread_limit(1)
+            model = self._load_original_model(config, meta)
+            executor = ThreadPoolExecutor(max_workers=workers)
+            
+            def predict_batch(x):
+                x = preprocessing.transform(x)
+                if model_type == "pytorch":
+                    with torch.no_grad():
+                        return model(torch.from_numpy(x)).numpy()
+                return model(x, training=False).numpy()
+        load_time = time.perf_counter() - load_start
+        
+        writer = PredictionWriter(output_path)
+        num_rows = 0
+        start = time.perf_counter()
+        try:
+            with thread_cap, executor:
+                # Bounded in-flight window keeps memory flat and output ordered
+                pending = []
+                for x in batches:
+                    pending.append(executor.submit(predict_batch, x))
+                    if len(pending) >= workers * 2:
+                        predictions = pending.pop(0).result()
+                        writer.write(predictions)
+                        num_rows += len(predictions)
+                for future in pending:
+                    predictions = future.result()
+                    writer.write(predictions)
+                    num_rows += len(predictions)
+        finally:
+            writer.close()
+        elapsed = time.perf_counter() - start
+        
+        rows_per_sec = num_rows / elapsed if elapsed > 0 else 0.0
+        logger.info(f"✅ Scored {num_rows} rows in {elapsed:.2f}s ({rows_per_sec:,.0f} rows/sec) -> {output_path}")
+        
+        return {
+            "success": True,
+            "model_name": model_name,
+            "model_type": model_type,
+            "output_path": output_path,
+            "rows": num_rows,
+            "batch_size": batch_size,
+            "workers": workers,
+            "normalized": preprocessing.mean is not None,
+            "load_seconds": round(load_time, 3),
+            "seconds": round(elapsed, 3),
+            "rows_per_sec": round(rows_per_sec, 1)
+        }
+    
+    def _prepare_data(self, data_config):
+        """
+        Prepare data for training
+        
+        Args:
+            data_config: Data configuration dictionary
+            
+        Returns:
+            tuple: (x_train, y_train, x_val, y_val, x_test, y_test)
+        """
+        from sklearn.model_selection import train_test_split
+        from sklearn.preprocessing import StandardScaler
+        
+        self.preprocessing = None
         
-        # First split: training + validation vs test
-        x_train_val, x_test, y_train_val, y_test = train_test_split(
-            x, y, test_size=test_size, random_state=42
+        if data_config.get("cv_data"):
+            # One fold of a cross-validation run (see CrossValidation)
+            x_train, y_train, x_val, y_val, x_test, y_test = self._cv_fold_split(data_config)
+            feature_columns = data_config["cv_data"].get("feature_columns")
+        else:
+            # Check if we should generate synthetic data
+            if data_config.get("generate_data", False):
+                return self._generate_synthetic_data(data_config)
+                
+            x, y, feature_columns = self._load_raw_data(data_config)
+            
+            # Split data
+            test_size = data_config.get("test_size", 0.2)
+            val_size = data_config.get("val_size", 0.2)
+            
+            # First split: training + validation vs test
+            x_train_val, x_test, y_train_val, y_test = train_test_split(
+                x, y, test_size=test_size, random_state=42
+            )
+            
+            # Second split: training vs validation
+            # Adjust validation size to account for the test split
+            adjusted_val_size = val_size / (1 - test_size)
+            x_train, x_val, y_train, y_val = train_test_split(
+                x_train_val, y_train_val, test_size=adjusted_val_size, random_state=42
+            )
+            
+        # Normalize data if specified
+        scaler = None
+        if data_config.get("normalize", True):
+            scaler = StandardScaler()
+            x_train = scaler.fit_transform(x_train)
+            x_val = scaler.transform(x_val)
+            x_test = scaler.transform(x_test)
+            
+        # Reshape data if needed for specific model types
+        if data_config.get("reshape_for_lstm", False):
+            # Reshape for LSTM: (samples, timesteps, features)
+            timesteps = data_config.get("timesteps", 10)
+            x_train = x_train.reshape(x_train.shape[0], timesteps, -1)
+            x_val = x_val.reshape(x_val.shape[0], timesteps, -1)
+            x_test = x_test.reshape(x_test.shape[0], timesteps, -1)
+            
+        # Reshape y if needed
+        if data_config.get("one_hot_encode_target", False):
+            num_classes = data_config.get("num_classes")
+            if not num_classes:
+                num_classes = len(np.unique(np.concatenate([y_train, y_val, y_test])))
+                
+            y_train = _one_hot(y_train, num_classes)
+            y_val = _one_hot(y_val, num_classes)
+            y_test = _one_hot(y_test, num_classes)
+            
+        self.preprocessing = PreprocessingPipeline(
+            mean=scaler.mean_ if scaler is not None else None,
+            scale=scaler.scale_ if scaler is not None else None,
+            input_shape=x_train.shape[1:],
+            feature_columns=feature_columns,
+            target_column=data_config.get("target_column")
         )
         
-        # Second split: training vs validation
-        # Adjust validation size to account for the test split
-        adjusted_val_size = val_size / (1 - test_size)
-        x_train, x_val, y_train, y_val = train_test_split(
-            x_train_val, y_train_val, test_size=adjusted_val_size, random_state=42
+        return x_train, y_train, x_val, y_val, x_test, y_test
+    
+    def _cv_fold_split(self, data_config):
+        """
+        Split the shared cross-validation arrays for one fold
+        
+        The held-out fold becomes the test split; the last val_size share of
+        the remaining (already shuffled) rows is the validation split used
+        for early stopping. The arrays are memory-mapped, so only the rows
+        of this fold's splits are copied into the worker.
+        
+        Args:
+            data_config: Data configuration with a cv_data section
+            
+        Returns:
+            tuple: (x_train, y_train, x_val, y_val, x_test, y_test)
+        """
+        cv_data = data_config["cv_data"]
+        x = np.load(os.path.join(cv_data["dir"], "x.npy"), mmap_mode="r")
+        y = np.load(os.path.join(cv_data["dir"], "y.npy"), mmap_mode="r")
+        folds = np.load(os.path.join(cv_data["dir"], "folds.npy"), mmap_mode="r")
+        
+        test_rows = np.flatnonzero(folds == cv_data["fold"])
+        rest_rows = np.flatnonzero(folds != cv_data["fold"])
+        num_val = max(1, int(len(rest_rows) * data_config.get("val_size", 0.2)))
+        train_rows, val_rows = rest_rows[:-num_val], rest_rows[-num_val:]
+        
+        return x[train_rows], y[train_rows], x[val_rows], y[val_rows], x[test_rows], y[test_rows]
+    
+    def _load_raw_data(self, data_config):
+        """
+        Load features and target from data_config.data_path, unsplit
+        
+        Args:
+            data_config: Data configuration dictionary
+            
+        Returns:
+            tuple: (x, y, feature_columns); feature_columns is None for NumPy files
+        """
+        feature_columns = None
+        
+        # Load data from file
+        data_path = data_config.get("data_path")
+        if not data_path:
+            raise ValueError("data_path is required when generate_data is False")
+            
+        # Load data based on file type
+        file_ext = os.path.splitext(data_path)[1].lower()
+        
+        if file_ext == ".csv":
+            import pandas as pd
+            df = pd.read_csv(data_path)
+        elif file_ext == ".json":
+            import pandas as pd
+            df = pd.read_json(data_path)
+        elif file_ext in [".npy", ".npz"]:
+            data = np.load(data_path)
+            if file_ext == ".npz":
+                x = data["x"]
+                y = data["y"]
+            else:
+                # Assume the first 80% of the data is x and the rest is y
+                split_idx = int(data.shape[0] * 0.8)
+                x = data[:split_idx]
+                y = data[split_idx:]
+        else:
+            raise ValueError(f"Unsupported data file format: {file_ext}")
+            
+        # If we loaded a DataFrame, extract features and target
+        if "df" in locals():
+            target_column = data_config.get("target_column")
+            if not target_column:
+                raise ValueError("target_column is required for CSV/JSON data")
+                
+            feature_columns = data_config.get("feature_columns")
+            if not feature_columns:
+                # Use all columns except target as features
+                feature_columns = [col for col in df.columns if col != target_column]
+                
+            x = df[feature_columns].values
+            y = df[target_column].values
+            
+        return x, y, feature_columns
+    
+    def _generate_synthetic_data(self, data_config):
+        """
+        Generate synthetic data for training
+        
+        Rows come from SyntheticDataGenerator, so the data is float32, has
+        learnable structure for every problem type and is reproducible from
+        data_config.seed. Large datasets (or memmap=true) are written chunk by
+        chunk to memory-mapped .npy files under cache/synthetic and reused on
+        later runs; the splits are contiguous views, never copies.
+        
+        Args:
+            data_config: Data configuration dictionary
+            
+        Returns:
+            tuple: (x_train, y_train, x_val, y_val, x_test, y_test)
+        """
+        logger.info("🧪 Generating synthetic data")
+        
+        # Get data dimensions
+        num_samples = data_config.get("num_samples", 1000)
+        num_features = data_config.get("num_features", 10)
+        generator = SyntheticDataGenerator(
+            num_features=num_features,
+            problem_type=data_config.get("problem_type", "classification"),
+            num_classes=data_config.get("num_classes", 2),
+            seed=data_config.get("seed", 42),
+            noise=data_config.get("noise", 0.1),
+            one_hot=data_config.get("one_hot_encode_target", False)
         )
+        chunk_size = data_config.get("chunk_size", 100000)
+        
+        use_memmap = data_config.get("memmap", num_samples * num_features * 4 > 512 * 1024 * 1024)
+        if use_memmap:
+            cache_root = data_config.get("cache_dir", os.path.join(os.getcwd(), "cache", "synthetic"))
+            x, y = generator.write_memmap(cache_root, num_samples, chunk_size)
+        else:
+            x, y = generator.generate(num_samples, chunk_size)
+            
+        # Rows are i.i.d., so contiguous slices are unbiased splits
+        test_size = data_config.get("test_size", 0.2)
+        val_size = data_config.get("val_size", 0.2)
+        num_test = int(num_samples * test_size)
+        num_val = int(num_samples * val_size)
+        num_train = num_samples - num_val - num_test
+        
+        x_train, y_train = x[:num_train], y[:num_train]
+        x_val, y_val = x[num_train:num_train + num_val], y[num_train:num_train + num_val]
+        x_test, y_test = x[num_train + num_val:], y[num_train + num_val:]
         
         # Reshape data if needed for specific model types
         if data_config.get("reshape_for_lstm", False):
@@ -783,4 +1801,2467 @@ class ModelTrainingService:
             
             x_train = x_train.reshape(x_train.shape[0], timesteps, features_per_timestep)
             x_val = x_val.reshape(x_val.shape[0], timesteps, features_per_timestep)
-            x_test = x_test.reshape(x_test.shape[0], timesteps, features_per_
+            x_test = x_test.reshape(x_test.shape[0], timesteps, features_per_timestep)
+            
+        # Synthetic rows are already standardized; only the reshape applies
+        self.preprocessing = PreprocessingPipeline(input_shape=x_train.shape[1:])
+        
+        return x_train, y_train, x_val, y_val, x_test, y_test
+    
+    def benchmark_synthetic(self, num_samples=1000000, num_features=20, chunk_size=100000, output_dir=None):
+        """
+        Measure synthetic data throughput, streamed and written to memmap
+        
+        Args:
+            num_samples: Number of rows to generate
+            num_features: Number of features per row
+            chunk_size: Rows per generated chunk
+            output_dir: Memmap cache directory (default: cache/synthetic)
+            
+        Returns:
+            dict: Rows/sec for streaming and for memmap output
+        """
+        generator = SyntheticDataGenerator(num_features=num_features, problem_type="classification", num_classes=4)
+        logger.info(f"⏱️ Benchmarking synthetic generation of {num_samples} x {num_features}")
+        
+        start = time.perf_counter()
+        for x, y in generator.iter_batches(num_samples, chunk_size):
+            pass
+        stream_time = time.perf_counter() - start
+        
+        output_dir = output_dir or os.path.join(os.getcwd(), "cache", "synthetic")
+        start = time.perf_counter()
+        x, y = generator.write_memmap(output_dir, num_samples, chunk_size, overwrite=True)
+        memmap_time = time.perf_counter() - start
+        
+        return {
+            "num_samples": num_samples,
+            "num_features": num_features,
+            "chunk_size": chunk_size,
+            "stream_rows_per_sec": round(num_samples / stream_time, 1),
+            "memmap_rows_per_sec": round(num_samples / memmap_time, 1),
+            "memmap_path": x.filename,
+            "peak_rss_mb": round(_current_rss_mb(), 1)
+        }
+    
+    def _checkpoint_config_hash(self, config):
+        """
+        Hash of the settings a checkpoint depends on
+        
+        training_config is left out so epochs/patience can change between
+        a run and its resume.
+        """
+        relevant = {key: config.get(key) for key in ["model_type", "model_config", "data_config"]}
+        return hashlib.sha256(json.dumps(relevant, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    
+    def _existing_checkpoints(self, checkpoint_dir):
+        """Rolling epoch checkpoints already on disk, oldest first"""
+        if not os.path.isdir(checkpoint_dir):
+            return []
+        return [
+            os.path.join(checkpoint_dir, name) for name in sorted(os.listdir(checkpoint_dir))
+            if name.startswith("epoch_") and not name.endswith(".tmp")
+        ]
+    
+    def _load_resume_checkpoint(self, checkpoint_dir, config_hash, load_fn):
+        """
+        Load the latest checkpoint of an unfinished run with the same config
+        
+        Args:
+            checkpoint_dir: Directory holding the run's checkpoints
+            config_hash: Hash from _checkpoint_config_hash
+            load_fn: Callable reading a checkpoint file
+            
+        Returns:
+            dict or None: The checkpoint state, or None to start from scratch
+        """
+        latest_path = os.path.join(checkpoint_dir, "latest.json")
+        if not os.path.exists(latest_path):
+            return None
+            
+        with open(latest_path, 'r') as f:
+            latest = json.load(f)
+            
+        if latest.get("completed"):
+            return None
+        if latest.get("config_hash") != config_hash:
+            logger.warning("⚠️ Checkpoint was written with a different config, starting from scratch")
+            return None
+        if not os.path.exists(latest.get("path", "")):
+            return None
+            
+        return load_fn(latest["path"])
+    
+    def _checkpoint_written_callback(self, checkpoint_dir, config_hash, epoch):
+        """Return a callback that points latest.json at a freshly written checkpoint"""
+        def on_written(path):
+            _atomic_write_json(os.path.join(checkpoint_dir, "latest.json"), {
+                "epoch": epoch,
+                "path": path,
+                "config_hash": config_hash,
+                "completed": False
+            })
+        return on_written
+    
+    def _mark_checkpoints_completed(self, checkpoint_dir):
+        """Flag the run as finished so the next train_model starts fresh"""
+        latest_path = os.path.join(checkpoint_dir, "latest.json")
+        if os.path.exists(latest_path):
+            with open(latest_path, 'r') as f:
+                latest = json.load(f)
+            latest["completed"] = True
+            _atomic_write_json(latest_path, latest)
+    
+    def _build_keras_checkpoint_callback(self, writer, checkpoint_dir, config_hash, checkpoint_every, resume_state):
+        """
+        Keras callback that snapshots weights in memory and hands them to
+        an AsyncCheckpointWriter instead of blocking on HDF5 writes
+        
+        Tracks the best weights (by val_loss) and the full history across
+        resumes; a resumable checkpoint with optimizer state is queued
+        every checkpoint_every epochs.
+        """
+        service = self
+        
+        class AsyncCheckpoint(tf.keras.callbacks.Callback):
+            def __init__(self):
+                super().__init__()
+                self.best = resume_state["best_val_loss"] if resume_state else float('inf')
+                self.best_weights = resume_state.get("best_weights") if resume_state else None
+                self.history = resume_state["history"] if resume_state else {}
+                
+            def on_epoch_end(self, epoch, logs=None):
+                logs = logs or {}
+                for key, value in logs.items():
+                    self.history.setdefault(key, []).append(float(value))
+                    
+                weights = None
+                val_loss = logs.get("val_loss")
+                if val_loss is not None and val_loss < self.best:
+                    self.best = float(val_loss)
+                    weights = self.model.get_weights()
+                    self.best_weights = weights
+                    
+                if (epoch + 1) % checkpoint_every == 0:
+                    state = {
+                        "epoch": epoch,
+                        "weights": weights if weights is not None else self.model.get_weights(),
+                        "optimizer": [variable.numpy() for variable in self.model.optimizer.variables],
+                        "best_val_loss": self.best,
+                        "best_weights": self.best_weights,
+                        "history": copy.deepcopy(self.history)
+                    }
+                    writer.submit(
+                        state,
+                        os.path.join(checkpoint_dir, f"epoch_{epoch + 1:05d}.pkl"),
+                        rolling=True,
+                        on_written=service._checkpoint_written_callback(checkpoint_dir, config_hash, epoch)
+                    )
+                    
+        return AsyncCheckpoint()
+    
+    def _open_metrics_sink(self, model_name, training_config):
+        """Open the streaming metrics sink unless training_config disables it"""
+        if not training_config.get("metrics_sink", True):
+            return None
+        return MetricsSink(os.path.join(self.logs_dir, f"{model_name}_metrics.jsonl"), model_name)
+    
+    def _build_keras_metrics_callback(self, sink, batch_size, log_every_steps):
+        """
+        Keras callback streaming step and epoch records to a MetricsSink
+        
+        Step records carry Keras' running loss and the mean step time over
+        the last log_every_steps batches.
+        """
+        class StreamingMetrics(tf.keras.callbacks.Callback):
+            def __init__(self):
+                super().__init__()
+                self.global_step = 0
+                
+            def on_epoch_begin(self, epoch, logs=None):
+                self.epoch = epoch
+                self.epoch_start = time.perf_counter()
+                self.window_start = self.epoch_start
+                self.window_steps = 0
+                self.epoch_steps = 0
+                
+            def on_train_batch_end(self, batch, logs=None):
+                self.global_step += 1
+                self.window_steps += 1
+                self.epoch_steps += 1
+                if self.global_step % log_every_steps == 0:
+                    now = time.perf_counter()
+                    elapsed = now - self.window_start
+                    sink.write("step", epoch=self.epoch + 1, step=self.global_step,
+                               loss=float((logs or {}).get("loss", float("nan"))),
+                               step_time=elapsed / self.window_steps,
+                               samples_per_sec=self.window_steps * batch_size / elapsed)
+                    self.window_start, self.window_steps = now, 0
+                    
+            def on_epoch_end(self, epoch, logs=None):
+                epoch_time = time.perf_counter() - self.epoch_start
+                values = {key: float(value) for key, value in (logs or {}).items()}
+                sink.write("epoch", epoch=epoch + 1, step=self.global_step, epoch_time=epoch_time,
+                           samples_per_sec=self.epoch_steps * batch_size / epoch_time, **values)
+                
+        return StreamingMetrics()
+    
+    def _profile_config(self, training_config):
+        """
+        Normalize training_config.profile
+        
+        Accepts true or a dict with trace (bool), wait/warmup/active (steps
+        of the trace window) and top_ops (operators in the summary).
+        
+        Returns:
+            dict or None: Profiling settings, or None when profiling is off
+        """
+        profile = training_config.get("profile", False)
+        if not profile:
+            return None
+        if profile is True:
+            profile = {}
+        return {
+            "trace": profile.get("trace", True),
+            "wait": profile.get("wait", 1),
+            "warmup": profile.get("warmup", 1),
+            "active": profile.get("active", 5),
+            "top_ops": profile.get("top_ops", 10)
+        }
+    
+    def _start_torch_profiler(self, model_name, profile_config):
+        """Start a torch.profiler session tracing the configured window of steps"""
+        from torch.profiler import profile, schedule, ProfilerActivity, tensorboard_trace_handler
+        
+        trace_dir = os.path.join(self.logs_dir, "profile", model_name)
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+            
+        profiler = profile(
+            activities=activities,
+            schedule=schedule(
+                wait=profile_config["wait"],
+                warmup=profile_config["warmup"],
+                active=profile_config["active"],
+                repeat=1
+            ),
+            on_trace_ready=tensorboard_trace_handler(trace_dir),
+            record_shapes=True
+        )
+        profiler.trace_dir = trace_dir
+        profiler.start()
+        logger.info(f"🔬 Profiling steps {profile_config['wait'] + profile_config['warmup'] + 1}-"
+                    f"{profile_config['wait'] + profile_config['warmup'] + profile_config['active']} into {trace_dir}")
+        return profiler
+    
+    def _torch_profiler_summary(self, profiler, top):
+        """Top operators of a finished torch.profiler session by self CPU time"""
+        try:
+            events = profiler.key_averages()
+        except (AssertionError, RuntimeError):
+            # The run ended before the trace window was reached
+            return []
+            
+        events = sorted(events, key=lambda event: event.self_cpu_time_total, reverse=True)[:top]
+        return [
+            {
+                "op": event.key,
+                "calls": event.count,
+                "self_cpu_ms": event.self_cpu_time_total / 1000.0,
+                "cpu_total_ms": event.cpu_time_total / 1000.0
+            }
+            for event in events
+        ]
+    
+    def _build_keras_profiling_callback(self, timer):
+        """
+        Keras callback feeding a PhaseTimer
+        
+        fit() fuses forward, backward and the optimizer into one train step,
+        so the Keras phases are data (time between steps, including input
+        pipeline and callbacks), train_step and validation.
+        """
+        class PhaseProfiling(tf.keras.callbacks.Callback):
+            def on_epoch_begin(self, epoch, logs=None):
+                self.batch_end = time.perf_counter()
+                
+            def on_train_batch_begin(self, batch, logs=None):
+                now = time.perf_counter()
+                timer.add("data", now - self.batch_end)
+                self.batch_start = now
+                
+            def on_train_batch_end(self, batch, logs=None):
+                self.batch_end = time.perf_counter()
+                timer.add("train_step", self.batch_end - self.batch_start)
+                
+            def on_test_begin(self, logs=None):
+                timer.start("validation")
+                
+            def on_test_end(self, logs=None):
+                timer.stop("validation")
+                
+        return PhaseProfiling()
+    
+    def plot_metrics(self, metrics_path):
+        """
+        Offline plot of the epoch records in a metrics sink file
+        
+        Records of a resumed run are appended to the same file; the latest
+        record for each epoch wins.
+        
+        Args:
+            metrics_path: Path to a *_metrics.jsonl file
+            
+        Returns:
+            str: Path of the saved plot
+        """
+        records = {}
+        model_name = None
+        for record in MetricsSink.read(metrics_path):
+            if record.get("kind") == "epoch":
+                records[record["epoch"]] = record
+                model_name = record.get("model_name")
+                
+        if not records:
+            raise ValueError(f"No epoch records in {metrics_path}")
+            
+        skip = {"kind", "model_name", "run_id", "time", "epoch", "step", "epoch_time", "samples_per_sec", "rss_mb"}
+        history = {}
+        for epoch in sorted(records):
+            for key, value in records[epoch].items():
+                if key not in skip:
+                    history.setdefault(key, []).append(value)
+                    
+        return self._plot_training_history(history, model_name)
+    
+    def _build_tf_mlp(self, input_shape, output_shape, model_config):
+        """Build a TensorFlow/Keras Multi-Layer Perceptron"""
+        hidden_layers = model_config.get("hidden_layers", [64, 32])
+        activation = model_config.get("activation", "relu")
+        dropout_rate = model_config.get("dropout_rate", 0.2)
+        
+        model = tf.keras.Sequential()
+        model.add(tf.keras.layers.Input(shape=input_shape))
+        
+        for units in hidden_layers:
+            model.add(tf.keras.layers.Dense(units, activation=activation))
+            if dropout_rate > 0:
+                model.add(tf.keras.layers.Dropout(dropout_rate))
+                
+        model.add(tf.keras.layers.Dense(output_shape, activation=model_config.get("output_activation", "linear")))
+        return model
+    
+    def _build_tf_cnn(self, input_shape, output_shape, model_config):
+        """Build a TensorFlow/Keras 1D CNN"""
+        filters = model_config.get("filters", [64, 32])
+        kernel_sizes = model_config.get("kernel_sizes", [3, 3])
+        pool_sizes = model_config.get("pool_sizes", [2, 2])
+        activation = model_config.get("activation", "relu")
+        
+        model = tf.keras.Sequential()
+        model.add(tf.keras.layers.Input(shape=input_shape))
+        
+        # Flat feature vectors are treated as a single-channel sequence
+        if len(input_shape) == 1:
+            model.add(tf.keras.layers.Reshape((input_shape[0], 1)))
+            
+        for f, k, p in zip(filters, kernel_sizes, pool_sizes):
+            model.add(tf.keras.layers.Conv1D(filters=f, kernel_size=k, activation=activation, padding='same'))
+            model.add(tf.keras.layers.MaxPooling1D(pool_size=p))
+            
+        model.add(tf.keras.layers.Flatten())
+        model.add(tf.keras.layers.Dense(64, activation=activation))
+        model.add(tf.keras.layers.Dense(output_shape, activation=model_config.get("output_activation", "linear")))
+        return model
+    
+    def _build_tf_lstm(self, input_shape, output_shape, model_config):
+        """Build a TensorFlow/Keras LSTM"""
+        lstm_units = model_config.get("lstm_units", [64, 32])
+        dropout_rate = model_config.get("dropout_rate", 0.2)
+        
+        model = tf.keras.Sequential()
+        model.add(tf.keras.layers.Input(shape=input_shape))
+        
+        for i, units in enumerate(lstm_units):
+            return_sequences = i < len(lstm_units) - 1
+            model.add(tf.keras.layers.LSTM(units, return_sequences=return_sequences, dropout=dropout_rate))
+            
+        model.add(tf.keras.layers.Dense(output_shape, activation=model_config.get("output_activation", "linear")))
+        return model
+    
+    def _build_pt_architecture(self, architecture, input_shape, output_shape, model_config):
+        """Build the PyTorch model selected by model_config.architecture"""
+        if architecture == "mlp":
+            return self._build_pt_mlp(input_shape, output_shape, model_config)
+        elif architecture == "cnn":
+            return self._build_pt_cnn(input_shape, output_shape, model_config)
+        elif architecture == "lstm":
+            return self._build_pt_lstm(input_shape, output_shape, model_config)
+        else:
+            raise ValueError(f"Unsupported PyTorch architecture: {architecture}")
+    
+    def _pt_activation(self, name):
+        """Map an activation name from the config to a PyTorch module"""
+        activations = {
+            "relu": nn.ReLU,
+            "tanh": nn.Tanh,
+            "sigmoid": nn.Sigmoid,
+            "gelu": nn.GELU,
+            "leaky_relu": nn.LeakyReLU
+        }
+        if name not in activations:
+            raise ValueError(f"Unsupported activation: {name}")
+        return activations[name]()
+    
+    def _pt_output_layers(self, in_features, output_shape, model_config):
+        """Build the PyTorch output head, honouring output_activation"""
+        layers = [nn.Linear(in_features, output_shape)]
+        if model_config.get("output_activation", "linear") == "sigmoid":
+            layers.append(nn.Sigmoid())
+        return layers
+    
+    def _build_pt_mlp(self, input_shape, output_shape, model_config):
+        """Build a PyTorch Multi-Layer Perceptron"""
+        hidden_layers = model_config.get("hidden_layers", [64, 32])
+        activation = model_config.get("activation", "relu")
+        dropout_rate = model_config.get("dropout_rate", 0.2)
+        
+        layers = []
+        in_features = input_shape
+        for units in hidden_layers:
+            layers.append(nn.Linear(in_features, units))
+            layers.append(self._pt_activation(activation))
+            if dropout_rate > 0:
+                layers.append(nn.Dropout(dropout_rate))
+            in_features = units
+            
+        layers.extend(self._pt_output_layers(in_features, output_shape, model_config))
+        return nn.Sequential(*layers)
+    
+    def _build_pt_cnn(self, input_shape, output_shape, model_config):
+        """Build a PyTorch 1D CNN over the feature vector"""
+        filters = model_config.get("filters", [64, 32])
+        kernel_sizes = model_config.get("kernel_sizes", [3, 3])
+        pool_sizes = model_config.get("pool_sizes", [2, 2])
+        activation = model_config.get("activation", "relu")
+        
+        # (batch, features) -> (batch, 1, features)
+        layers = [nn.Unflatten(1, (1, input_shape))]
+        in_channels = 1
+        length = input_shape
+        for f, k, p in zip(filters, kernel_sizes, pool_sizes):
+            layers.append(nn.Conv1d(in_channels, f, kernel_size=k, padding=k // 2))
+            layers.append(self._pt_activation(activation))
+            layers.append(nn.MaxPool1d(p))
+            in_channels = f
+            length = length // p
+            
+        layers.append(nn.Flatten())
+        layers.append(nn.Linear(in_channels * length, 64))
+        layers.append(self._pt_activation(activation))
+        layers.extend(self._pt_output_layers(64, output_shape, model_config))
+        return nn.Sequential(*layers)
+    
+    def _build_pt_lstm(self, input_shape, output_shape, model_config):
+        """Build a PyTorch LSTM that predicts from the last timestep"""
+        lstm_units = model_config.get("lstm_units", [64, 32])
+        dropout_rate = model_config.get("dropout_rate", 0.2)
+        head = nn.Sequential(*self._pt_output_layers(lstm_units[-1], output_shape, model_config))
+        
+        class LSTMRegressor(nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.lstms = nn.ModuleList()
+                in_features = input_shape
+                for units in lstm_units:
+                    self.lstms.append(nn.LSTM(in_features, units, batch_first=True))
+                    in_features = units
+                self.dropout = nn.Dropout(dropout_rate)
+                self.head = head
+                
+            def forward(self, x):
+                if x.dim() == 2:
+                    x = x.unsqueeze(-1)
+                for lstm in self.lstms:
+                    x, _ = lstm(x)
+                    x = self.dropout(x)
+                return self.head(x[:, -1, :])
+                
+        return LSTMRegressor()
+    
+    def _plot_training_history(self, history, model_name):
+        """
+        Plot training history and save it next to the training logs
+        
+        Args:
+            history: Dictionary of metric name -> per-epoch values
+            model_name: Name of the model
+            
+        Returns:
+            str: Path of the saved plot
+        """
+        import matplotlib.pyplot as plt
+        
+        loss_keys = [key for key in history if "loss" in key]
+        other_keys = [key for key in history if "loss" not in key]
+        
+        plt.figure(figsize=(12, 5))
+        
+        plt.subplot(1, 2, 1)
+        for key in loss_keys:
+            plt.plot(history[key], label=key)
+        plt.title('Model Loss')
+        plt.ylabel('Loss')
+        plt.xlabel('Epoch')
+        plt.legend(loc='upper right')
+        
+        if other_keys:
+            plt.subplot(1, 2, 2)
+            for key in other_keys:
+                plt.plot(history[key], label=key)
+            plt.title('Model Metrics')
+            plt.xlabel('Epoch')
+            plt.legend(loc='lower right')
+            
+        plt.tight_layout()
+        
+        plot_path = os.path.join(self.logs_dir, f"{model_name}_history.png")
+        plt.savefig(plot_path)
+        plt.close()
+        
+        logger.info(f"📊 Training history plot saved to {plot_path}")
+        return plot_path
+
+
+class InferencePredictor:
+    """
+    Lightweight predictor for exported models
+    
+    Loads a TorchScript (.torchscript.pt), TFLite (.tflite) or ONNX (.onnx)
+    artifact produced by ModelTrainingService.export_model and only imports
+    the runtime that artifact needs. With a preprocessing file, raw feature
+    rows are normalized and reshaped before inference.
+    """
+    
+    def __init__(self, export_path, preprocessing_path=None):
+        """
+        Load an exported model
+        
+        Args:
+            export_path: Path to the exported artifact
+            preprocessing_path: Optional {model_name}_preprocessing.npz to apply in predict
+        """
+        self.export_path = export_path
+        start = time.perf_counter()
+        self.preprocessing = PreprocessingPipeline.load(preprocessing_path) if preprocessing_path else None
+        
+        if export_path.endswith(".torchscript.pt"):
+            import torch as torch_runtime
+            self.runtime = "torchscript"
+            self._torch = torch_runtime
+            self.module = torch_runtime.jit.load(export_path, map_location="cpu")
+            self.module.eval()
+        elif export_path.endswith(".tflite"):
+            try:
+                from tflite_runtime.interpreter import Interpreter
+            except ImportError:
+                Interpreter = tf.lite.Interpreter
+            self.runtime = "tflite"
+            self.interpreter = Interpreter(model_path=export_path)
+            self.interpreter.allocate_tensors()
+            self.input_index = self.interpreter.get_input_details()[0]["index"]
+            self.output_index = self.interpreter.get_output_details()[0]["index"]
+            self.input_shape = None
+        elif export_path.endswith(".onnx"):
+            import onnxruntime
+            self.runtime = "onnx"
+            options = onnxruntime.SessionOptions()
+            options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            self.session = onnxruntime.InferenceSession(export_path, options, providers=["CPUExecutionProvider"])
+            self.input_name = self.session.get_inputs()[0].name
+        else:
+            raise ValueError(f"Unsupported export format: {export_path}")
+            
+        self.load_time_ms = (time.perf_counter() - start) * 1000
+        logger.info(f"⚡ Loaded {self.runtime} predictor in {self.load_time_ms:.1f} ms")
+        
+    def predict(self, x):
+        """
+        Run inference
+        
+        Args:
+            x: Input array with a leading batch dimension
+            
+        Returns:
+            np.ndarray: Model outputs
+        """
+        if self.preprocessing is not None:
+            x = self.preprocessing.transform(x)
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        
+        if self.runtime == "torchscript":
+            with self._torch.inference_mode():
+                return self.module(self._torch.from_numpy(x)).numpy()
+        elif self.runtime == "tflite":
+            if self.input_shape != x.shape:
+                self.interpreter.resize_tensor_input(self.input_index, x.shape)
+                self.interpreter.allocate_tensors()
+                self.input_shape = x.shape
+            self.interpreter.set_tensor(self.input_index, x)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self.output_index)
+        else:
+            return self.session.run(None, {self.input_name: x})[0]
+
+
+# Heavy backends each model_type is allowed to load
+_HEAVY_BACKENDS = ["tensorflow", "torch", "transformers", "datasets", "sklearn", "matplotlib"]
+_EXPECTED_BACKENDS = {
+    "sklearn": {"sklearn"},
+    "pytorch": {"torch", "sklearn", "matplotlib"},
+    "tensorflow": {"tensorflow", "sklearn", "matplotlib"},
+    "transformers": {"transformers", "datasets", "torch"}
+}
+_STARTUP_PROBE_MARKER = "STARTUP_PROBE "
+
+
+def _startup_probe(model_type, launched_at):
+    """
+    Child side of benchmark_startup: time a minimal job of one model_type
+    
+    Prints one marker line with the timings and the heavy backends that
+    ended up in sys.modules.
+    """
+    module_ready = time.time()
+    
+    if model_type == "transformers":
+        # Training needs a pretrained download; time the backend import only
+        start = time.perf_counter()
+        importlib.import_module("transformers")
+        importlib.import_module("datasets")
+        first_job_seconds = time.perf_counter() - start
+        success = True
+    else:
+        config = {
+            "model_type": model_type,
+            "model_name": f"startup_probe_{model_type}",
+            "model_config": {"hidden_layers": [8], "n_estimators": 5},
+            "training_config": {"epochs": 1, "batch_size": 64},
+            "data_config": {"generate_data": True, "num_samples": 256, "num_features": 8}
+        }
+        config_path = os.path.join(os.getcwd(), "startup_probe.json")
+        with open(config_path, 'w') as f:
+            json.dump(config, f)
+            
+        start = time.perf_counter()
+        result = ModelTrainingService().train_model(config_path)
+        first_job_seconds = time.perf_counter() - start
+        success = bool(result.get("success"))
+        
+    print(_STARTUP_PROBE_MARKER + json.dumps({
+        "model_type": model_type,
+        "success": success,
+        "interpreter_and_module_seconds": module_ready - launched_at,
+        "first_job_seconds": first_job_seconds,
+        "loaded_backends": [name for name in _HEAVY_BACKENDS if name in sys.modules]
+    }), flush=True)
+
+
+def benchmark_startup(model_types=None, repeats=3):
+    """
+    Measure cold-start cost per model_type in fresh interpreters
+    
+    Each run launches this script with --startup-probe in an empty temp
+    directory. A backend loaded outside _EXPECTED_BACKENDS (e.g. TensorFlow
+    in an sklearn job) is reported as a regression.
+    
+    Args:
+        model_types: Model types to probe (defaults to all)
+        repeats: Runs per model type; medians are reported
+        
+    Returns:
+        dict: model_type -> timings, loaded backends and regression flag
+    """
+    import tempfile
+    
+    model_types = model_types or list(_EXPECTED_BACKENDS)
+    results = {}
+    
+    for model_type in model_types:
+        runs = []
+        for _ in range(repeats):
+            with tempfile.TemporaryDirectory() as work_dir:
+                launched_at = time.time()
+                proc = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--startup-probe", model_type, "--probe-launched-at", repr(launched_at)],
+                    cwd=work_dir, capture_output=True, text=True
+                )
+                wall_seconds = time.time() - launched_at
+                
+            lines = [line for line in proc.stdout.splitlines() if line.startswith(_STARTUP_PROBE_MARKER)]
+            if proc.returncode != 0 or not lines:
+                runs.append({"success": False, "error": proc.stderr.strip().splitlines()[-1:] or "no probe output"})
+                continue
+                
+            run = json.loads(lines[-1][len(_STARTUP_PROBE_MARKER):])
+            run["wall_seconds"] = wall_seconds
+            runs.append(run)
+            
+        ok_runs = [run for run in runs if run.get("success")]
+        if not ok_runs:
+            results[model_type] = {"success": False, "runs": runs}
+            continue
+            
+        loaded = sorted(set().union(*(run["loaded_backends"] for run in ok_runs)))
+        unexpected = sorted(set(loaded) - _EXPECTED_BACKENDS.get(model_type, set()))
+        results[model_type] = {
+            "success": True,
+            "wall_seconds": float(np.median([run["wall_seconds"] for run in ok_runs])),
+            "interpreter_and_module_seconds": float(np.median([run["interpreter_and_module_seconds"] for run in ok_runs])),
+            "first_job_seconds": float(np.median([run["first_job_seconds"] for run in ok_runs])),
+            "loaded_backends": loaded,
+            "unexpected_backends": unexpected,
+            "regression": bool(unexpected)
+        }
+        logger.info(f"🚦 {model_type:<12} wall={results[model_type]['wall_seconds']:.2f}s "
+                    f"module={results[model_type]['interpreter_and_module_seconds']:.2f}s backends={loaded}")
+        
+    return results
+
+
+def _one_hot(y, num_classes):
+    """One-hot encode integer labels (same output as keras to_categorical)"""
+    return np.eye(num_classes, dtype=np.float32)[np.asarray(y, dtype=int).ravel()]
+
+
+def _limit_framework_threads(num_threads):
+    """
+    Pin BLAS/OpenMP, PyTorch and TensorFlow thread pools to num_threads
+    
+    Must run in a fresh worker process before any framework work starts,
+    otherwise the inter-op settings can no longer be changed. Frameworks
+    that are not imported yet get the limit when they are first loaded.
+    """
+    global _THREAD_LIMIT
+    _THREAD_LIMIT = num_threads
+    
+    for var in ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS"]:
+        os.environ[var] = str(num_threads)
+        
+    for package, configure in _IMPORT_HOOKS.items():
+        if package in sys.modules and package not in _HOOKED_PACKAGES:
+            _HOOKED_PACKAGES.add(package)
+            configure(sys.modules[package])
+
+
+@contextlib.contextmanager
+def _torch_thread_limit(num_threads):
+    """
+    Cap PyTorch intra-op threads for a block in the current process
+    
+    Unlike _limit_framework_threads, the previous thread count is restored
+    on exit and the BLAS/OpenMP environment is left untouched.
+    """
+    previous = torch.get_num_threads()
+    torch.set_num_threads(num_threads)
+    try:
+        yield
+    finally:
+        torch.set_num_threads(previous)
+
+
+def _atomic_write_json(path, data):
+    """Write JSON to a temp file and rename it into place"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _save_pickle(state, path):
+    """Checkpoint save function for numpy-based (Keras) state"""
+    import pickle
+    with open(path, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _load_pickle(path):
+    """Checkpoint load function for numpy-based (Keras) state"""
+    import pickle
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _save_torch(state, path):
+    """Checkpoint save function for PyTorch state"""
+    torch.save(state, path)
+
+
+def _load_torch(path):
+    """Checkpoint load function for PyTorch state"""
+    return torch.load(path, map_location="cpu", weights_only=False)
+
+
+def _current_rss_mb():
+    """Resident memory of this process in MB (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class PreprocessingPipeline:
+    """
+    Fitted preprocessing applied between raw feature rows and the model
+    
+    Holds the StandardScaler statistics, the model input shape (for LSTM
+    reshapes) and the tabular column order. It is stored as an uncompressed
+    .npz, which loads in well under a millisecond, needs neither sklearn
+    nor pickle, and keeps inference independent of the training data.
+    """
+    
+    def __init__(self, mean=None, scale=None, input_shape=None, feature_columns=None, target_column=None):
+        """
+        Args:
+            mean: Per-feature mean, or None to skip normalization
+            scale: Per-feature standard deviation
+            input_shape: Model input shape without the batch dimension
+            feature_columns: Tabular feature columns in training order
+            target_column: Tabular target column
+        """
+        self.mean = None if mean is None else np.asarray(mean, dtype=np.float32)
+        self.scale = None if scale is None else np.asarray(scale, dtype=np.float32)
+        self.input_shape = tuple(int(dim) for dim in input_shape) if input_shape is not None else None
+        self.feature_columns = list(feature_columns) if feature_columns is not None else None
+        self.target_column = target_column
+        
+    def transform(self, x):
+        """
+        Normalize flat feature rows and reshape them to the model input shape
+        
+        Args:
+            x: Array of shape (rows, features) or already in the input shape
+            
+        Returns:
+            np.ndarray: float32 model input
+        """
+        x = np.asarray(x, dtype=np.float32).reshape(len(x), -1)
+        if self.mean is not None:
+            x = (x - self.mean) / self.scale
+        if self.input_shape:
+            x = x.reshape(len(x), *self.input_shape)
+        return np.ascontiguousarray(x)
+        
+    def save(self, path):
+        """Write the pipeline to an .npz file and return its path"""
+        meta = {
+            "input_shape": list(self.input_shape) if self.input_shape else None,
+            "feature_columns": self.feature_columns,
+            "target_column": self.target_column
+        }
+        arrays = {"meta": np.array(json.dumps(meta))}
+        if self.mean is not None:
+            arrays["mean"] = self.mean
+            arrays["scale"] = self.scale
+        np.savez(path, **arrays)
+        return path
+        
+    @classmethod
+    def load(cls, path):
+        """Read a pipeline written by save"""
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            return cls(
+                mean=data["mean"] if "mean" in data else None,
+                scale=data["scale"] if "scale" in data else None,
+                input_shape=meta.get("input_shape"),
+                feature_columns=meta.get("feature_columns"),
+                target_column=meta.get("target_column")
+            )
+
+
+class SyntheticDataGenerator:
+    """
+    Chunked, seeded generator of learnable synthetic datasets
+    
+    Ground-truth parameters are drawn once from the seed; chunk i is drawn
+    from its own generator seeded with (seed, i), so any chunk can be
+    regenerated independently and the dataset never has to fit in memory.
+    The same seed, chunk_size and shape always produce the same rows.
+    
+    Targets by problem type:
+        regression: linear signal plus a sine term and Gaussian noise
+        binary: sign of a noisy linear score
+        multi-class: argmax of noisy linear class scores
+    """
+    
+    def __init__(self, num_features, problem_type="classification", num_classes=2, seed=42,
+                 noise=0.1, one_hot=False):
+        """
+        Draw the ground-truth parameters
+        
+        Args:
+            num_features: Features per row
+            problem_type: "regression" or "classification"
+            num_classes: Number of classes for classification
+            seed: Seed for parameters and rows
+            noise: Noise scale added to the target signal
+            one_hot: Return one-hot targets for multi-class problems
+        """
+        self.num_features = num_features
+        self.problem_type = problem_type
+        self.num_classes = num_classes
+        self.seed = seed
+        self.noise = noise
+        self.one_hot = one_hot
+        
+        rng = np.random.default_rng(seed)
+        if problem_type == "regression" or num_classes == 2:
+            self.weights = (rng.standard_normal(num_features) / np.sqrt(num_features)).astype(np.float32)
+        else:
+            self.weights = (rng.standard_normal((num_features, num_classes)) / np.sqrt(num_features)).astype(np.float32)
+            
+    def target_shape(self, num_rows):
+        """Shape of the targets for num_rows rows"""
+        if self.problem_type == "regression":
+            return (num_rows, 1)
+        if self.num_classes > 2 and self.one_hot:
+            return (num_rows, self.num_classes)
+        return (num_rows,)
+        
+    def target_dtype(self):
+        if self.problem_type == "regression" or (self.num_classes > 2 and self.one_hot):
+            return np.float32
+        return np.int64
+        
+    def chunk(self, index, num_rows):
+        """
+        Generate one chunk
+        
+        Args:
+            index: Chunk index, seeds the chunk's generator
+            num_rows: Rows in the chunk
+            
+        Returns:
+            tuple: (x, y) for the chunk
+        """
+        rng = np.random.default_rng([self.seed, index])
+        x = rng.standard_normal((num_rows, self.num_features), dtype=np.float32)
+        scores = x @ self.weights
+        
+        if self.problem_type == "regression":
+            y = scores + 0.5 * np.sin(x[:, 0]) + rng.standard_normal(num_rows, dtype=np.float32) * self.noise
+            return x, y.reshape(-1, 1)
+            
+        if self.num_classes == 2:
+            y = (scores + rng.standard_normal(num_rows, dtype=np.float32) * self.noise > 0).astype(np.int64)
+            return x, y
+            
+        scores += rng.standard_normal(scores.shape, dtype=np.float32) * self.noise
+        y = np.argmax(scores, axis=1)
+        if self.one_hot:
+            y = _one_hot(y, self.num_classes).astype(np.float32)
+        return x, y
+        
+    def iter_batches(self, num_samples, chunk_size=100000):
+        """Yield (x, y) chunks covering num_samples rows"""
+        for index, start in enumerate(range(0, num_samples, chunk_size)):
+            yield self.chunk(index, min(chunk_size, num_samples - start))
+            
+    def generate(self, num_samples, chunk_size=100000):
+        """Generate the whole dataset in memory, filled chunk by chunk"""
+        x = np.empty((num_samples, self.num_features), dtype=np.float32)
+        y = np.empty(self.target_shape(num_samples), dtype=self.target_dtype())
+        start = 0
+        for x_chunk, y_chunk in self.iter_batches(num_samples, chunk_size):
+            x[start:start + len(x_chunk)] = x_chunk
+            y[start:start + len(y_chunk)] = y_chunk
+            start += len(x_chunk)
+        return x, y
+        
+    def write_memmap(self, cache_root, num_samples, chunk_size=100000, overwrite=False):
+        """
+        Write the dataset to memory-mapped .npy files, reusing a complete copy
+        
+        Args:
+            cache_root: Directory holding one subdirectory per dataset
+            num_samples: Number of rows
+            chunk_size: Rows generated and written at a time
+            overwrite: Regenerate even if a complete copy exists
+            
+        Returns:
+            tuple: (x, y) opened read-only with mmap_mode="r"
+        """
+        spec = {
+            "num_samples": num_samples,
+            "num_features": self.num_features,
+            "problem_type": self.problem_type,
+            "num_classes": self.num_classes,
+            "seed": self.seed,
+            "noise": self.noise,
+            "one_hot": self.one_hot,
+            "chunk_size": chunk_size
+        }
+        digest = hashlib.sha256(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        directory = os.path.join(cache_root, digest)
+        x_path = os.path.join(directory, "x.npy")
+        y_path = os.path.join(directory, "y.npy")
+        done_path = os.path.join(directory, "complete.json")
+        
+        if os.path.exists(done_path) and not overwrite:
+            logger.info(f"♻️ Reusing synthetic dataset: {directory}")
+        else:
+            os.makedirs(directory, exist_ok=True)
+            if os.path.exists(done_path):
+                os.remove(done_path)
+            x = np.lib.format.open_memmap(x_path, mode="w+", dtype=np.float32, shape=(num_samples, self.num_features))
+            y = np.lib.format.open_memmap(y_path, mode="w+", dtype=self.target_dtype(), shape=self.target_shape(num_samples))
+            start = 0
+            for x_chunk, y_chunk in self.iter_batches(num_samples, chunk_size):
+                x[start:start + len(x_chunk)] = x_chunk
+                y[start:start + len(y_chunk)] = y_chunk
+                start += len(x_chunk)
+            x.flush()
+            y.flush()
+            del x, y
+            # Written last, so an interrupted run is regenerated next time
+            _atomic_write_json(done_path, spec)
+            logger.info(f"💾 Synthetic dataset written to {directory}")
+            
+        return np.load(x_path, mmap_mode="r"), np.load(y_path, mmap_mode="r")
+
+
+class PhaseTimer:
+    """
+    Accumulates wall-clock time per training phase
+    
+    A disabled timer turns every call into a no-op, so the training loops
+    can be instrumented unconditionally.
+    """
+    
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.totals = {}
+        self.calls = {}
+        self.started = {}
+        
+    def add(self, name, seconds):
+        """Record one timed call of a phase"""
+        if self.enabled:
+            self.totals[name] = self.totals.get(name, 0.0) + seconds
+            self.calls[name] = self.calls.get(name, 0) + 1
+            
+    def start(self, name):
+        if self.enabled:
+            self.started[name] = time.perf_counter()
+            
+    def stop(self, name):
+        if self.enabled and name in self.started:
+            self.add(name, time.perf_counter() - self.started.pop(name))
+            
+    @contextlib.contextmanager
+    def _timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+            
+    def phase(self, name):
+        """Context manager timing the enclosed block as one call of a phase"""
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._timed(name)
+        
+    def summary(self):
+        """
+        Phase table sorted by total time
+        
+        Returns:
+            list: One dict per phase with calls, total_s, mean_ms and share
+        """
+        grand_total = sum(self.totals.values()) or 1.0
+        return [
+            {
+                "phase": name,
+                "calls": self.calls[name],
+                "total_s": round(total, 4),
+                "mean_ms": round(total / self.calls[name] * 1000.0, 3),
+                "share": round(total / grand_total, 4)
+            }
+            for name, total in sorted(self.totals.items(), key=lambda item: item[1], reverse=True)
+        ]
+        
+    def log_table(self, model_name):
+        """Log the phase table"""
+        logger.info(f"🔬 Phase profile for {model_name}:")
+        logger.info(f"{'phase':<12} {'calls':>8} {'total s':>10} {'mean ms':>10} {'share':>7}")
+        for row in self.summary():
+            logger.info(f"{row['phase']:<12} {row['calls']:>8} {row['total_s']:>10.3f} "
+                        f"{row['mean_ms']:>10.3f} {row['share']:>7.1%}")
+
+
+class MetricsSink:
+    """
+    Append-only JSON-lines sink for training metrics
+    
+    Every record is written and flushed as training runs, so long jobs can
+    be followed with `tail -f` and a crashed run keeps everything logged up
+    to the crash. Each line carries the record kind ("step" or "epoch"),
+    a run id, a timestamp and the current process RSS.
+    """
+    
+    def __init__(self, path, model_name):
+        """
+        Open the sink for appending
+        
+        Args:
+            path: JSON-lines file to append to
+            model_name: Name stored with every record
+        """
+        self.path = path
+        self.model_name = model_name
+        self.run_id = datetime.now().strftime('%Y%m%d-%H%M%S')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = open(path, 'a', buffering=1)
+        
+    def write(self, kind, **values):
+        """Append one record"""
+        record = {
+            "kind": kind,
+            "model_name": self.model_name,
+            "run_id": self.run_id,
+            "time": time.time(),
+            "rss_mb": round(_current_rss_mb(), 1)
+        }
+        record.update(values)
+        self.file.write(json.dumps(record) + "\n")
+        
+    def close(self):
+        """Close the underlying file"""
+        if not self.file.closed:
+            self.file.close()
+            
+    @staticmethod
+    def read(path):
+        """Yield the records of a sink file, skipping a truncated last line"""
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+
+class AsyncCheckpointWriter:
+    """
+    Writes checkpoints on a background thread
+    
+    The training loop hands over an in-memory snapshot and continues; the
+    writer thread saves it to "<path>.tmp" and atomically renames it into
+    place, so a crash never leaves a half-written checkpoint. Rolling
+    checkpoints are pruned to the newest keep_last files.
+    """
+    
+    def __init__(self, save_fn, keep_last=3, retained=None):
+        """
+        Start the writer thread
+        
+        Args:
+            save_fn: Callable(state, path) that serializes a snapshot
+            keep_last: Number of rolling checkpoints to keep on disk
+            retained: Rolling checkpoints already on disk, oldest first
+        """
+        self.save_fn = save_fn
+        self.keep_last = keep_last
+        self.retained = list(retained or [])
+        self.error = None
+        # A small bound applies backpressure if writes fall far behind
+        self.queue = queue.Queue(maxsize=2)
+        self.thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self.thread.start()
+        
+    def submit(self, state, path, rolling=False, on_written=None):
+        """
+        Queue a snapshot for writing
+        
+        Args:
+            state: Snapshot that is no longer mutated by the training loop
+            path: Final checkpoint path
+            rolling: Subject the file to keep_last retention
+            on_written: Optional callable(path) run after the rename
+        """
+        self._raise_if_failed()
+        self.queue.put((state, path, rolling, on_written))
+        
+    def _run(self):
+        """Writer thread main loop"""
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                state, path, rolling, on_written = item
+                tmp_path = f"{path}.tmp"
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                self.save_fn(state, tmp_path)
+                os.replace(tmp_path, path)
+                
+                if rolling:
+                    if path not in self.retained:
+                        self.retained.append(path)
+                    while len(self.retained) > self.keep_last:
+                        stale = self.retained.pop(0)
+                        if os.path.exists(stale):
+                            os.remove(stale)
+                            
+                if on_written:
+                    on_written(path)
+            except Exception as e:
+                logger.error(f"❌ Checkpoint write failed: {e}")
+                self.error = e
+            finally:
+                self.queue.task_done()
+                
+    def _raise_if_failed(self):
+        if self.error is not None:
+            raise RuntimeError(f"Checkpoint writer failed: {self.error}") from self.error
+            
+    def flush(self):
+        """Block until every queued checkpoint is on disk"""
+        self.queue.join()
+        self._raise_if_failed()
+        
+    def close(self):
+        """Flush pending checkpoints and stop the writer thread"""
+        self.queue.put(None)
+        self.thread.join()
+        self._raise_if_failed()
+
+
+def _iter_input_batches(input_path, batch_size, feature_columns=None, target_column=None):
+    """
+    Yield float32 feature batches from an .npy, .csv or .jsonl file
+    
+    .npy files are memory-mapped; CSV and JSON lines are read with pandas
+    in chunks. Tabular inputs use feature_columns, or every column except
+    target_column.
+    """
+    file_ext = os.path.splitext(input_path)[1].lower()
+    
+    if file_ext == ".npy":
+        data = np.load(input_path, mmap_mode="r")
+        for start in range(0, len(data), batch_size):
+            yield np.asarray(data[start:start + batch_size], dtype=np.float32)
+        return
+        
+    import pandas as pd
+    if file_ext == ".csv":
+        chunks = pd.read_csv(input_path, chunksize=batch_size)
+    elif file_ext in [".jsonl", ".ndjson"]:
+        chunks = pd.read_json(input_path, lines=True, chunksize=batch_size)
+    else:
+        raise ValueError(f"Unsupported input file format: {file_ext}")
+        
+    for chunk in chunks:
+        columns = feature_columns or [col for col in chunk.columns if col != target_column]
+        yield chunk[columns].to_numpy(dtype=np.float32)
+
+
+class PredictionWriter:
+    """
+    Incremental predictions writer for .csv and .npy outputs
+    
+    CSV rows are appended as batches arrive. The row count of an .npy file
+    is not known up front, so batches are streamed to a raw side file and
+    copied into the final .npy (with its header) on close.
+    """
+    
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.format = os.path.splitext(output_path)[1].lower()
+        if self.format not in [".csv", ".npy"]:
+            raise ValueError(f"Unsupported output file format: {self.format}")
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        
+        self.rows = 0
+        self.row_shape = None
+        self.dtype = None
+        self.file = open(f"{output_path}.part" if self.format == ".npy" else output_path, 'wb' if self.format == ".npy" else 'w')
+        
+    def write(self, predictions):
+        """Append a batch of predictions"""
+        predictions = np.asarray(predictions)
+        if self.row_shape is None:
+            self.row_shape = predictions.shape[1:]
+            self.dtype = predictions.dtype
+            if self.format == ".csv":
+                width = int(np.prod(self.row_shape)) if self.row_shape else 1
+                header = ["prediction"] if width == 1 else [f"prediction_{i}" for i in range(width)]
+                self.file.write(",".join(header) + "\n")
+                
+        if self.format == ".csv":
+            np.savetxt(self.file, predictions.reshape(len(predictions), -1), delimiter=",", fmt="%.8g")
+        else:
+            self.file.write(np.ascontiguousarray(predictions, dtype=self.dtype).tobytes())
+        self.rows += len(predictions)
+        
+    def close(self):
+        """Finish the output file"""
+        if self.file.closed:
+            return
+        self.file.close()
+        if self.format != ".npy":
+            return
+            
+        part_path = f"{self.output_path}.part"
+        shape = (self.rows,) + tuple(self.row_shape or ())
+        output = np.lib.format.open_memmap(self.output_path, mode="w+", dtype=self.dtype or np.float32, shape=shape)
+        if self.rows:
+            source = np.memmap(part_path, mode="r", dtype=self.dtype, shape=shape)
+            step = 1 << 20
+            for start in range(0, self.rows, step):
+                output[start:start + step] = source[start:start + step]
+            del source
+        output.flush()
+        del output
+        os.remove(part_path)
+
+
+_PREDICT_WORKER = {}
+
+
+def _init_predict_worker(model_path, preprocessing):
+    """Process pool initializer: load the scikit-learn model once per worker"""
+    import joblib
+    _limit_framework_threads(1)
+    _PREDICT_WORKER["model"] = joblib.load(model_path)
+    _PREDICT_WORKER["preprocessing"] = preprocessing
+
+
+def _predict_worker_ready(_):
+    return "model" in _PREDICT_WORKER
+
+
+def _predict_worker_batch(x):
+    """Process pool entry point: score one batch with the worker's model"""
+    x = _PREDICT_WORKER["preprocessing"].transform(x)
+    return _PREDICT_WORKER["model"].predict(x)
+
+
+def _run_training_job(config_path, num_threads):
+    """Process pool entry point: train one config with pinned thread pools"""
+    _limit_framework_threads(num_threads)
+    return ModelTrainingService().train_model(config_path)
+
+
+def _seed_everything(seed):
+    """Seed numpy and torch so every DDP rank prepares identical data"""
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+def _pytorch_ddp_worker(local_rank, config, dist_config, node_rank, world_size, result_path):
+    """torch.multiprocessing.spawn entry point for one DDP rank"""
+    nproc_per_node = dist_config.get("nproc_per_node", 2)
+    rank = node_rank * nproc_per_node + local_rank
+    
+    threads = dist_config.get("threads_per_process", max(1, (os.cpu_count() or 1) // nproc_per_node))
+    torch.set_num_threads(threads)
+    _seed_everything(dist_config.get("seed", 42))
+    
+    dist.init_process_group(
+        backend=dist_config.get("backend", "gloo"),
+        init_method=f"tcp://{dist_config.get('master_addr', '127.0.0.1')}:{dist_config.get('master_port', 29500)}",
+        rank=rank,
+        world_size=world_size
+    )
+    try:
+        result = ModelTrainingService()._pytorch_training_loop(config, rank, world_size)
+        dist.barrier()
+    finally:
+        dist.destroy_process_group()
+        
+    if rank == 0:
+        with open(result_path, 'w') as f:
+            json.dump(result, f)
+
+
+def _machine_resources():
+    """
+    CPUs and memory available to this process
+    
+    Honours CPU affinity and a cgroup v2 memory limit, so the numbers are
+    right inside containers as well.
+    
+    Returns:
+        dict: cpus, total_memory_mb and available_memory_mb
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+        
+    total_mb = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    available_mb = total_mb
+    try:
+        with open("/proc/meminfo", 'r') as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    available_mb = int(line.split()[1]) / 1024
+                    break
+    except OSError:
+        pass
+        
+    try:
+        with open("/sys/fs/cgroup/memory.max", 'r') as f:
+            limit = f.read().strip()
+        if limit != "max":
+            limit_mb = int(limit) / (1024 * 1024)
+            total_mb = min(total_mb, limit_mb)
+            available_mb = min(available_mb, limit_mb)
+    except (OSError, ValueError):
+        pass
+        
+    return {
+        "cpus": cpus,
+        "total_memory_mb": round(total_mb, 1),
+        "available_memory_mb": round(available_mb, 1)
+    }
+
+
+# Resident memory of a worker after importing its framework, measured on
+# CPU-only builds; the data and parameter estimates are added on top
+_FRAMEWORK_BASE_MB = {
+    "tensorflow": 800,
+    "pytorch": 500,
+    "transformers": 1500,
+    "sklearn": 200
+}
+
+# Parameter counts of common pretrained checkpoints, by name fragment
+_PRETRAINED_PARAMS = [
+    ("distil", 66e6),
+    ("tiny", 15e6),
+    ("small", 30e6),
+    ("large", 340e6),
+    ("base", 110e6)
+]
+
+
+def _normalized_model_type(model_type):
+    """Map the model_type aliases accepted by train_model to one name"""
+    model_type = (model_type or "").lower()
+    if model_type in ["tensorflow", "keras", "tf"]:
+        return "tensorflow"
+    if model_type in ["pytorch", "torch", "pt"]:
+        return "pytorch"
+    if model_type in ["transformers", "huggingface", "hf"]:
+        return "transformers"
+    return "sklearn"
+
+
+def estimate_job_resources(config, default_threads=1):
+    """
+    Estimate peak memory and threads of a training config without running it
+    
+    Memory is the framework baseline plus the data and model estimates:
+    - data: rows x features as float32, times 4 for the splits, the
+      scaled copies and framework tensors (file inputs use the file size);
+    - parameters: counted from the layer sizes in model_config, times 4 for
+      weights, gradients and the two Adam moments;
+    - tree ensembles: about 1 KB per tree per 100 training rows.
+    A "resources" section ({"memory_mb", "threads"}) in the config
+    overrides the estimate.
+    
+    Args:
+        config: Training configuration dictionary
+        default_threads: Threads used when the config does not ask for any
+        
+    Returns:
+        dict: memory_mb, threads and the parts of the estimate
+    """
+    model_type = _normalized_model_type(config.get("model_type"))
+    model_config = config.get("model_config", {})
+    data_config = config.get("data_config", {})
+    resources = config.get("resources", {})
+    
+    # Data footprint
+    if data_config.get("generate_data", False):
+        num_rows = data_config.get("num_samples", 1000)
+        num_features = data_config.get("num_features", 10)
+        data_mb = num_rows * num_features * 4 / (1024 * 1024)
+    else:
+        data_path = data_config.get("data_path")
+        file_mb = os.path.getsize(data_path) / (1024 * 1024) if data_path and os.path.exists(data_path) else 0.0
+        # Text formats parse into float64 arrays of roughly the same size
+        data_mb = file_mb
+        num_features = data_config.get("num_features", len(data_config.get("feature_columns") or []) or 10)
+        num_rows = int(file_mb * 1024 * 1024 / (num_features * 8)) if file_mb else 1000
+    data_mb *= 4
+    
+    # Parameter footprint
+    if model_type == "transformers":
+        name = model_config.get("pretrained_model", "bert-base-uncased").lower()
+        params = next((count for fragment, count in _PRETRAINED_PARAMS if fragment in name), 110e6)
+    elif model_type == "sklearn":
+        params = 0
+    else:
+        architecture = model_config.get("architecture", "mlp")
+        if architecture == "cnn":
+            filters = model_config.get("filters", [64, 32])
+            kernel_sizes = model_config.get("kernel_sizes", [3] * len(filters))
+            params, channels = 0, 1
+            for f, k in zip(filters, kernel_sizes):
+                params += channels * f * k + f
+                channels = f
+            params += channels * num_features
+        elif architecture == "lstm":
+            params, width = 0, num_features
+            for units in model_config.get("lstm_units", [64, 32]):
+                params += 4 * units * (width + units + 1)
+                width = units
+        else:
+            params, width = 0, num_features
+            for units in model_config.get("hidden_layers", [64, 32]):
+                params += width * units + units
+                width = units
+    params_mb = params * 4 * 4 / (1024 * 1024)
+    
+    if model_type == "sklearn" and model_config.get("algorithm", "random_forest") in ["random_forest", "gradient_boosting", "hist_gradient_boosting"]:
+        params_mb = model_config.get("n_estimators", 100) * max(num_rows, 100) / 100 / 1024
+        
+    base_mb = _FRAMEWORK_BASE_MB[model_type]
+    estimate_mb = base_mb + data_mb + params_mb
+    
+    return {
+        "memory_mb": float(resources.get("memory_mb", round(estimate_mb, 1))),
+        "threads": int(resources.get("threads", default_threads)),
+        "base_mb": base_mb,
+        "data_mb": round(data_mb, 1),
+        "params_mb": round(params_mb, 1),
+        "estimated_params": int(params)
+    }
+
+
+class TrainingJobQueue:
+    """
+    SQLite-backed queue that persists the status of training jobs
+    
+    Each row is one config file; status moves through
+    pending -> running -> completed/failed.
+    """
+    
+    def __init__(self, db_path):
+        """
+        Open (or create) the queue database
+        
+        Args:
+            db_path: Path to the SQLite database file
+        """
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                config_path TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                num_threads INTEGER,
+                memory_mb REAL,
+                submitted_at TEXT NOT NULL,
+                started_at TEXT,
+                finished_at TEXT,
+                result TEXT,
+                error TEXT
+            )
+        """)
+        # Queues created before memory estimates were recorded
+        columns = [row["name"] for row in self.conn.execute("PRAGMA table_info(jobs)")]
+        if "memory_mb" not in columns:
+            self.conn.execute("ALTER TABLE jobs ADD COLUMN memory_mb REAL")
+        self.conn.commit()
+        
+    def enqueue(self, config_paths):
+        """
+        Add config files to the queue
+        
+        Args:
+            config_paths: Iterable of configuration file paths
+            
+        Returns:
+            list: Ids of the new jobs
+        """
+        job_ids = []
+        now = datetime.now().isoformat()
+        for config_path in config_paths:
+            cursor = self.conn.execute(
+                "INSERT INTO jobs (config_path, submitted_at) VALUES (?, ?)",
+                (os.path.abspath(config_path), now)
+            )
+            job_ids.append(cursor.lastrowid)
+        self.conn.commit()
+        return job_ids
+        
+    def requeue_stale(self):
+        """Reset jobs left 'running' by a crashed runner back to 'pending'"""
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = 'pending', started_at = NULL WHERE status = 'running'"
+        )
+        self.conn.commit()
+        return cursor.rowcount
+        
+    def pending(self):
+        """Return pending jobs in submission order"""
+        return self.conn.execute(
+            "SELECT * FROM jobs WHERE status = 'pending' ORDER BY id"
+        ).fetchall()
+        
+    def mark_running(self, job_id, num_threads, memory_mb=None):
+        """Mark a job as started with the resources reserved for it"""
+        self.conn.execute(
+            "UPDATE jobs SET status = 'running', num_threads = ?, memory_mb = ?, started_at = ? WHERE id = ?",
+            (num_threads, memory_mb, datetime.now().isoformat(), job_id)
+        )
+        self.conn.commit()
+        
+    def mark_finished(self, job_id, result):
+        """Record the training result dict of a finished job"""
+        status = "completed" if result.get("success") else "failed"
+        self.conn.execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ? WHERE id = ?",
+            (status, datetime.now().isoformat(), json.dumps(result, default=str), result.get("error"), job_id)
+        )
+        self.conn.commit()
+        
+    def status(self):
+        """
+        Summarize the queue
+        
+        Returns:
+            dict: Counts per status and the list of jobs
+        """
+        rows = self.conn.execute(
+            "SELECT id, config_path, status, num_threads, memory_mb, started_at, finished_at, error FROM jobs ORDER BY id"
+        ).fetchall()
+        counts = {}
+        for row in rows:
+            counts[row["status"]] = counts.get(row["status"], 0) + 1
+        return {
+            "counts": counts,
+            "jobs": [dict(row) for row in rows]
+        }
+        
+    def close(self):
+        """Close the database connection"""
+        self.conn.close()
+
+
+class TrainingJobRunner:
+    """
+    Resource-aware scheduler for many training configs on one machine
+    
+    Every job runs in its own spawned worker with intra-op/inter-op threads
+    pinned to its thread budget. Before a job starts, its memory is
+    estimated from the config (estimate_job_resources); a job is admitted
+    only while the reserved threads fit the machine's cores and the
+    reserved memory fits memory_fraction of the memory available at
+    start-up. Later jobs that fit may start ahead of a large one (backfill);
+    a job larger than the whole budget runs alone.
+    """
+    
+    def __init__(self, queue_db=None, workers=None, threads_per_job=None, memory_fraction=0.8, status_port=None):
+        """
+        Initialize the job runner
+        
+        Args:
+            queue_db: Path of the SQLite job queue (defaults to logs/training_jobs.db)
+            workers: Maximum number of concurrent jobs
+            threads_per_job: CPU threads given to each job
+            memory_fraction: Share of available memory jobs may reserve
+            status_port: Serve GET /status as JSON on this localhost port while running
+        """
+        self.machine = _machine_resources()
+        cpu_count = self.machine["cpus"]
+        
+        if threads_per_job is None:
+            threads_per_job = max(1, cpu_count // workers) if workers else 1
+        if workers is None:
+            workers = max(1, cpu_count // threads_per_job)
+            
+        self.workers = workers
+        self.threads_per_job = threads_per_job
+        self.cpu_budget = max(cpu_count, threads_per_job)
+        self.memory_budget_mb = self.machine["available_memory_mb"] * memory_fraction
+        self.status_port = status_port
+        self.reserved = {"threads": 0, "memory_mb": 0.0, "jobs": {}}
+        # Guards self.reserved, which the status server reads
+        self.lock = threading.Lock()
+        
+        if queue_db is None:
+            logs_dir = os.path.join(os.getcwd(), "logs")
+            os.makedirs(logs_dir, exist_ok=True)
+            queue_db = os.path.join(logs_dir, "training_jobs.db")
+        self.queue = TrainingJobQueue(queue_db)
+        
+        logger.info(f"🗂️ Job runner: up to {self.workers} workers x {self.threads_per_job} threads, "
+                    f"{self.cpu_budget} cores, {self.memory_budget_mb:,.0f} MB memory budget")
+        
+    @staticmethod
+    def collect_configs(paths):
+        """
+        Expand directories into the JSON configs they contain
+        
+        Args:
+            paths: List of config files and/or directories
+            
+        Returns:
+            list: Sorted list of config file paths
+        """
+        config_paths = []
+        for path in paths:
+            if os.path.isdir(path):
+                config_paths.extend(
+                    os.path.join(path, name) for name in sorted(os.listdir(path))
+                    if name.endswith(".json")
+                )
+            else:
+                config_paths.append(path)
+        return config_paths
+        
+    def submit(self, paths):
+        """Add config files and directories to the persistent queue"""
+        config_paths = self.collect_configs(paths)
+        job_ids = self.queue.enqueue(config_paths)
+        logger.info(f"📥 Queued {len(job_ids)} training jobs")
+        return job_ids
+        
+    def _estimate(self, config_path):
+        """Resource estimate of a queued config (unreadable configs fail in the worker)"""
+        try:
+            with open(config_path, 'r') as f:
+                config = json.load(f)
+            estimate = estimate_job_resources(config, self.threads_per_job)
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Could not estimate {config_path}: {e}")
+            estimate = {"memory_mb": 0.0, "threads": self.threads_per_job}
+        estimate["threads"] = max(1, min(estimate["threads"], self.cpu_budget))
+        return estimate
+        
+    def _fits(self, estimate):
+        """Admission check against the remaining thread and memory budget"""
+        if not self.reserved["jobs"]:
+            # An oversized job still runs, alone
+            return True
+        return (self.reserved["threads"] + estimate["threads"] <= self.cpu_budget and
+                self.reserved["memory_mb"] + estimate["memory_mb"] <= self.memory_budget_mb)
+                
+    def status(self):
+        """
+        Queue status plus the machine budget and current reservations
+        
+        Returns:
+            dict: Queue counts/jobs, machine resources and reserved resources
+        """
+        queue = TrainingJobQueue(self.queue.db_path)
+        try:
+            status = queue.status()
+        finally:
+            queue.close()
+        status["machine"] = self.machine
+        status["budget"] = {
+            "threads": self.cpu_budget,
+            "memory_mb": round(self.memory_budget_mb, 1),
+            "max_workers": self.workers
+        }
+        with self.lock:
+            status["reserved"] = {
+                "threads": self.reserved["threads"],
+                "memory_mb": round(self.reserved["memory_mb"], 1),
+                "jobs": dict(self.reserved["jobs"])
+            }
+        return status
+        
+    def _start_status_server(self):
+        """Serve GET /status on localhost from a daemon thread"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        runner = self
+        
+        class StatusHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ["", "/status"]:
+                    self.send_error(404)
+                    return
+                body = json.dumps(runner.status(), default=str).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                
+            def log_message(self, format, *args):
+                pass
+                
+        server = ThreadingHTTPServer(("127.0.0.1", self.status_port), StatusHandler)
+        threading.Thread(target=server.serve_forever, name="job-status", daemon=True).start()
+        logger.info(f"🌐 Job status at http://127.0.0.1:{server.server_address[1]}/status")
+        return server
+        
+    def run(self):
+        """
+        Run every pending job in the queue
+        
+        Jobs start in submission order as long as they pass admission
+        control; at most `workers` are in flight, so the 'running' status in
+        the queue reflects what is actually executing.
+        
+        Returns:
+            dict: job id -> training result
+        """
+        stale = self.queue.requeue_stale()
+        if stale:
+            logger.info(f"♻️ Requeued {stale} jobs interrupted by a previous run")
+            
+        pending = [(job, self._estimate(job["config_path"])) for job in self.queue.pending()]
+        results = {}
+        in_flight = {}
+        server = self._start_status_server() if self.status_port is not None else None
+        
+        context = multiprocessing.get_context("spawn")
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=context, max_tasks_per_child=1) as executor:
+                while pending or in_flight:
+                    for entry in list(pending):
+                        if len(in_flight) >= self.workers:
+                            break
+                        job, estimate = entry
+                        if not self._fits(estimate):
+                            continue
+                        pending.remove(entry)
+                        if estimate["memory_mb"] > self.memory_budget_mb:
+                            logger.warning(f"⚠️ Job {job['id']} needs ~{estimate['memory_mb']:,.0f} MB, "
+                                           f"more than the {self.memory_budget_mb:,.0f} MB budget; running it alone")
+                                           
+                        with self.lock:
+                            self.reserved["threads"] += estimate["threads"]
+                            self.reserved["memory_mb"] += estimate["memory_mb"]
+                            self.reserved["jobs"][job["id"]] = {"threads": estimate["threads"], "memory_mb": estimate["memory_mb"]}
+                        self.queue.mark_running(job["id"], estimate["threads"], estimate["memory_mb"])
+                        future = executor.submit(_run_training_job, job["config_path"], estimate["threads"])
+                        in_flight[future] = (job, estimate)
+                        logger.info(f"▶️ Job {job['id']} started ({estimate['threads']} threads, "
+                                    f"~{estimate['memory_mb']:,.0f} MB): {job['config_path']}")
+                        
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        job, estimate = in_flight.pop(future)
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            result = {"success": False, "error": str(e)}
+                        with self.lock:
+                            self.reserved["threads"] -= estimate["threads"]
+                            self.reserved["memory_mb"] -= estimate["memory_mb"]
+                            self.reserved["jobs"].pop(job["id"], None)
+                        self.queue.mark_finished(job["id"], result)
+                        results[job["id"]] = result
+                        status = "✅" if result.get("success") else "❌"
+                        logger.info(f"{status} Job {job['id']} finished: {job['config_path']}")
+        finally:
+            if server is not None:
+                server.shutdown()
+                
+        return results
+
+
+class HyperparameterSearch:
+    """
+    Hyperparameter search on top of ModelTrainingService
+    
+    Reads a normal training config with an extra "search_config" section:
+    
+        "search_config": {
+            "method": "hyperband",          # random | successive_halving | hyperband
+            "num_trials": 27,
+            "min_epochs": 3,                # smallest budget for tf/pytorch trials
+            "min_train_fraction": 0.1,      # smallest budget for sklearn trials
+            "reduction_factor": 3,
+            "metric": "val_loss",
+            "mode": "min",
+            "seed": 42,
+            "space": {
+                "model_config.learning_rate": {"type": "loguniform", "low": 1e-4, "high": 1e-1},
+                "training_config.batch_size": {"type": "choice", "values": [16, 32, 64]},
+                "model_config.hidden_layers": {"type": "choice", "values": [[64, 32], [128, 64]]},
+                "model_config.n_estimators": {"type": "int", "low": 50, "high": 500}
+            }
+        }
+    
+    Budgets are fractions of the full run: epochs for TensorFlow/PyTorch
+    (training_config.epochs is the maximum) and training rows for sklearn.
+    Trials run in parallel on TrainingJobRunner, and each trial keeps the
+    normal patience-based early stopping.
+    """
+    
+    def __init__(self, config_path, workers=None, threads_per_job=None):
+        """
+        Initialize the search
+        
+        Args:
+            config_path: Path to the JSON configuration with a search_config section
+            workers: Number of trials trained concurrently
+            threads_per_job: CPU threads pinned to each trial
+        """
+        with open(config_path, 'r') as f:
+            self.base_config = json.load(f)
+            
+        self.search_config = self.base_config.pop("search_config", {})
+        if not self.search_config.get("space"):
+            raise ValueError("search_config.space must define at least one hyperparameter")
+            
+        self.model_name = self.base_config.get("model_name", "model")
+        self.model_type = self.base_config.get("model_type", "").lower()
+        self.is_sklearn = self.model_type in ["sklearn", "scikit-learn"]
+        
+        self.method = self.search_config.get("method", "random")
+        self.eta = self.search_config.get("reduction_factor", 3)
+        self.metric = self.search_config.get("metric", "val_accuracy" if self.is_sklearn else "val_loss")
+        self.mode = self.search_config.get("mode", "max" if self.is_sklearn else "min")
+        self.rng = random.Random(self.search_config.get("seed", 42))
+        
+        training_config = self.base_config.get("training_config", {})
+        if self.is_sklearn:
+            self.min_fraction = self.search_config.get("min_train_fraction", 0.1)
+        else:
+            self.max_epochs = training_config.get("epochs", 100)
+            self.min_fraction = self.search_config.get("min_epochs", 3) / self.max_epochs
+            
+        timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        self.search_dir = os.path.join(os.getcwd(), "logs", f"search_{self.model_name}_{timestamp}")
+        os.makedirs(self.search_dir, exist_ok=True)
+        
+        # Each search keeps its own queue so it never picks up unrelated jobs
+        self.runner = TrainingJobRunner(
+            queue_db=os.path.join(self.search_dir, "trials.db"),
+            workers=workers,
+            threads_per_job=threads_per_job
+        )
+        self.trials = []
+        
+        logger.info(f"🔎 Hyperparameter search ({self.method}) for {self.model_name}")
+        logger.info(f"📂 Search directory: {self.search_dir}")
+        
+    def _sample_value(self, spec):
+        """Draw one value from a search space entry"""
+        kind = spec.get("type", "choice")
+        
+        if kind == "choice":
+            return self.rng.choice(spec["values"])
+        elif kind == "uniform":
+            return self.rng.uniform(spec["low"], spec["high"])
+        elif kind == "loguniform":
+            return math.exp(self.rng.uniform(math.log(spec["low"]), math.log(spec["high"])))
+        elif kind == "int":
+            return self.rng.randint(spec["low"], spec["high"])
+        else:
+            raise ValueError(f"Unsupported search space type: {kind}")
+            
+    def _sample_params(self):
+        """Sample one hyperparameter assignment from the search space"""
+        return {key: self._sample_value(spec) for key, spec in self.search_config["space"].items()}
+        
+    def _trial_config(self, params, fraction):
+        """
+        Build the training config of one trial
+        
+        Args:
+            params: Dotted-key hyperparameter assignment
+            fraction: Share of the full budget given to this trial
+            
+        Returns:
+            dict: Complete training configuration
+        """
+        config = copy.deepcopy(self.base_config)
+        
+        for dotted_key, value in params.items():
+            section = config
+            *parents, leaf = dotted_key.split(".")
+            for parent in parents:
+                section = section.setdefault(parent, {})
+            section[leaf] = value
+            
+        training_config = config.setdefault("training_config", {})
+        if self.is_sklearn:
+            training_config["train_fraction"] = fraction
+        else:
+            training_config["epochs"] = max(1, int(round(self.max_epochs * fraction)))
+            
+        config["model_name"] = f"{self.model_name}_trial{len(self.trials):04d}"
+        return config
+        
+    def _trial_score(self, result):
+        """Extract the search metric from a training result, or None if it failed"""
+        if not result.get("success"):
+            return None
+            
+        metrics = result.get("metrics", {})
+        if self.metric in metrics:
+            return float(metrics[self.metric])
+            
+        history_path = result.get("history_path")
+        if history_path and os.path.exists(history_path):
+            with open(history_path, 'r') as f:
+                values = json.load(f).get(self.metric)
+            if values:
+                return float(min(values) if self.mode == "min" else max(values))
+                
+        return None
+        
+    def _run_rung(self, candidates, fraction, bracket, rung):
+        """
+        Train every candidate with the same budget, in parallel
+        
+        Returns:
+            list: Trial records ranked best first (failed trials last)
+        """
+        config_paths = []
+        records = []
+        for params in candidates:
+            config = self._trial_config(params, fraction)
+            config_path = os.path.join(self.search_dir, f"{config['model_name']}.json")
+            with open(config_path, 'w') as f:
+                json.dump(config, f, indent=2)
+            config_paths.append(config_path)
+            record = {
+                "trial": config["model_name"],
+                "params": params,
+                "budget_fraction": fraction,
+                "bracket": bracket,
+                "rung": rung
+            }
+            records.append(record)
+            self.trials.append(record)
+            
+        logger.info(f"🪜 Bracket {bracket} rung {rung}: {len(candidates)} trials at {fraction:.0%} budget")
+        
+        job_ids = self.runner.submit(config_paths)
+        results = self.runner.run()
+        
+        for record, job_id in zip(records, job_ids):
+            result = results.get(job_id, {"success": False, "error": "trial did not run"})
+            record["score"] = self._trial_score(result)
+            record["model_path"] = result.get("model_path")
+            record["error"] = result.get("error")
+            
+        def sort_key(record):
+            if record["score"] is None:
+                return float('inf')
+            return record["score"] if self.mode == "min" else -record["score"]
+            
+        return sorted(records, key=sort_key)
+        
+    def _successive_halving(self, candidates, fraction, bracket=0):
+        """
+        Keep the best 1/reduction_factor of the trials at each rung and give
+        the survivors reduction_factor times more budget, up to the full run
+        """
+        rung = 0
+        while True:
+            ranked = self._run_rung(candidates, fraction, bracket, rung)
+            survivors = [record for record in ranked if record["score"] is not None]
+            if fraction >= 1.0 or len(survivors) <= 1:
+                return ranked
+                
+            keep = max(1, len(survivors) // self.eta)
+            candidates = [record["params"] for record in survivors[:keep]]
+            fraction = min(1.0, fraction * self.eta)
+            rung += 1
+            
+    def run(self):
+        """
+        Run the search
+        
+        Returns:
+            dict: Best trial, best config path and all trial records
+        """
+        num_trials = self.search_config.get("num_trials", 20)
+        
+        if self.method == "random":
+            self._run_rung([self._sample_params() for _ in range(num_trials)], 1.0, 0, 0)
+        elif self.method == "successive_halving":
+            self._successive_halving([self._sample_params() for _ in range(num_trials)], self.min_fraction)
+        elif self.method == "hyperband":
+            s_max = int(math.floor(math.log(1.0 / self.min_fraction, self.eta) + 1e-9))
+            for s in range(s_max, -1, -1):
+                n = int(math.ceil((s_max + 1) / (s + 1) * self.eta ** s))
+                self._successive_halving(
+                    [self._sample_params() for _ in range(n)],
+                    float(self.eta ** -s),
+                    bracket=s_max - s
+                )
+        else:
+            raise ValueError(f"Unsupported search method: {self.method}")
+            
+        # Only trials trained on the full budget are eligible as the final answer
+        finished = [t for t in self.trials if t["score"] is not None and t["budget_fraction"] >= 1.0]
+        if not finished:
+            finished = [t for t in self.trials if t["score"] is not None]
+        best = None
+        if finished:
+            pick = min if self.mode == "min" else max
+            best = pick(finished, key=lambda t: t["score"])
+            
+        best_config_path = None
+        if best:
+            best_config_path = os.path.join(self.search_dir, "best_config.json")
+            best_config = self._trial_config(best["params"], 1.0)
+            best_config["model_name"] = self.model_name
+            with open(best_config_path, 'w') as f:
+                json.dump(best_config, f, indent=2)
+            logger.info(f"🏆 Best trial {best['trial']}: {self.metric}={best['score']:.4f}")
+            
+        summary = {
+            "success": best is not None,
+            "method": self.method,
+            "metric": self.metric,
+            "mode": self.mode,
+            "best_trial": best,
+            "best_config_path": best_config_path,
+            "num_trials": len(self.trials),
+            "trials": self.trials
+        }
+        
+        with open(os.path.join(self.search_dir, "search_results.json"), 'w') as f:
+            json.dump(summary, f, indent=2, default=str)
+            
+        return summary
+
+
+class CrossValidation:
+    """
+    Parallel k-fold cross-validation on top of ModelTrainingService
+    
+    Reads a normal training config with an optional "cv_config" section:
+    
+        "cv_config": {
+            "folds": 5,
+            "stratified": true,     # default: true for integer targets
+            "seed": 42,
+            "confidence": 0.95
+        }
+    
+    The dataset is loaded (or generated) once, shuffled and written to .npy
+    files together with a per-row fold assignment. Every fold is an
+    ordinary training job on TrainingJobRunner, so folds train in parallel
+    processes with pinned thread pools and read the shared arrays through
+    memory mapping instead of receiving pickled copies. Test metrics are
+    taken on the held-out fold and aggregated with a Student-t confidence
+    interval.
+    """
+    
+    def __init__(self, config_path, folds=None, workers=None, threads_per_job=None):
+        """
+        Initialize the cross-validation run
+        
+        Args:
+            config_path: Path to the JSON training configuration
+            folds: Number of folds (overrides cv_config.folds)
+            workers: Number of folds trained concurrently
+            threads_per_job: CPU threads pinned to each fold
+        """
+        with open(config_path, 'r') as f:
+            self.base_config = json.load(f)
+            
+        self.cv_config = self.base_config.pop("cv_config", {})
+        self.folds = folds or self.cv_config.get("folds", 5)
+        if self.folds < 2:
+            raise ValueError("Cross-validation needs at least 2 folds")
+            
+        self.model_name = self.base_config.get("model_name", "model")
+        self.seed = self.cv_config.get("seed", 42)
+        
+        timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        self.cv_dir = os.path.join(os.getcwd(), "logs", f"cv_{self.model_name}_{timestamp}")
+        self.data_dir = os.path.join(self.cv_dir, "data")
+        os.makedirs(self.data_dir, exist_ok=True)
+        
+        # Each run keeps its own queue so it never picks up unrelated jobs
+        self.runner = TrainingJobRunner(
+            queue_db=os.path.join(self.cv_dir, "folds.db"),
+            workers=workers,
+            threads_per_job=threads_per_job
+        )
+        
+        logger.info(f"🔁 {self.folds}-fold cross-validation for {self.model_name}")
+        logger.info(f"📂 CV directory: {self.cv_dir}")
+        
+    def _write_shared_data(self):
+        """
+        Load the dataset once and write x, y and the fold assignment
+        
+        Returns:
+            list or None: Feature columns of tabular data
+        """
+        from sklearn.model_selection import StratifiedKFold
+        
+        data_config = self.base_config.get("data_config", {})
+        feature_columns = None
+        
+        if data_config.get("generate_data", False):
+            generator = SyntheticDataGenerator(
+                num_features=data_config.get("num_features", 10),
+                problem_type=data_config.get("problem_type", "classification"),
+                num_classes=data_config.get("num_classes", 2),
+                seed=data_config.get("seed", 42),
+                noise=data_config.get("noise", 0.1)
+            )
+            x, y = generator.generate(data_config.get("num_samples", 1000))
+        else:
+            x, y, feature_columns = ModelTrainingService()._load_raw_data(data_config)
+            
+        y = np.asarray(y)
+        if y.dtype == object:
+            # String labels become class indices
+            _, y = np.unique(y, return_inverse=True)
+            
+        order = np.random.default_rng(self.seed).permutation(len(x))
+        x = np.asarray(x, dtype=np.float32)[order]
+        y = y[order]
+        
+        stratified = self.cv_config.get("stratified", np.issubdtype(y.dtype, np.integer) and y.ndim == 1)
+        folds = np.empty(len(x), dtype=np.int16)
+        if stratified:
+            splitter = StratifiedKFold(n_splits=self.folds)
+            for fold, (_, test_rows) in enumerate(splitter.split(x, y)):
+                folds[test_rows] = fold
+        else:
+            folds[:] = np.arange(len(x)) * self.folds // len(x)
+            
+        np.save(os.path.join(self.data_dir, "x.npy"), x)
+        np.save(os.path.join(self.data_dir, "y.npy"), y)
+        np.save(os.path.join(self.data_dir, "folds.npy"), folds)
+        
+        logger.info(f"💾 Shared {len(x)} rows ({'stratified' if stratified else 'contiguous'} folds) in {self.data_dir}")
+        return feature_columns
+        
+    def _fold_config(self, fold, feature_columns):
+        """Training config of one fold, reading the shared arrays"""
+        config = copy.deepcopy(self.base_config)
+        config["model_name"] = f"{self.model_name}_cv{fold}"
+        config.pop("export_config", None)
+        
+        data_config = config.setdefault("data_config", {})
+        for key in ["generate_data", "data_path", "num_samples", "num_features", "problem_type", "seed", "noise", "memmap"]:
+            data_config.pop(key, None)
+        data_config["cv_data"] = {
+            "dir": self.data_dir,
+            "fold": fold,
+            "feature_columns": feature_columns
+        }
+        return config
+        
+    def _confidence_interval(self, values):
+        """Mean, sample standard deviation and t-based confidence interval"""
+        values = np.asarray(values, dtype=np.float64)
+        mean = float(values.mean())
+        if len(values) < 2:
+            return {"mean": mean, "std": 0.0, "ci_low": mean, "ci_high": mean, "values": values.tolist()}
+            
+        std = float(values.std(ddof=1))
+        confidence = self.cv_config.get("confidence", 0.95)
+        try:
+            from scipy import stats
+            critical = float(stats.t.ppf(0.5 + confidence / 2, len(values) - 1))
+        except ImportError:
+            critical = 1.96
+        margin = critical * std / math.sqrt(len(values))
+        return {
+            "mean": mean,
+            "std": std,
+            "ci_low": mean - margin,
+            "ci_high": mean + margin,
+            "values": values.tolist()
+        }
+        
+    def run(self):
+        """
+        Train all folds in parallel and aggregate their test metrics
+        
+        Returns:
+            dict: Per-fold results and per-metric mean, std and confidence interval
+        """
+        start = time.perf_counter()
+        feature_columns = self._write_shared_data()
+        
+        config_paths = []
+        for fold in range(self.folds):
+            config = self._fold_config(fold, feature_columns)
+            config_path = os.path.join(self.cv_dir, f"{config['model_name']}.json")
+            with open(config_path, 'w') as f:
+                json.dump(config, f, indent=2)
+            config_paths.append(config_path)
+            
+        job_ids = self.runner.submit(config_paths)
+        results = self.runner.run()
+        
+        fold_results = []
+        for fold, job_id in enumerate(job_ids):
+            result = results.get(job_id, {"success": False, "error": "fold did not run"})
+            fold_results.append({
+                "fold": fold,
+                "success": bool(result.get("success")),
+                "metrics": result.get("metrics", {}),
+                "model_path": result.get("model_path"),
+                "error": result.get("error")
+            })
+            
+        succeeded = [record for record in fold_results if record["success"]]
+        metric_names = set.intersection(*[set(record["metrics"]) for record in succeeded]) if succeeded else set()
+        aggregate = {
+            name: self._confidence_interval([record["metrics"][name] for record in succeeded])
+            for name in sorted(metric_names)
+            if all(isinstance(record["metrics"][name], (int, float)) for record in succeeded)
+        }
+        
+        for name, stats in aggregate.items():
+            logger.info(f"📊 {name}: {stats['mean']:.4f} ± {stats['std']:.4f} "
+                        f"(CI {stats['ci_low']:.4f} – {stats['ci_high']:.4f})")
+            
+        summary = {
+            "success": len(succeeded) == self.folds,
+            "model_name": self.model_name,
+            "folds": self.folds,
+            "confidence": self.cv_config.get("confidence", 0.95),
+            "metrics": aggregate,
+            "fold_results": fold_results,
+            "wall_time_seconds": round(time.perf_counter() - start, 3)
+        }
+        
+        with open(os.path.join(self.cv_dir, "cv_results.json"), 'w') as f:
+            json.dump(summary, f, indent=2, default=str)
+            
+        return summary
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="3RBAI Model Training Service")
+    parser.add_argument("--config", help="Path to a JSON training configuration")
+    parser.add_argument("--jobs", nargs="+", help="Config files or directories to train on the job runner")
+    parser.add_argument("--workers", type=int, help="Number of concurrent training jobs")
+    parser.add_argument("--threads-per-job", type=int, help="CPU threads pinned to each job")
+    parser.add_argument("--queue-db", help="SQLite job queue path (default: logs/training_jobs.db)")
+    parser.add_argument("--queue-status", action="store_true", help="Print the job queue status and exit")
+    parser.add_argument("--status-port", type=int, help="Serve the job queue status as JSON on this localhost port while --jobs runs")
+    parser.add_argument("--memory-fraction", type=float, default=0.8, help="Share of available memory that --jobs may reserve")
+    parser.add_argument("--search", help="Run a hyperparameter search for a config with a search_config section")
+    parser.add_argument("--cv", help="Run parallel k-fold cross-validation for a config")
+    parser.add_argument("--folds", type=int, help="Number of folds for --cv (default: cv_config.folds or 5)")
+    parser.add_argument("--benchmark", choices=["sklearn", "inference", "startup", "synthetic"], help="Run a built-in benchmark and exit")
+    parser.add_argument("--benchmark-samples", type=int, default=50000, help="Synthetic rows used by --benchmark")
+    parser.add_argument("--export", action="store_true", help="Export the model trained with --config for optimized inference")
+    parser.add_argument("--quantize", action="store_true", help="Apply dynamic int8 quantization when exporting")
+    parser.add_argument("--plot-metrics", help="Plot a *_metrics.jsonl file written during training and exit")
+    parser.add_argument("--predict", help="Score an .npy/.csv/.jsonl file with the model trained with --config")
+    parser.add_argument("--output", help="Predictions file for --predict (.csv or .npy)")
+    parser.add_argument("--batch-size", type=int, default=1024, help="Rows per inference batch for --predict")
+    parser.add_argument("--startup-probe", help=argparse.SUPPRESS)
+    parser.add_argument("--probe-launched-at", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.queue_status:
+        runner = TrainingJobRunner(queue_db=args.queue_db, workers=1, threads_per_job=1)
+        status = runner.status()
+        status["estimates"] = {
+            job["id"]: runner._estimate(job["config_path"])
+            for job in status["jobs"] if job["status"] == "pending"
+        }
+        print(json.dumps(status, indent=2))
+        return
+        
+    if args.startup_probe:
+        _startup_probe(args.startup_probe, args.probe_launched_at or time.time())
+        return
+        
+    if args.plot_metrics:
+        print(ModelTrainingService().plot_metrics(args.plot_metrics))
+        return
+        
+    if args.benchmark == "startup":
+        results = benchmark_startup()
+        print(json.dumps(results, indent=2))
+        if any(result.get("regression") or not result.get("success") for result in results.values()):
+            sys.exit(1)
+        return
+        
+    if args.benchmark == "synthetic":
+        result = ModelTrainingService().benchmark_synthetic(num_samples=args.benchmark_samples)
+        print(json.dumps(result, indent=2))
+        return
+        
+    if args.benchmark == "sklearn":
+        results = ModelTrainingService().benchmark_sklearn(num_samples=args.benchmark_samples)
+        print(json.dumps(results, indent=2))
+        return
+        
+    if args.predict:
+        if not args.config:
+            parser.error("--predict requires --config")
+        result = ModelTrainingService().predict(
+            args.config, args.predict, output_path=args.output,
+            batch_size=args.batch_size, workers=args.workers
+        )
+        print(json.dumps(result, indent=2))
+        return
+        
+    if args.benchmark == "inference" or args.export:
+        if not args.config:
+            parser.error("--export and --benchmark inference require --config")
+        service = ModelTrainingService()
+        if args.export:
+            result = service.export_model(args.config, quantize=args.quantize)
+        else:
+            result = service.benchmark_inference(args.config, quantize=args.quantize)
+        print(json.dumps(result, indent=2, default=str))
+        return
+        
+    if args.search:
+        search = HyperparameterSearch(args.search, workers=args.workers, threads_per_job=args.threads_per_job)
+        print(json.dumps(search.run(), indent=2, default=str))
+        return
+        
+    if args.cv:
+        cross_validation = CrossValidation(
+            args.cv, folds=args.folds, workers=args.workers, threads_per_job=args.threads_per_job
+        )
+        print(json.dumps(cross_validation.run(), indent=2, default=str))
+        return
+        
+    if args.jobs:
+        runner = TrainingJobRunner(
+            queue_db=args.queue_db,
+            workers=args.workers,
+            threads_per_job=args.threads_per_job,
+            memory_fraction=args.memory_fraction,
+            status_port=args.status_port
+        )
+        runner.submit(args.jobs)
+        results = runner.run()
+        print(json.dumps(results, indent=2, default=str))
+        return
+        
+    if not args.config:
+        parser.error("one of --config, --jobs, --search, --cv or --benchmark is required")
+        
+    service = ModelTrainingService()
+    result = service.train_model(args.config)
+    print(json.dumps(result, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import os
 import tensorflow as tf
 import numpy as np
 import matplotlib.pyplot as plt
@@ -125,6 +126,51 @@ class ThreeRBNeuralNetwork:
         
         return predictions
     
+    def save_model(self, directory):
+        """
+        حفظ النموذج مع حالة التطبيع
+        
+        يُحفظ النموذج بصيغة .h5 وإحصاءات StandardScaler في ملف .npz صغير
+        بجانبه، حتى لا يحتاج التنبؤ لاحقاً إلى بيانات التدريب.
+        
+        Args:
+            directory: مجلد الحفظ
+        """
+        if self.model is None:
+            raise ValueError("يجب بناء النموذج أولاً")
+        
+        os.makedirs(directory, exist_ok=True)
+        self.model.save(os.path.join(directory, "model.h5"))
+        np.savez(
+            os.path.join(directory, "preprocessing.npz"),
+            mean=self.scaler.mean_,
+            scale=self.scaler.scale_,
+            var=self.scaler.var_,
+            n_samples_seen=np.asarray(self.scaler.n_samples_seen_)
+        )
+        
+        print(f"💾 تم حفظ النموذج وحالة التطبيع في: {directory}")
+    
+    def load_model(self, directory):
+        """
+        تحميل نموذج محفوظ مع حالة التطبيع
+        
+        Args:
+            directory: المجلد الذي استُخدم في save_model
+        """
+        self.model = tf.keras.models.load_model(os.path.join(directory, "model.h5"))
+        
+        with np.load(os.path.join(directory, "preprocessing.npz")) as state:
+            self.scaler = StandardScaler()
+            self.scaler.mean_ = state["mean"]
+            self.scaler.scale_ = state["scale"]
+            self.scaler.var_ = state["var"]
+            self.scaler.n_samples_seen_ = state["n_samples_seen"]
+            self.scaler.n_features_in_ = len(state["mean"])
+        
+        print(f"📂 تم تحميل النموذج وحالة التطبيع من: {directory}")
+        return self.model
+    
     def visualize_architecture(self):
         """عرض هيكل الشبكة العصبية"""
         